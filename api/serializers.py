@@ -213,6 +213,7 @@ class NoticeSerializer(serializers.ModelSerializer):
     room_id = serializers.PrimaryKeyRelatedField(queryset = Room.objects.none(),write_only=True, source='room')
     author = serializers.SerializerMethodField()
     is_posted_today = serializers.ReadOnlyField()
+    is_read = serializers.SerializerMethodField()
     
 
     def __init__(self, *args, **kwargs):
@@ -226,7 +227,14 @@ class NoticeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notice
         fields = '__all__'
-        read_only_fields = ['created_on', 'is_html']
+        read_only_fields = ['created_on', 'is_html', 'event', 'payload']
+
+    def to_representation(self, instance):
+        repr = super().to_representation(instance)
+        if instance.event:
+            repr['title'] = instance.rendered_title
+            repr['content'] = instance.rendered_content
+        return repr
 
     def get_room(self, obj):
 
@@ -239,6 +247,10 @@ class NoticeSerializer(serializers.ModelSerializer):
     
     def get_author(self, obj):
         return getattr(obj.author, 'username', None)
+
+    def get_is_read(self, obj):
+        # annotated by Notice.objects.with_read_state()
+        return getattr(obj, 'user_has_read', None)
     
     def validate(self, attrs):
         request = self.context.get('request')
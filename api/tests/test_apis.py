@@ -5,6 +5,8 @@ from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from authapp.models import Profile, CustomUser
 from django.utils import timezone
+from stats.models import Notice
+from stats.read_state import mark_all_read
 
 class UserAPITest(APITestCase):
     @classmethod
@@ -352,6 +354,103 @@ class RoomAPITest(APITestCase):
 
         self.assertNotIn(self.user1, self.room.members.all())
 
+    def test_remove_users(self):
+        self.room.members.add(self.user1, self.user2)
+
+        url = reverse_lazy('room-remove-user', kwargs = {'pk': self.room.id})
+        data = {
+            'user_ids' : [self.user1.id, self.user2.id]
+        }
+        notices = Notice.objects.filter(room=self.room).count()
+        response = self.client.post(url, data=data, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertNotIn(self.user1, self.room.members.all())
+        self.assertNotIn(self.user2, self.room.members.all())
+        # one summary notice for the whole removal
+        self.assertEqual(Notice.objects.filter(room=self.room).count(), notices + 1)
+        notice = Notice.objects.filter(room=self.room).latest('created_on')
+        self.assertEqual(notice.event, 'members_updated')
+        self.assertEqual(notice.payload['removed'], sorted([self.user1.username, self.user2.username]))
+
+    def test_bulk_members(self):
+        self.room.members.add(self.user1)
+        url = reverse_lazy('room-bulk-members', kwargs = {'pk': self.room.id})
+        data = {
+            'add': [self.user2.username, self.user3.username, self.user1.username, 'nobody'],
+            'remove': [self.user1.username, self.user.username],
+        }
+        notices = Notice.objects.filter(room=self.room).count()
+        response = self.client.post(url, data=data, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        outcomes = {(result['username'], result['action']): result['status'] for result in response.data['results']}
+        self.assertEqual(outcomes[(self.user2.username, 'add')], 'added')
+        self.assertEqual(outcomes[('nobody', 'add')], 'not_found')
+        self.assertEqual(outcomes[(self.user1.username, 'add')], 'conflict')
+        self.assertEqual(outcomes[(self.user.username, 'remove')], 'is_admin')
+        self.assertEqual(response.data['added'], 2)
+
+        self.assertIn(self.user2, self.room.members.all())
+        self.assertIn(self.user3, self.room.members.all())
+        self.assertIn(self.user1, self.room.members.all())
+        # one summary notice for the whole batch
+        self.assertEqual(Notice.objects.filter(room=self.room).count(), notices + 1)
+
+        response = self.client.post(url, data={'remove': [self.user2.username]}, format='json')
+        self.assertEqual(response.data['removed'], 1)
+        self.assertNotIn(self.user2, self.room.members.all())
+
+    def test_bulk_members_non_admin(self):
+        self.room.members.add(self.user1)
+        self.authenticate(self.user1)
+        url = reverse_lazy('room-bulk-members', kwargs = {'pk': self.room.id})
+        response = self.client.post(url, data={'add': [self.user2.username]}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn(self.user2, self.room.members.all())
+
+    def test_unread_notice_counts(self):
+        other_room = Room.objects.create(name='otherroom', admin=self.user1)
+        other_room.members.add(self.user)
+        self.room.members.add(self.user1)
+        Notice.objects.create(room=self.room, title='one', content='one', author=self.user1)
+        seen = Notice.objects.create(room=self.room, title='two', content='two')
+        Notice.objects.create(room=self.room, title='mine', content='mine', author=self.user)
+        Notice.objects.create(room=other_room, title='three', content='three')
+        seen.mark_as_read(self.user)
+
+        url = reverse_lazy('notice-unread')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            'total': 2,
+            'rooms': {str(self.room.id): 1, str(other_room.id): 1},
+        })
+
+        mark_all_read(other_room, self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.data['rooms'][str(other_room.id)], 0)
+
+        self.authenticate(self.user2)
+        response = self.client.get(url)
+        self.assertEqual(response.data, {'total': 0, 'rooms': {}})
+
+    def test_search_notices(self):
+        other_room = Room.objects.create(name='otherroom', admin=self.user2)
+        match = Notice.objects.create(room=self.room, title='Physics exam', content='room 4')
+        Notice.objects.create(room=self.room, title='Lunch', content='pizza')
+        Notice.objects.create(room=other_room, title='Physics exam', content='not a member here')
+
+        url = reverse_lazy('notice-search')
+        response = self.client.get(url, {'q': 'physics'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([notice['id'] for notice in response.data], [str(match.id)])
+
+        response = self.client.get(url, {'q': 'physics', 'room': other_room.id})
+        self.assertEqual(response.data, [])
+        self.assertEqual(self.client.get(url, {'q': 'physics', 'room': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': ' !'}).status_code, 400)
+
     def test_remove_admin(self):
         self.assertEqual(self.user, self.room.admin)
     
@@ -584,6 +683,25 @@ class SessionAPITest(APITestCase):
         res = self.send_request('get', url)
         self.assertEqual(len(res.data), 1)
 
+    def test_user_rankings(self):
+        for rank in (1, 2, 5, 12):
+            room = Room.objects.create(name=f'room {rank}', admin=self.user1)
+            session = Session.objects.create(name=f'session {rank}', room=room)
+            RoomRanking.objects.create(room=room, user=self.user, rank=rank, total_hours=rank)
+            SessionRanking.objects.create(session=session, user=self.user, rank=rank + 1)
+
+        url = reverse_lazy('user-rankings-api')
+        self.send_request('get', url)
+        # the session check and the user, then one aggregate and one top performances query per ranking table
+        with self.assertNumQueries(6):
+            res = self.send_request('get', url)
+        rooms, sessions = res.data['rooms'], res.data['sessions']
+        self.assertEqual((rooms['average'], rooms['total']), (5, 4))
+        self.assertEqual(rooms['distribution'], {'rank_1': 1, 'rank_2_3': 1, 'rank_4_10': 1, 'rank_10_plus': 1})
+        self.assertEqual([(top['name'], top['rank']) for top in rooms['top']], [('room 1', 1), ('room 2', 2)])
+        self.assertEqual(sessions['distribution'], {'rank_1': 0, 'rank_2_3': 2, 'rank_4_10': 1, 'rank_10_plus': 1})
+        self.assertEqual([top['name'] for top in sessions['top']], ['session 1', 'session 2'])
+
     def test_todos_endpoint(self):
         Todo.objects.create(session=self.session, user=self.user, task='Test Todo')
         url = reverse_lazy('session-get-todos', kwargs={'pk': self.session.id})
@@ -597,6 +715,13 @@ class SessionAPITest(APITestCase):
         res = self.send_request('get', url)
         self.assertEqual(len(res.data), 1)
 
+    def test_search_my_todos(self):
+        mine = Todo.objects.create(session=self.session, user=self.user, task='Revise the integrals')
+        Todo.objects.create(session=self.session, user=self.user1, task='Revise the integrals too')
+        url = reverse_lazy('todo-search')
+        res = self.send_request('get', url, data={'q': 'integral', 'session': self.session.id})
+        self.assertEqual([todo['id'] for todo in res.data], [str(mine.id)])
+
     def test_start_session(self):
         url = reverse_lazy('session-start-session', kwargs={'pk': self.session.id})
         self.send_request('post', url, status_code=200)
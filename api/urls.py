@@ -1,6 +1,6 @@
 from django.urls import path
 from .views import UserAPI, ProfileAPI, RoomAPI, SessionAPI, TodoAPI, TrackTodoAPI
-from .views import NoticeAPI
+from .views import NoticeAPI, TimeLogImportAPI, UserRankingsAPI
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
@@ -14,7 +14,9 @@ router.register(r'notice', NoticeAPI)
 
 urlpatterns = [
     path('user/', UserAPI.as_view(), name='user-api'),
+    path('user/rankings/', UserRankingsAPI.as_view(), name='user-rankings-api'),
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('timelogs/import/', TimeLogImportAPI.as_view(), name='timelogs-import'),
     # path('profile/', ProfileAPI.as_view(), name='profile-api'),
 ] + router.urls
\ No newline at end of file
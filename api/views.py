@@ -4,6 +4,10 @@ from .serializers import (
     NoticeSerializer
     )
 from pages.models import Session, Room, Todo, RoomRanking, SessionRanking, TrackTodo
+from stats.models import Notice
+from stats.read_state import unread_counts
+from stats.analytics import ranking_analytics
+from stats import search
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.views import APIView
@@ -15,7 +19,28 @@ from rest_framework.renderers import JSONRenderer
 from .permissions import IsAdmin, ActiveSession
 from rest_framework.permissions import IsAuthenticated
 from pages.logics import *
+from pages.bulk_import import import_time_logs, read_rows
+from pages.register_signals import members_updated
+from pages.join_guard import verify_join, JoinThrottled
 from django.contrib.auth import logout, login, authenticate
+from django.conf import settings
+from django.core.exceptions import ValidationError
+import csv
+
+
+def search_response(view, queryset, scope):
+    """ranked full-text matches of ?q= among `queryset`, narrowed to the ?<scope>= id when given"""
+    query = view.request.query_params.get('q', '')
+    if not search.terms(query):
+        return Response({'error': 'pass a search query as q'}, status=status.HTTP_400_BAD_REQUEST)
+    scope_id = view.request.query_params.get(scope)
+    try:
+        if scope_id:
+            queryset = queryset.filter(**{f'{scope}_id': scope_id})
+        results = list(search.search(queryset, query)[:settings.SEARCH_RESULTS_LIMIT])
+    except ValidationError:
+        return Response({'error': f'invalid {scope} id'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(view.get_serializer(results, many=True).data)
 
 
 class UserAPI(APIView):
@@ -34,6 +59,15 @@ class UserAPI(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response({'message': 'Error while creating object'}, status=status.HTTP_400_BAD_REQUEST)
     
+class UserRankingsAPI(APIView):
+    renderer_classes = [JSONRenderer]
+    permission_classes = [IsAuthenticated]
+    http_method_names = ['get']
+
+    def get(self, request):
+        # rank averages, distributions and top performances of the user in rooms and sessions
+        return Response(ranking_analytics(request.user))
+
 # if used session instead of jwt
 class LogoutAPI(APIView):
     renderer_classes = [JSONRenderer]
@@ -99,7 +133,7 @@ class RoomAPI(ModelViewSet):
 
     def get_permissions(self):
         permissions = super().get_permissions()
-        if self.action in ['destroy', 'partial_update', 'update', 'remove_user', 'transfer_admin']:
+        if self.action in ['destroy', 'partial_update', 'update', 'remove_user', 'transfer_admin', 'bulk_members']:
             permissions.append(IsAdmin())
         return permissions
 
@@ -116,22 +150,52 @@ class RoomAPI(ModelViewSet):
 
     @action(detail=True, methods=['post'], url_path='remove', url_name='remove-user')
     def remove_user(self, request, *args, **kwargs):
-        user_id = request.data.get("user_id")
+        # either one user_id or a list of user_ids removed together
+        user_ids = request.data.get("user_ids") or [request.data.get("user_id")]
         room = self.get_object()
-        if not user_id:
+        if not isinstance(user_ids, list) or not all(user_ids):
             return Response({'error': 'user_id is not passed'}, status=status.HTTP_400_BAD_REQUEST)
+        user_ids = {str(user_id) for user_id in user_ids}
         
-        user_exists = room.members.filter(id=user_id).exists()
-        if not user_exists:
+        members = {str(user_id): username for user_id, username in room.members.filter(id__in=user_ids).values_list('id', 'username')}
+        if set(members) != user_ids:
             return Response({'error': 'user_id is not a member'}, status=status.HTTP_400_BAD_REQUEST)
-        if user_id == str(room.admin.id):
+        if str(room.admin_id) in user_ids:
             return Response({'error': 'admin cannot be removed. Transfer the ownership to remove the user'}, status=status.HTTP_400_BAD_REQUEST)
 
-        room.remove_member(user_id)
-        notice_kick_from_room_logic(request,room, user_id)
+        room.remove_members(user_ids)
+        if len(user_ids) == 1:
+            notice_kick_from_room_logic(request, room, user_ids.pop())
+        else:
+            # one summary notice, like the bulk members endpoint
+            members_updated.send_robust(sender=Room, room=room, admin=request.user, added=[], removed=sorted(members.values()))
         return Response({'success': 'user is removed from the room'})
     
 
+    @action(detail=True, methods=['post'], url_path='members', url_name='bulk-members')
+    def bulk_members(self, request, *args, **kwargs):
+        # {"add": [usernames], "remove": [usernames]}, "invite" is an alias of "add"
+        room = self.get_object()
+        add = request.data.get('add', [])
+        invite = request.data.get('invite', [])
+        remove = request.data.get('remove', [])
+        if not all(isinstance(usernames, list) for usernames in (add, invite, remove)):
+            return Response({'error': 'add, invite and remove should be lists of usernames'}, status=status.HTTP_400_BAD_REQUEST)
+
+        add = add + invite
+        if not add and not remove:
+            return Response({'error': 'no usernames passed'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(add) + len(remove) > MAX_BULK_MEMBERS:
+            return Response({'error': f'at most {MAX_BULK_MEMBERS} users can be updated at once'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = bulk_members_logic(request, room, add=add, remove=remove)
+        return Response({
+            'added': sum(result['status'] == 'added' for result in results),
+            'removed': sum(result['status'] == 'removed' for result in results),
+            'results': results,
+        })
+
+
     @action(detail=True, methods=['post'], url_name='leave', url_path='leave')
     def remove_me(self, request, *args, **kwargs):
         user = request.user
@@ -169,9 +233,13 @@ class RoomAPI(ModelViewSet):
         name = request.data.get('name')
         password = request.data.get('password')
         room = get_object_or_404(Room, name=name)
-        if room.check_pass(password):
+        try:
+            valid = verify_join(request, room, password)
+        except JoinThrottled as error:
+            return Response({'Error': str(error)}, status=status.HTTP_429_TOO_MANY_REQUESTS,
+                            headers={'Retry-After': str(error.retry_after)})
+        if valid:
             room.members.add(request.user)
-            room.save()
             return Response({'success': 'you have joined the room'}, status=status.HTTP_200_OK) 
         
         return Response({'Error': 'Credentials wrong. Please check again.'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -285,6 +353,11 @@ class TodoAPI(ModelViewSet):
         if self.action in ['toggle_task', 'update', 'partial_update', 'destroy', 'create']:
             permissions.append(ActiveSession())
         return permissions
+
+    @action(detail=False, methods=['get'], url_path='search', url_name='search')
+    def search_tasks(self, request, *args, **kwargs):
+        # own tasks only, get_queryset filters on the user
+        return search_response(self, self.get_queryset().select_related('session', 'user'), 'session')
     
     @action(detail=True, methods=['get'], url_name='get-tracking', url_path='trackings')
     def get_tracking(self, request, *args, **kwargs):
@@ -317,10 +390,34 @@ class TrackTodoAPI(ModelViewSet):
 
 
     def get_queryset(self):
-        queryset = TrackTodo.objects.filter(todo__user= self.request.user).order_by('-day')
+        queryset = TrackTodo.objects.filter(user= self.request.user).order_by('-day')
         return queryset
 
 
+class TimeLogImportAPI(APIView):
+    renderer_classes = [JSONRenderer]
+    permission_classes = [IsAuthenticated]
+    http_method_names = ['post']
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload:
+            # parsed up front, a bad file is refused before any chunk is imported
+            try:
+                rows = list(read_rows(upload.read(), upload.name))
+            except (UnicodeDecodeError, csv.Error) as error:
+                return Response({'error': f'could not read the file: {error}'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            rows = request.data if isinstance(request.data, list) else request.data.get('rows')
+            if not isinstance(rows, list):
+                return Response({'error': 'upload a file or pass a list of rows'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # only the rooms administered by the user can be imported into
+        room_ids = Room.objects.filter(admin=request.user).values_list('id', flat=True)
+        report = import_time_logs(rows, allowed_room_ids=list(room_ids))
+        return Response(report)
+
+
 class NoticeAPI(ModelViewSet):
     serializer_class = NoticeSerializer
     queryset = Notice.objects.none()
@@ -336,7 +433,8 @@ class NoticeAPI(ModelViewSet):
         return permissions
 
     def get_queryset(self):
-        qs = Notice.objects.filter(room__members = self.request.user)
+        qs = Notice.objects.filter(room__members = self.request.user) \
+            .select_related('room__admin', 'author').with_read_state(self.request.user)
         return qs
     
     def destroy(self, request, *args, **kwargs):
@@ -346,6 +444,19 @@ class NoticeAPI(ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
+    @action(detail=False, methods=['get'], url_path='search', url_name='search')
+    def search_notices(self, request, *args, **kwargs):
+        # notices of the rooms of the user only, get_queryset filters on the membership
+        return search_response(self, self.get_queryset(), 'room')
+
+    @action(detail=False, methods=['get'], url_path='unread', url_name='unread')
+    def unread(self, request, *args, **kwargs):
+        rooms = unread_counts(request.user)
+        return Response({
+            'total': sum(rooms.values()),
+            'rooms': {str(room_id): count for room_id, count in rooms.items()},
+        })
+
     @action(detail=True, methods=['post'], url_path='toggle-pin', url_name='toggle-name')
     def toggle_pin(self, request, *args, **kwargs):
         notice = self.get_object()
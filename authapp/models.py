@@ -11,11 +11,10 @@ class CustomUser(AbstractUser):
     
     @property
     def total_hours(self):
-        tasks = self.todos.all()
-        hour = 0
-        for task in tasks:
-            hour += task.total_hours
-        return hour
+        # the tracking of archived sessions is gone, their hours are kept per room in archive_totals
+        tracked = self.tracks.aggregate(total=models.Sum('hours'))['total'] or 0
+        archived = self.archive_totals.aggregate(total=models.Sum('total_hours'))['total'] or 0
+        return tracked + archived
 
 
 
@@ -132,7 +132,7 @@ class DownloadUserData(LRM, View):
         
         if grouped_by != 'task':
             print('Not Grouped by task')
-            records = TrackTodo.objects.filter(todo__user=request.user).select_related('todo')
+            records = TrackTodo.objects.filter(user=request.user).select_related('todo')
             data = [
                 {
                     'task': obj.todo.task,
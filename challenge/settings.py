@@ -71,6 +71,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'stats.context_processors.unread_notices',
             ],
         },
     },
@@ -145,6 +146,52 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 
+# Monthly partitions of the tracking table, see `python manage.py tracking_partitions`
+TRACKTODO_PARTITIONS_AHEAD = config('TRACKTODO_PARTITIONS_AHEAD', default=3, cast=int)
+TRACKTODO_RETENTION_MONTHS = config('TRACKTODO_RETENTION_MONTHS', default=0, cast=int)
+
+# Sessions finished and system notices created before this many days are archived,
+# see `python manage.py archive_old_data`
+ARCHIVE_HORIZON_DAYS = config('ARCHIVE_HORIZON_DAYS', default=365, cast=int)
+
+# Cache, in memory per process by default. Deployments with several worker processes
+# should point it at a shared backend (redis, memcached, database), the recent
+# notices buffer of stats/recent.py is only used with one
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# Dashboard and room history, see pages/queries.py
+DASHBOARD_CACHE_TIMEOUT = config('DASHBOARD_CACHE_TIMEOUT', default=300, cast=int)
+DASHBOARD_PAST_SESSIONS_PER_PAGE = config('DASHBOARD_PAST_SESSIONS_PER_PAGE', default=10, cast=int)
+ROOM_HISTORY_PER_PAGE = config('ROOM_HISTORY_PER_PAGE', default=10, cast=int)
+
+# Room join attempts, see pages/join_guard.py
+ROOM_JOIN_MAX_ATTEMPTS = config('ROOM_JOIN_MAX_ATTEMPTS', default=10, cast=int)
+ROOM_JOIN_WINDOW = config('ROOM_JOIN_WINDOW', default=300, cast=int)
+ROOM_JOIN_VERIFIED_TTL = config('ROOM_JOIN_VERIFIED_TTL', default=600, cast=int)
+ROOM_JOIN_HASH_WORKERS = config('ROOM_JOIN_HASH_WORKERS', default=2, cast=int)
+ROOM_JOIN_HASH_TIMEOUT = config('ROOM_JOIN_HASH_TIMEOUT', default=5, cast=int)
+
+# Rendered activity notices kept in memory per process, see stats/notice_render.py
+NOTICE_RENDER_CACHE_SIZE = config('NOTICE_RENDER_CACHE_SIZE', default=2048, cast=int)
+# Seconds within which frequent system notices of a room are folded into one digest, 0 turns it off
+NOTICE_COALESCE_WINDOW = config('NOTICE_COALESCE_WINDOW', default=900, cast=int)
+
+# Notice board, see stats/queries.py
+NOTICES_PER_PAGE = config('NOTICES_PER_PAGE', default=20, cast=int)
+# Newest notices of a room kept in the cache, see stats/recent.py
+RECENT_NOTICES_SIZE = config('RECENT_NOTICES_SIZE', default=50, cast=int)
+RECENT_NOTICES_TIMEOUT = config('RECENT_NOTICES_TIMEOUT', default=300, cast=int)
+
+# Full-text search, see stats/search.py
+SEARCH_CONFIG = config('SEARCH_CONFIG', default='english')
+SEARCH_RESULTS_LIMIT = config('SEARCH_RESULTS_LIMIT', default=50, cast=int)
+
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
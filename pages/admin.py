@@ -1,15 +1,17 @@
 from django.contrib import admin
 from .models import Todo, Room, Session , TrackTodo, SessionRanking, RoomRanking, RoomMembership , \
-SystemStatus
+SystemStatus, ArchivedSession, RoomArchiveTotal
+from stats.admin import FullTextSearchMixin
 
 
 # Register your models here.
-class TodoAdmin(admin.ModelAdmin):
+class TodoAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = [
         'user','session__room','session', 'task'
     ]
     list_filter = ['user']
-    search_fields = ['user__username','task', 'room__name']
+    search_fields = ['user__username', 'session__name', 'session__room__name']
+    text_search_fields = ['task']
 
 class MembershipInline(admin.TabularInline):
     model = RoomMembership
@@ -50,3 +52,10 @@ admin.site.register(RoomRanking)
 admin.site.register(RoomMembership, MembershipAdmin)
 
 admin.site.register(SystemStatus)
+
+class ArchivedSessionAdmin(admin.ModelAdmin):
+    list_display = ['name', 'room', 'finished_at', 'archived_on']
+    exclude = ['payload']
+
+admin.site.register(ArchivedSession, ArchivedSessionAdmin)
+admin.site.register(RoomArchiveTotal)
@@ -7,4 +7,6 @@ class PagesConfig(AppConfig):
 
 
     def ready(self):
-        import pages.signals 
\ No newline at end of file
+        import pages.signals
+        from django.db.models.signals import post_migrate
+        post_migrate.connect(pages.signals.backfill_tracking_after_migrate, sender=self) 
\ No newline at end of file
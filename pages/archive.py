@@ -0,0 +1,143 @@
+"""
+Archival of old data.
+
+Finished sessions older than the horizon are summarized into per user totals
+(RoomArchiveTotal, still used by the room rankings) and moved, with their todos
+and tracking rows, into one compressed ArchivedSession row each.
+Old system notices are compressed into NoticeArchive rows per room.
+"""
+import json
+import zlib
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from stats import recent
+from stats.models import Notice, NoticeArchive
+from .models import Room, Session, Todo, TrackTodo, ArchivedSession, RoomArchiveTotal
+from .queries import invalidate_dashboard
+
+
+def compress(data):
+    raw = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return zlib.compress(raw.encode('utf-8'), 9)
+
+
+def decompress(blob):
+    return json.loads(zlib.decompress(bytes(blob)).decode('utf-8'))
+
+
+def _archive_session_batch(sessions):
+    ids = [session.id for session in sessions]
+
+    members = defaultdict(list)
+    for session_id, user_id, username in Session.members.through.objects.filter(
+        session_id__in=ids
+    ).values_list('session_id', 'customuser_id', 'customuser__username'):
+        members[session_id].append({'id': user_id, 'username': username})
+
+    todos = defaultdict(list)
+    for todo in Todo.objects.filter(session_id__in=ids).values(
+        'id', 'session_id', 'user_id', 'task', 'completed', 'completed_on', 'created_on'
+    ):
+        todos[todo.pop('session_id')].append(todo)
+
+    tracks = defaultdict(list)
+    for todo_id, session_id, user_id, day, hours in TrackTodo.objects.filter(
+        session_id__in=ids
+    ).values_list('todo_id', 'session_id', 'user_id', 'day', 'hours'):
+        tracks[session_id].append([str(todo_id), user_id, day, hours])
+
+    archives = []
+    room_hours = defaultdict(float)
+    for session in sessions:
+        totals = {str(member['id']): 0 for member in members[session.id]}
+        for _, user_id, _, hours in tracks[session.id]:
+            if str(user_id) in totals:
+                totals[str(user_id)] += hours
+        for user_id, hours in totals.items():
+            room_hours[(session.room_id, int(user_id))] += hours
+
+        archives.append(ArchivedSession(
+            id=session.id,
+            room_id=session.room_id,
+            name=session.name,
+            description=session.description,
+            started_at=session.started_at,
+            finished_at=session.finished_at,
+            totals=totals,
+            payload=compress({
+                'members': members[session.id],
+                'todos': todos[session.id],
+                'tracking': tracks[session.id],
+            }),
+        ))
+
+    with transaction.atomic():
+        # locked until the batch commits, so concurrent runs add up instead of overwriting each other
+        existing = {
+            (total.room_id, total.user_id): total
+            for total in RoomArchiveTotal.objects.select_for_update().filter(
+                room_id__in={room_id for room_id, _ in room_hours}
+            )
+        }
+        new_totals = []
+        for (room_id, user_id), hours in room_hours.items():
+            if (room_id, user_id) in existing:
+                existing[(room_id, user_id)].total_hours += hours
+            else:
+                new_totals.append(RoomArchiveTotal(room_id=room_id, user_id=user_id, total_hours=hours))
+
+        ArchivedSession.objects.bulk_create(archives)
+        RoomArchiveTotal.objects.bulk_create(new_totals)
+        RoomArchiveTotal.objects.bulk_update(existing.values(), ['total_hours'])
+        # queryset delete, Session.delete would recompute the room rankings per session
+        Session.objects.filter(id__in=ids).delete()
+    invalidate_dashboard(member['id'] for session_members in members.values() for member in session_members)
+
+
+def archive_sessions(before, batch_size=100):
+    """archives the sessions finished before `before`, returns the number of archived sessions"""
+    archived = 0
+    room_ids = set()
+    while True:
+        sessions = list(Session.objects.filter(finished_at__lt=before).order_by('finished_at')[:batch_size])
+        if not sessions:
+            break
+        _archive_session_batch(sessions)
+        archived += len(sessions)
+        room_ids.update(session.room_id for session in sessions)
+
+    for room in Room.objects.filter(id__in=room_ids):
+        room.updateRoomRankings()
+    return archived
+
+
+def archive_notices(before, batch_size=1000):
+    """archives the unpinned system notices created before `before`, returns the number of archived notices"""
+    old_notices = Notice.objects.filter(created_on__lt=before, author__isnull=True, is_pinned=False)
+    archived = 0
+    # without Notice.Meta.ordering, which would make the rows distinct per notice
+    room_ids = list(old_notices.order_by().values_list('room_id', flat=True).distinct())
+    for room_id in room_ids:
+        while True:
+            notices = list(
+                old_notices.filter(room_id=room_id).order_by('created_on')
+                .values('id', 'title', 'content', 'event', 'payload', 'is_html', 'is_admin', 'created_on')[:batch_size]
+            )
+            if not notices:
+                break
+            with transaction.atomic():
+                NoticeArchive.objects.create(
+                    room_id=room_id,
+                    period_start=notices[0]['created_on'],
+                    period_end=notices[-1]['created_on'],
+                    count=len(notices),
+                    payload=compress(notices),
+                )
+                Notice.objects.filter(id__in=[notice['id'] for notice in notices]).delete()
+            archived += len(notices)
+        # queryset deletes skip Notice.delete()
+        recent.forget(room_id)
+    return archived
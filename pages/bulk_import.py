@@ -0,0 +1,215 @@
+import csv
+import io
+import json
+import time
+from datetime import date
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Room, Session, Todo, TrackTodo, CustomUser
+from .queries import invalidate_dashboard
+
+
+IMPORT_FIELDS = ('user', 'room', 'session', 'task', 'day', 'hours')
+DEFAULT_CHUNK_SIZE = 500
+
+
+def read_csv_rows(stream):
+    """yield dict rows from a csv file with a header line"""
+    if isinstance(stream, bytes):
+        stream = io.StringIO(stream.decode('utf-8-sig'))
+    for row in csv.DictReader(stream):
+        yield row
+
+
+def read_ndjson_rows(stream):
+    """yield dict rows from a newline delimited json file"""
+    if isinstance(stream, bytes):
+        stream = io.StringIO(stream.decode('utf-8'))
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # reject the row later instead of failing the whole file
+            yield {'_error': 'invalid json'}
+
+
+def read_rows(stream, filename=''):
+    if filename.endswith('.ndjson') or filename.endswith('.jsonl'):
+        return read_ndjson_rows(stream)
+    return read_csv_rows(stream)
+
+
+def _parse_row(row):
+    """returns (cleaned_row, error)"""
+    if not isinstance(row, dict):
+        return None, 'row is not an object'
+    if row.get('_error'):
+        return None, row['_error']
+
+    missing = [field for field in IMPORT_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        return None, f"missing fields: {', '.join(missing)}"
+
+    try:
+        day = date.fromisoformat(str(row['day']).strip())
+    except ValueError:
+        return None, 'day should be in YYYY-MM-DD format'
+    if day > timezone.localdate():
+        return None, 'day cannot be in the future'
+
+    try:
+        hours = round(float(row['hours']), 2)
+    except (TypeError, ValueError):
+        return None, 'hours should be a number'
+    if hours <= 0 or hours > 24:
+        return None, 'hours should be between 0 and 24'
+
+    return {
+        'user': str(row['user']).strip(),
+        'room': str(row['room']).strip(),
+        'session': str(row['session']).strip(),
+        'task': str(row['task']).strip(),
+        'day': day,
+        'hours': hours,
+    }, None
+
+
+def _chunks(rows, size):
+    chunk = []
+    for line, row in enumerate(rows, 1):
+        chunk.append((line, row))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _import_chunk(chunk, report, allowed_room_ids, affected_sessions, affected_rooms, affected_users):
+    parsed = []
+    for line, row in chunk:
+        cleaned, error = _parse_row(row)
+        if error:
+            report['rejected'].append({'row': line, 'error': error})
+        else:
+            parsed.append((line, cleaned))
+    if not parsed:
+        return
+
+    # resolve users, rooms and sessions with one query each
+    users = dict(CustomUser.objects.filter(
+        username__in={row['user'] for _, row in parsed}
+    ).values_list('username', 'id'))
+
+    rooms = Room.objects.filter(name__in={row['room'] for _, row in parsed})
+    if allowed_room_ids is not None:
+        rooms = rooms.filter(id__in=allowed_room_ids)
+    rooms = dict(rooms.values_list('name', 'id'))
+
+    sessions = {}
+    finished_on = {}
+    for session_id, room_id, name, finished_at in Session.objects.filter(
+        room_id__in=rooms.values(),
+        name__in={row['session'] for _, row in parsed}
+    ).values_list('id', 'room_id', 'name', 'finished_at'):
+        sessions[(room_id, name)] = session_id
+        if finished_at:
+            finished_on[session_id] = timezone.localtime(finished_at).date()
+
+    # membership check as one set lookup
+    memberships = set(Session.members.through.objects.filter(
+        session_id__in=sessions.values(),
+        customuser_id__in=users.values()
+    ).values_list('session_id', 'customuser_id'))
+
+    todos = {
+        (session_id, user_id, task): (todo_id, completed)
+        for todo_id, session_id, user_id, task, completed in Todo.objects.filter(
+            session_id__in=sessions.values(),
+            user_id__in=users.values(),
+            task__in={row['task'] for _, row in parsed}
+        ).values_list('id', 'session_id', 'user_id', 'task', 'completed')
+    }
+
+    new_todos = {}
+    tracks = []
+    for line, row in parsed:
+        user_id = users.get(row['user'])
+        if user_id is None:
+            report['rejected'].append({'row': line, 'error': f"unknown user {row['user']}"})
+            continue
+        room_id = rooms.get(row['room'])
+        if room_id is None:
+            report['rejected'].append({'row': line, 'error': f"unknown room {row['room']}"})
+            continue
+        session_id = sessions.get((room_id, row['session']))
+        if session_id is None:
+            report['rejected'].append({'row': line, 'error': f"unknown session {row['session']}"})
+            continue
+        if session_id in finished_on and row['day'] > finished_on[session_id]:
+            report['rejected'].append({'row': line, 'error': 'day is after the end of the session'})
+            continue
+        if (session_id, user_id) not in memberships:
+            report['rejected'].append({'row': line, 'error': 'user not in session members'})
+            continue
+
+        key = (session_id, user_id, row['task'])
+        if key in todos:
+            todo_id, completed = todos[key]
+            if completed:
+                report['rejected'].append({'row': line, 'error': 'the task is completed, hours cannot be added'})
+                continue
+        else:
+            todo = new_todos.get(key)
+            if todo is None:
+                todo = Todo(session_id=session_id, user_id=user_id, task=row['task'])
+                new_todos[key] = todo
+            todo_id = todo.id
+
+        tracks.append(TrackTodo(
+            todo_id=todo_id, day=row['day'], hours=row['hours'],
+            user_id=user_id, session_id=session_id, room_id=room_id,
+        ))
+        affected_sessions.add(session_id)
+        affected_rooms.add(room_id)
+        affected_users.add(user_id)
+
+    with transaction.atomic():
+        Todo.objects.bulk_create(new_todos.values())
+        TrackTodo.objects.bulk_create(tracks)
+
+    report['todos_created'] += len(new_todos)
+    report['imported'] += len(tracks)
+
+
+def import_time_logs(rows, chunk_size=DEFAULT_CHUNK_SIZE, allowed_room_ids=None):
+    """
+    Imports (user, room, session, task, day, hours) rows.
+    Each chunk is resolved with set based queries and inserted in its own transaction,
+    rankings are recomputed once at the end for the touched sessions and rooms.
+    """
+    started = time.monotonic()
+    report = {'imported': 0, 'todos_created': 0, 'rejected': []}
+    affected_sessions = set()
+    affected_rooms = set()
+    affected_users = set()
+
+    for chunk in _chunks(rows, chunk_size):
+        _import_chunk(chunk, report, allowed_room_ids, affected_sessions, affected_rooms, affected_users)
+
+    for session in Session.objects.filter(id__in=affected_sessions):
+        session.updateSessionRanking()
+    for room in Room.objects.filter(id__in=affected_rooms):
+        room.updateRoomRankings()
+    invalidate_dashboard(affected_users)
+
+    elapsed = time.monotonic() - started
+    report['rejected_count'] = len(report['rejected'])
+    report['elapsed'] = round(elapsed, 3)
+    report['rows_per_second'] = round(report['imported'] / elapsed, 1) if elapsed else report['imported']
+    return report
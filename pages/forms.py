@@ -1,10 +1,15 @@
 from django import forms
 from .models import Room
+from .join_guard import verify_join, JoinThrottled
 from django.contrib.auth.hashers import make_password 
 
 class RoomJoinForm(forms.Form):
     name = forms.CharField(max_length=100)
     password = forms.CharField(max_length=100, widget=forms.PasswordInput, required=False)
+
+    def __init__(self, *args, request=None, **kwargs):
+        self.request = request
+        super().__init__(*args, **kwargs)
     
     def clean(self):
         cleaned_data = super().clean()
@@ -13,7 +18,11 @@ class RoomJoinForm(forms.Form):
         if not room:
             raise forms.ValidationError(f"Room does not exist by the name {cleaned_data['name']}")
         
-        if room.check_pass(password):
+        try:
+            valid = verify_join(self.request, room, password)
+        except JoinThrottled as error:
+            raise forms.ValidationError(str(error))
+        if valid:
             cleaned_data['room'] = room
             return cleaned_data
         raise forms.ValidationError("Wrong Password. Check again")
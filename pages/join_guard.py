@@ -0,0 +1,102 @@
+"""
+Room join attempts.
+
+Password checks run the full hasher (hundreds of thousands of PBKDF2 iterations),
+so join attempts are limited per client ip and room, successful checks are
+remembered for a while per (room, user) along with the password that passed,
+and the hashing itself runs on a small thread pool with a bounded number of
+waiting checks.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+
+class JoinThrottled(Exception):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Too many join attempts. Try again in {retry_after} seconds")
+
+
+_executor = ThreadPoolExecutor(max_workers=settings.ROOM_JOIN_HASH_WORKERS, thread_name_prefix='room-join')
+# running plus queued checks, anything above is turned away instead of piling up
+_slots = threading.BoundedSemaphore(settings.ROOM_JOIN_HASH_WORKERS * 4)
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+def _attempts_key(room, ip):
+    return f"room-join:attempts:{room.id}:{ip}"
+
+
+def _verified_key(room, user_id):
+    return f"room-join:verified:{room.id}:{user_id}"
+
+
+def _proof(room, raw_password):
+    # keyed on the room hash too, so changing the room password invalidates it
+    return salted_hmac('room-join', f"{room.password}:{raw_password}").hexdigest()
+
+
+def forget_verified(room, user_ids):
+    """drops the remembered checks of users leaving or removed from the room"""
+    cache.delete_many([_verified_key(room, user_id) for user_id in user_ids])
+
+
+def _hit(room, ip):
+    key = _attempts_key(room, ip)
+    window = settings.ROOM_JOIN_WINDOW
+    if cache.add(key, 1, window):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # expired between add and incr
+        cache.set(key, 1, window)
+        return 1
+
+
+def _hashed_check(raw_password, encoded):
+    if not _slots.acquire(blocking=False):
+        raise JoinThrottled(1)
+    try:
+        future = _executor.submit(check_password, raw_password, encoded)
+    except BaseException:
+        _slots.release()
+        raise
+    # the slot is held until the hash is done, a timed out check still occupies its worker
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=settings.ROOM_JOIN_HASH_TIMEOUT)
+    except TimeoutError:
+        raise JoinThrottled(1)
+
+
+def verify_join(request, room, password):
+    """
+    returns whether the password opens the room for request.user,
+    raises JoinThrottled when the client ran out of attempts or the workers are busy
+    """
+    if not room.password:
+        return True
+
+    user = request.user
+    # only the password that was checked before skips the hasher
+    proof = _proof(room, password or '')
+    verified = cache.get(_verified_key(room, user.id)) if user.is_authenticated else None
+    if verified and constant_time_compare(verified, proof):
+        return True
+
+    if _hit(room, client_ip(request)) > settings.ROOM_JOIN_MAX_ATTEMPTS:
+        raise JoinThrottled(settings.ROOM_JOIN_WINDOW)
+
+    valid = _hashed_check(password or '', room.password)
+    if valid and user.is_authenticated:
+        cache.set(_verified_key(room, user.id), proof, settings.ROOM_JOIN_VERIFIED_TTL)
+    return valid
@@ -1,7 +1,9 @@
-from django.urls import reverse_lazy
-from stats.models import Notice, NoticeReadStatus
-from .models import Session, CustomUser
+from stats.read_state import unread_notices, mark_all_read
+from stats.notice_render import post_notice, user_ref, session_ref
+from .models import Session, Room, CustomUser
+from .queries import invalidate_dashboard
 from django.utils import timezone
+from django.db import transaction
 from django.shortcuts import get_object_or_404 , redirect, HttpResponse, render
 from .register_signals import *
 
@@ -11,17 +13,7 @@ def join_session_logic(request, session_id):
     room_members = session_obj.room.members.all()
 
     def activity_notice(session_obj):
-        profile_link = reverse_lazy('profile', kwargs={'username':request.user.username})
-        user = f"<a href={profile_link}>{request.user}</a>"
-
-        session_link = reverse_lazy('session', kwargs={'session_id': session_obj.id})
-
-        session = f"<a href={session_link}>{session_obj.name}</a>"
-
-        # actual content
-        title = f"{user} joined the session"
-        content = f"<strong>{user}</strong> has joined the session <em>{session}</em>. Welcome!"
-        Notice.objects.create(room=session_obj.room, title=title, content=content, is_html=True)
+        post_notice(session_obj.room, 'session_joined', user=user_ref(request.user), session=session_ref(session_obj))
 
     if request.user in room_members:
         session_obj.members.add(request.user)
@@ -40,117 +32,126 @@ def start_session_logic(request, session_id):
 
 
 def end_session_logic(request, session_id):
-    session = Session.objects.get(id=session_id)
+    session = Session.objects.select_related('room__admin').get(id=session_id)
     if session.started_at:
         if session.room.admin == request.user:
-            session.finished_at = timezone.now()
-            for task in session.todos.all():
-                if not task.completed:
-                    task.completed = True
-                    task.completed_date = timezone.now()
-                    task.save()
-            session.save()
-            session.room.updateRoomRankings()
+            with transaction.atomic():
+                # queryset updates, saving the session or the todos runs their clean() and ranking updates again
+                session.finished_at = timezone.now()
+                Session.objects.filter(id=session.id).update(finished_at=session.finished_at)
+                session.todos.filter(completed=False).update(completed=True, completed_on=timezone.localdate())
+
+                session.updateSessionRanking()
+                session.room.updateRoomRankings()
+            invalidate_dashboard(session.members.values_list('id', flat=True))
             # fire signal
             session_ended.send_robust(sender=Session, session_obj = session)
 
 
-def notice_kick_from_room_logic(request, room_obj, user_id):
-    profile_link = reverse_lazy('profile', kwargs={'username':request.user.username})
-    user = f"<a href={profile_link}>{request.user}</a>"
+MAX_BULK_MEMBERS = 1000
+
+
+def bulk_members_logic(request, room, add=(), remove=()):
+    """
+    Adds and removes room members by username in one go and returns the outcome per user.
+    Memberships are written with one insert and one bulk removal, and a single
+    summary notice replaces the per user room_joined notices.
+    """
+    add = list(dict.fromkeys(str(username).strip() for username in add if str(username).strip()))
+    remove = list(dict.fromkeys(str(username).strip() for username in remove if str(username).strip()))
+
+    users = dict(CustomUser.objects.filter(username__in=set(add) | set(remove)).values_list('username', 'id'))
+    members = set(room.members.filter(id__in=users.values()).values_list('id', flat=True))
+
+    results = []
+    to_add = {}
+    to_remove = {}
+    for username in add:
+        user_id = users.get(username)
+        if username in remove:
+            results.append({'username': username, 'action': 'add', 'status': 'conflict'})
+        elif user_id is None:
+            results.append({'username': username, 'action': 'add', 'status': 'not_found'})
+        elif user_id in members:
+            results.append({'username': username, 'action': 'add', 'status': 'already_member'})
+        else:
+            to_add[username] = user_id
+
+    for username in remove:
+        user_id = users.get(username)
+        if username in add:
+            results.append({'username': username, 'action': 'remove', 'status': 'conflict'})
+        elif user_id is None:
+            results.append({'username': username, 'action': 'remove', 'status': 'not_found'})
+        elif user_id == room.admin_id:
+            results.append({'username': username, 'action': 'remove', 'status': 'is_admin'})
+        elif user_id not in members:
+            results.append({'username': username, 'action': 'remove', 'status': 'not_member'})
+        else:
+            to_remove[username] = user_id
+
+    with transaction.atomic():
+        added = room.add_members(to_add.values())
+        if to_remove:
+            room.remove_members(to_remove.values())
+
+    added_usernames = []
+    for username, user_id in to_add.items():
+        # a concurrent join may have added the user in the meantime
+        status = 'added' if user_id in added else 'already_member'
+        results.append({'username': username, 'action': 'add', 'status': status})
+        if user_id in added:
+            added_usernames.append(username)
+    for username in to_remove:
+        results.append({'username': username, 'action': 'remove', 'status': 'removed'})
+
+    # fire signal
+    members_updated.send_robust(
+        sender=Room, room=room, admin=request.user, added=added_usernames, removed=list(to_remove)
+    )
+    return results
 
-    room_link = reverse_lazy('room', kwargs={'room_id': room_obj.id})
-    room = f"<a href={room_link}>{room_obj.name}</a>"
 
+def notice_kick_from_room_logic(request, room_obj, user_id):
     kicked_user = get_object_or_404(CustomUser,id=user_id)
-    # actual content
-    title = f"{kicked_user} was removed from the room"
-    content = f"<strong>{user}</strong>, the room admin, has removed <em>{kicked_user}</em> from the room."
-    Notice.objects.create(room=room_obj, title=title,content=content, is_html=True)
+    post_notice(room_obj, 'kicked_from_room', user=user_ref(request.user), other=user_ref(kicked_user))
 
 
 def notice_kick_from_session_logic(request, session_obj, user_id):
-    profile_link = reverse_lazy('profile', kwargs={'username':request.user.username})
-    user = f"<a href={profile_link}>{request.user}</a>"
-
-    session_link = reverse_lazy('session', kwargs={'session_id': session_obj.id})
-    session = f"<a href={session_link}>{session_obj.name}</a>"
-
     kicked_user = get_object_or_404(CustomUser,id=user_id)
-    # actual content
-    title = f"{kicked_user} was removed from the {session} session"
-    content = f"<strong>{user}</strong>, the room admin, has removed <em>{kicked_user}</em> from the <strong>{session}</strong> session."
-    Notice.objects.create(room=session_obj.room, title=title, content=content, is_html=True)
+    post_notice(
+        session_obj.room, 'kicked_from_session',
+        user=user_ref(request.user), other=user_ref(kicked_user), session=session_ref(session_obj)
+    )
 
 
 def notice_leave_session_logic(request, session_obj):
-    profile_link = reverse_lazy('profile', kwargs={'username':request.user.username})
-    user = f"<a href={profile_link}>{request.user}</a>"
-
-    session_link = reverse_lazy('session', kwargs={'session_id': session_obj.id})
-    session = f"<a href={session_link}>{session_obj.name}</a>"
-
-    # actual content
-    title = f"{user} has left the {session} session"
-    content = f"<strong>{user}</strong> has left the <em>{session}</em> session."
-    Notice.objects.create(room=session_obj.room, title=title, content=content, is_html=True)
+    post_notice(session_obj.room, 'left_session', user=user_ref(request.user), session=session_ref(session_obj))
 
 
 def notice_leave_room_logic(request, room_obj):
-    profile_link = reverse_lazy('profile', kwargs={'username':request.user.username})
-    user = f"<a href={profile_link}>{request.user}</a>"
-
-    # actual content
-    title = f"{user} has left the room"
-    content = f"<strong>{user}</strong> has left the room."
-    Notice.objects.create(room=room_obj, title=title, content=content, is_html=True)
+    post_notice(room_obj, 'left_room', user=user_ref(request.user))
 
 
 def notice_transfer_ownership_logic(request, room_obj, user_id):
-    profile_link = reverse_lazy('profile', kwargs={'username':request.user.username})
-    user = f"<a href={profile_link}>{request.user}</a>"
-
-    room_link = reverse_lazy('room', kwargs={'room_id': room_obj.id})
-    room = f"<a href={room_link}>{room_obj.name}</a>"
-
     new_owner = get_object_or_404(CustomUser,id=user_id)
-    # actual content
-    title = "Owner Changed"
-    content = f"<strong>{user}</strong>, the former room admin, has transferred ownership to <strong>{new_owner}</strong>."
-    Notice.objects.create(room=room_obj, title=title, content=content, is_html=True)
+    post_notice(room_obj, 'owner_transferred', user=user_ref(request.user), other=user_ref(new_owner))
 
 
 def notice_toggle_task(request, task):
-    profile_link = reverse_lazy('profile', kwargs={'username':request.user.username})
-    user = f"<a href={profile_link}>{request.user}</a>"
-
-    session_link = reverse_lazy('session', kwargs={'session_id': task.session.id})
-    todo = f"<a href={session_link}>{task.task}</a>"
-
-    session = f"<a href={session_link}>{task.session.name}</a>"
-
-    # actual content
-    title = f"{user} completed a task"
-    content = f"<strong>{user}</strong> completed the task <em>{todo}</em> in the <strong>{session}</strong> session."
-    Notice.objects.create(room=task.session.room, title=title, content=content, is_html=True)
+    post_notice(
+        task.session.room, 'task_completed',
+        user=user_ref(request.user), session=session_ref(task.session), task=task.task
+    )
 
 
 
 def get_unread_notices(room, user):
-    # get notices after the user has joined 
-    joined_on = room.roommembership_set.get(user=user).joined_on
-    # if the notice doesnot have noticerread row then stack it in output
-    notices = Notice.objects.filter(room = room, created_on__gt =joined_on).exclude(author=user).prefetch_related('read_statuses') \
-                .exclude(read_statuses__user=user).prefetch_related('read_statuses')
-
-    return notices
+    # notices past the user's read watermark (or join time) without a read row
+    return unread_notices(room, user)
 
 
 def notice_mark_all_as_seen(room, user):
-    notices = get_unread_notices(room, user)
-    statuses = [
-        NoticeReadStatus(notice = notice, user = user)
-        for notice in notices
-    ]
-    NoticeReadStatus.objects.bulk_create(statuses)
+    # returns the number of notices marked
+    return mark_all_read(room, user)
 
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from pages import archive
+
+
+class Command(BaseCommand):
+    help = "Move old finished sessions and system notices into the compressed archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_HORIZON_DAYS,
+                            help="archive data older than this many days")
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help="number of sessions archived per transaction")
+        parser.add_argument('--sessions-only', action='store_true', help="do not archive notices")
+        parser.add_argument('--notices-only', action='store_true', help="do not archive sessions")
+
+    def handle(self, *args, **options):
+        if options['days'] <= 0:
+            raise CommandError("--days should be a positive number")
+        if options['sessions_only'] and options['notices_only']:
+            raise CommandError("--sessions-only and --notices-only cannot be used together")
+
+        before = timezone.now() - timedelta(days=options['days'])
+
+        if not options['notices_only']:
+            count = archive.archive_sessions(before, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Archived {count} sessions"))
+
+        if not options['sessions_only']:
+            count = archive.archive_notices(before)
+            self.stdout.write(self.style.SUCCESS(f"Archived {count} notices"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from pages.models import TrackTodo
+
+
+class Command(BaseCommand):
+    help = "Fill the denormalized user, session and room columns of tracking rows created before they existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        updated = TrackTodo.backfill_denormalized(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {updated} tracking rows"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from stats.read_state import compact_read_statuses
+
+
+class Command(BaseCommand):
+    help = "Fold the per notice read rows into the per room read watermarks"
+
+    def handle(self, *args, **options):
+        moved, removed = compact_read_statuses()
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} read watermarks, removed {removed} read rows"))
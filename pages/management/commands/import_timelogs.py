@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from pages.bulk_import import import_time_logs, read_rows, DEFAULT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Import historical time logs from a csv or ndjson file (user, room, session, task, day, hours)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--show-rejected', type=int, default=20,
+                            help="number of rejected rows to print")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            stream = open(path, newline='', encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(f"Cannot open {path}: {e}")
+
+        with stream:
+            report = import_time_logs(read_rows(stream, path), chunk_size=options['chunk_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['imported']} rows ({report['todos_created']} new tasks) "
+            f"in {report['elapsed']}s, {report['rows_per_second']} rows/s"
+        ))
+        if report['rejected']:
+            self.stdout.write(self.style.WARNING(f"Rejected {report['rejected_count']} rows"))
+            for item in report['rejected'][:options['show_rejected']]:
+                self.stdout.write(f"  row {item['row']}: {item['error']}")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from stats import search
+
+
+class Command(BaseCommand):
+    help = "Create the full-text search indexes of notices and todos (postgres and sqlite)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="drop and recreate the search columns, after changing SEARCH_CONFIG")
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError("Full-text search is only supported on postgres and sqlite")
+        search.install(rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS("Search indexes are up to date"))
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from pages import partitions
+
+
+class Command(BaseCommand):
+    help = "Manage the monthly partitions of the tracking table (postgres only)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help="rebuild the tracking table as a partitioned table")
+        parser.add_argument('--ahead', type=int, default=settings.TRACKTODO_PARTITIONS_AHEAD,
+                            help="number of future months to create partitions for")
+        parser.add_argument('--retain-months', type=int, default=settings.TRACKTODO_RETENTION_MONTHS,
+                            help="detach partitions older than this many months, 0 keeps everything")
+        parser.add_argument('--drop', action='store_true',
+                            help="drop the detached partitions instead of keeping them as plain tables")
+
+    def handle(self, *args, **options):
+        if not partitions.is_supported():
+            raise CommandError("Partitioning is only supported on postgres")
+
+        today = timezone.localdate()
+        if not partitions.is_partitioned():
+            if not options['convert']:
+                raise CommandError("The tracking table is not partitioned yet, run with --convert")
+            partitions.convert_to_partitioned(options['ahead'], today)
+            self.stdout.write(self.style.SUCCESS("Converted the tracking table to monthly partitions"))
+
+        created = partitions.ensure_partitions(today, partitions.add_months(today, options['ahead']))
+        for name in created:
+            self.stdout.write(f"Created {name}")
+
+        if options['retain_months']:
+            boundary = partitions.add_months(today, -options['retain_months'])
+            detached = partitions.detach_partitions_before(boundary, drop=options['drop'])
+            for name in detached:
+                self.stdout.write(f"{'Dropped' if options['drop'] else 'Detached'} {name}")
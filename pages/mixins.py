@@ -7,29 +7,33 @@ from django.core.exceptions import PermissionDenied
 class MemberRequiredMixin:
     def dispatch(self, request, *args, **kwargs):
         room_inst = None
+        session_inst = None
 
         room_id = self.kwargs.get('room_id')
         session_id = self.kwargs.get('session_id')
         task_id = self.kwargs.get('task_id')
 
         if room_id:
-            room_inst = Room.objects.filter(id=room_id).first()
+            room_inst = Room.objects.select_related('admin').filter(id=room_id).first()
 
 
         elif session_id:
-            session_inst = Session.objects.filter(id = session_id).first()
+            session_inst = Session.objects.select_related('room__admin').filter(id = session_id).first()
             if session_inst:
                 room_inst = session_inst.room
 
         elif task_id:
-            todo = Todo.objects.filter(id=task_id).first()
+            todo = Todo.objects.select_related('session__room__admin').filter(id=task_id).first()
             if todo:
                 room_inst = todo.session.room
 
         if room_inst:
-            if not room_inst.members.filter(id=self.request.user.id):
+            if not room_inst.members.filter(id=self.request.user.id).exists():
                 return HttpResponse("403: You are not a member of this room", status=403)
 
+        # kept for the view so it does not fetch the room or the session again
+        self.room = room_inst
+        self.session = session_inst
 
         return super().dispatch(request, *args, **kwargs)
 
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import RowNumber
 from authapp.models import CustomUser
 from django.contrib.auth.hashers import make_password , check_password, is_password_usable, identify_hasher
 from django.core.exceptions import ValidationError
@@ -9,6 +10,42 @@ from .register_signals import *
 import logging
 logger = logging.getLogger(__name__)
 
+
+def save_rankings(model, owner_field, owner, ranks):
+    """
+    stores the sorted (user, hours) pairs as rank 1..n of the owner with one upsert,
+    rows of users that are no longer ranked are removed
+    """
+    model.objects.filter(**{owner_field: owner}).exclude(user__in=[user for user, _ in ranks]).delete()
+    if ranks:
+        model.objects.bulk_create(
+            [model(**{owner_field: owner}, user=user, rank=rank, total_hours=hours)
+             for rank, (user, hours) in enumerate(ranks, 1)],
+            update_conflicts=True,
+            unique_fields=[owner_field, 'user'],
+            update_fields=['rank', 'total_hours'],
+        )
+
+def rerank(model, owner_field, owner_ids):
+    """
+    renumbers the stored rankings of the owners after rows were removed,
+    the hours of the remaining users do not change so no totals are recomputed
+    """
+    rankings = model.objects.filter(**{f'{owner_field}__in': owner_ids}).annotate(
+        new_rank=models.Window(
+            RowNumber(),
+            partition_by=[models.F(owner_field)],
+            order_by=[models.F('total_hours').desc(), models.F('rank').asc()],
+        )
+    )
+    changed = []
+    for ranking in rankings:
+        if ranking.rank != ranking.new_rank:
+            ranking.rank = ranking.new_rank
+            changed.append(ranking)
+    model.objects.bulk_update(changed, ['rank'], batch_size=500)
+
+
 # Create your models here.
 
 class Room(models.Model):
@@ -33,6 +70,10 @@ class Room(models.Model):
             self.password = hashed_pass
 
     def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'password' not in update_fields:
+            # the password is not written, no need to look at it
+            return super().save(*args, **kwargs)
         if self.password and not self.is_hashed(self.password):
             self.hash_pass()
         super().save(*args, **kwargs)
@@ -44,13 +85,23 @@ class Room(models.Model):
     
     @property
     def total_hours(self):
-        hashmap = {}
-        
-        for session in self.sessions.all():
-            if not session.is_active:
-                for user, hours in session.total_hours.items():
-                    hashmap[user] = hashmap.get(user, 0) + hours
-        return hashmap
+        # only finished sessions count towards the room
+        finished = self.sessions.filter(finished_at__lte=timezone.now())
+        hours = dict(
+            TrackTodo.objects.filter(room=self, session__in=finished)
+            .values_list('user').annotate(total=models.Sum('hours'))
+        )
+        # hours of archived sessions are kept as per user totals
+        archived = dict(
+            RoomArchiveTotal.objects.filter(room=self).values_list('user', 'total_hours')
+        )
+        for user_id, total in archived.items():
+            hours[user_id] = hours.get(user_id, 0) + total
+
+        members = CustomUser.objects.filter(
+            models.Q(sessions__in=finished) | models.Q(id__in=archived.keys())
+        ).distinct()
+        return {member: hours.get(member.id, 0) for member in members}
 
     @property
     def current_rankings(self):
@@ -60,15 +111,7 @@ class Room(models.Model):
         return sorted_items
     
     def updateRoomRankings(self):
-        ranks = self.current_rankings
-        if ranks:
-            start = 1
-            for rank in ranks:
-                RoomRanking.objects.update_or_create(room=self, user=rank[0],
-                                                        defaults={
-                                                         "rank":start, "total_hours" : rank[1]}
-                                                         )
-                start += 1
+        save_rankings(RoomRanking, 'room', self, self.current_rankings)
     
     def transfer_admin(self, user_id):
         user = CustomUser.objects.filter(id = user_id).first()
@@ -80,19 +123,50 @@ class Room(models.Model):
             session.members.add(user)
 
     def remove_member(self, user_id):
-        if self.admin.id == user_id:
+        self.remove_members([user_id])
+
+    def remove_members(self, user_ids):
+        """
+        removes the users from the room and all of its sessions in a fixed number of statements,
+        their todos (with the tracking), session memberships and rankings are deleted
+        """
+        user_ids = {str(user_id) for user_id in user_ids}
+        if str(self.admin_id) in user_ids:
             raise ValidationError('Admin cannot be removed from member')
-        
-        user = CustomUser.objects.filter(id = user_id).first()
-        sessions = self.sessions.all()
-        for session in sessions:
-            session.remove_member(user_id)
-        self.members.remove(user_id)
-        self.save()
-        rank = RoomRanking.objects.filter(room = self, user__id = user_id).first()
-        if rank:
-            rank.delete()
+
+        from .join_guard import forget_verified
+        from .queries import invalidate_dashboard
+
+        session_members = Session.members.through.objects.filter(session__room=self, customuser_id__in=user_ids)
+        with transaction.atomic():
+            session_ids = list(session_members.values_list('session_id', flat=True).distinct())
+            # the member counts change for everyone in these sessions
+            invalidate_dashboard(
+                Session.members.through.objects.filter(session_id__in=session_ids).values_list('customuser_id', flat=True)
+            )
+            Todo.objects.filter(session__room=self, user_id__in=user_ids).delete()
+            session_members.delete()
+            SessionRanking.objects.filter(session_id__in=session_ids, user_id__in=user_ids).delete()
+            RoomRanking.objects.filter(room=self, user_id__in=user_ids).delete()
+            RoomArchiveTotal.objects.filter(room=self, user_id__in=user_ids).delete()
+            RoomMembership.objects.filter(room=self, user_id__in=user_ids).delete()
+
+            rerank(SessionRanking, 'session', session_ids)
+            rerank(RoomRanking, 'room', [self.id])
+        # a removed user has to give the password again to rejoin
+        forget_verified(self, user_ids)
     
+    def add_members(self, user_ids):
+        """adds the users with one insert, returns the ids that were not members before"""
+        user_ids = set(user_ids)
+        existing = set(RoomMembership.objects.filter(room=self, user_id__in=user_ids).values_list('user_id', flat=True))
+        added = user_ids - existing
+        RoomMembership.objects.bulk_create(
+            [RoomMembership(room=self, user_id=user_id) for user_id in added],
+            ignore_conflicts=True,
+        )
+        return added
+
     # used in views and apis
     def join_room(self, user):
         self.members.add(user)
@@ -109,16 +183,19 @@ class Room(models.Model):
     
 class RoomMembership(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
-    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, db_index=False)
     joined_on = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('user', 'room')
+        indexes = [
+            models.Index(fields=['room', 'user', 'joined_on'], name='membership_room_user_idx'),
+        ]
     
     
 class Session(models.Model):
     id = models.UUIDField(primary_key=True,default=uuid.uuid4, editable=False)
-    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='sessions')
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='sessions', db_index=False)
     name = models.CharField(max_length=250)
     description = models.TextField(blank=True, null=True)
     started_at = models.DateTimeField(null=True,blank=True)
@@ -127,9 +204,21 @@ class Session(models.Model):
 
     deadline = models.DateField(null=True, blank=True)
     auto_end = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', 'finished_at'], name='session_room_finished_idx'),
+            models.Index(fields=['room', 'name'], name='session_room_name_idx'),
+            # active sessions of a room
+            models.Index(fields=['room'], condition=models.Q(finished_at__isnull=True),
+                         name='session_active_room_idx'),
+            # sessions waiting for the auto end middleware
+            models.Index(fields=['deadline'], condition=models.Q(auto_end=True, finished_at__isnull=True),
+                         name='session_auto_end_idx'),
+        ]
     
     def clean(self):
-        if Session.objects.filter(name=self.name, room = self.room).exclude(id=self.id).exists():
+        if Session.objects.filter(name=self.name, room_id=self.room_id).exclude(id=self.id).exists():
             raise ValidationError({"name": "The name should be unique in a room!"})
         
         if self.finished_at and self.finished_at < self.started_at:
@@ -145,19 +234,20 @@ class Session(models.Model):
             raise ValidationError({'deadline': "deadline date can't be behind the start date"})
         
         
-        session_members = self.members.all()
-        room_members = self.room.members.all()
-        for member in session_members:
-            if member not in room_members:
-                raise ValidationError("Member not in room")
-        
-        objects = Session.objects.filter(room=self.room).exclude(id=self.id)
-        for object in objects:
-            if object.is_active:
-                raise ValidationError(
-                    "There is already an active session in this room. "
-                    "Please end the current active session before creating a new one."
-                )
+        # members outside the room, as one set difference query
+        if not self._state.adding and self.members.exclude(
+            id__in=RoomMembership.objects.filter(room_id=self.room_id).values('user_id')
+        ).exists():
+            raise ValidationError("Member not in room")
+
+        # same condition as is_active, uses the room indexes
+        if Session.objects.filter(room_id=self.room_id).filter(
+            models.Q(finished_at__isnull=True) | models.Q(finished_at__gt=timezone.now())
+        ).exclude(id=self.id).exists():
+            raise ValidationError(
+                "There is already an active session in this room. "
+                "Please end the current active session before creating a new one."
+            )
         return super().clean()
     
     def save(self,*args, **kwargs):
@@ -166,6 +256,8 @@ class Session(models.Model):
         self.room.updateRoomRankings()
     
     def delete(self, *args, **kwargs):
+        from .queries import invalidate_dashboard
+        invalidate_dashboard(self.members.values_list('id', flat=True))
         super().delete(*args, **kwargs)
         self.room.updateRoomRankings()
 
@@ -181,13 +273,10 @@ class Session(models.Model):
     
     @property
     def total_hours(self):
-        hashmap = {}
-        for member in self.members.all():
-            todos = self.todos.filter(user=member)
-            hours = sum([i.total_hours for i in todos])
-            hashmap[member] = hours
-
-        return hashmap
+        hours = dict(
+            TrackTodo.objects.for_session(self).values_list('user').annotate(total=models.Sum('hours'))
+        )
+        return {member: hours.get(member.id, 0) for member in self.members.all()}
     
     @property
     def current_rankings(self):
@@ -197,15 +286,7 @@ class Session(models.Model):
         return sorted_items
 
     def updateSessionRanking(self):
-        ranks = self.current_rankings
-        if ranks:
-            start = 1
-            for rank in ranks:
-                SessionRanking.objects.update_or_create(session=self, user=rank[0],
-                                                        defaults={
-                                                         "rank":start, "total_hours" : rank[1]}
-                                                         )
-                start += 1
+        save_rankings(SessionRanking, 'session', self, self.current_rankings)
 
     def remove_member(self, user_id):
         if str(user_id) == str(self.room.admin.id):
@@ -233,12 +314,17 @@ class Session(models.Model):
 class Todo(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='todos')
-    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='todos')
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='todos', db_index=False)
     task = models.TextField()
     completed = models.BooleanField(default=False)
     completed_on = models.DateField(null=True, blank=True)
     created_on = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['session', 'user', 'completed'], name='todo_session_user_idx'),
+        ]
+
     def __str__(self):
         return f"{self.task[:10]}...by {self.user}"
     
@@ -277,25 +363,87 @@ class Todo(models.Model):
 
     
     def delete(self, *args, **kwargs):
+        from .queries import invalidate_dashboard
         super().delete(*args, **kwargs)
         self.session.updateSessionRanking()
+        invalidate_dashboard([self.user_id])
         
 
 
+class TrackTodoQuerySet(models.QuerySet):
+    """
+    Date bounded helpers. Every query going through these carries a range on `day`,
+    which lets postgres prune the monthly partitions when the table is partitioned.
+    """
+
+    def between(self, start, end):
+        return self.filter(day__gte=start, day__lte=end)
+
+    def for_session(self, session):
+        queryset = self.filter(session=session)
+        if session.finished_at:
+            # nothing can be tracked after a session has ended
+            queryset = queryset.filter(day__lte=timezone.localtime(session.finished_at).date())
+        return queryset
+
+
 class TrackTodo(models.Model):
-    todo = models.ForeignKey(Todo, on_delete=models.CASCADE, related_name='tracking')
-    day = models.DateField( auto_now_add=True)
+    todo = models.ForeignKey(Todo, on_delete=models.CASCADE, related_name='tracking', db_index=False)
+    day = models.DateField(default=timezone.localdate)
     hours = models.FloatField(default=0.0)
     added_on_time = models.TimeField(null=True, blank=True, auto_now_add=True)
 
+    # copied from the todo so that stats can aggregate without joining Todo and Session
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='tracks',
+                             null=True, blank=True, editable=False, db_index=False)
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name='tracks',
+                                null=True, blank=True, editable=False, db_index=False)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='tracks',
+                             null=True, blank=True, editable=False, db_index=False)
+
+    objects = TrackTodoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['todo', 'day'], name='tracktodo_todo_day_idx'),
+            # covering indexes for the stats and ranking aggregates
+            models.Index(fields=['user', 'day', 'hours'], name='tracktodo_user_day_idx'),
+            models.Index(fields=['session', 'user', 'hours'], name='tracktodo_session_user_idx'),
+            models.Index(fields=['room', 'user', 'hours'], name='tracktodo_room_user_idx'),
+        ]
+
     def clean(self):
         if self.todo.completed:
             raise ValidationError({'todo': 'the task is completed, hours cannot be added'})
         return super().clean()
 
-    
+    def fill_denormalized(self):
+        self.user_id = self.todo.user_id
+        self.session_id = self.todo.session_id
+        self.room_id = self.todo.session.room_id
+
+    @classmethod
+    def backfill_denormalized(cls, batch_size=10000, using='default'):
+        """
+        fills user, session and room of old rows with set based updates, returns the updated count,
+        runs after every migrate
+        """
+        todos = Todo.objects.using(using).filter(id=models.OuterRef('todo_id'))
+        rows = cls.objects.using(using)
+        updated = 0
+        while True:
+            ids = list(rows.filter(user__isnull=True).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return updated
+            updated += rows.filter(id__in=ids).update(
+                user_id=models.Subquery(todos.values('user_id')[:1]),
+                session_id=models.Subquery(todos.values('session_id')[:1]),
+                room_id=models.Subquery(todos.values('session__room_id')[:1]),
+            )
+
     def save(self, *args, **kwargs):
         self.clean()
+        self.fill_denormalized()
         returned_value = super().save(*args, **kwargs)
         self.todo.session.updateSessionRanking()
         return returned_value
@@ -311,6 +459,9 @@ class SessionRanking(models.Model):
     class Meta:
         unique_together = ('session', 'user')
         ordering = ['rank']
+        indexes = [
+            models.Index(fields=['session', 'rank'], name='sessionranking_rank_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - Rank {self.rank} in {self.session.name}"
@@ -327,6 +478,9 @@ class RoomRanking(models.Model):
     class Meta:
         unique_together = ('room', 'user')
         ordering = ['rank']
+        indexes = [
+            models.Index(fields=['room', 'rank'], name='roomranking_rank_idx'),
+        ]
 
 
 class SystemStatus(models.Model):
@@ -337,3 +491,38 @@ class SystemStatus(models.Model):
     def __str__(self):
         return "Last Checked : " + str(self.value)
 
+
+class ArchivedSession(models.Model):
+    """a finished session moved out of the hot tables, see pages/archive.py"""
+    id = models.UUIDField(primary_key=True, editable=False)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='archived_sessions')
+    name = models.CharField(max_length=250)
+    description = models.TextField(blank=True, null=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField()
+    archived_on = models.DateTimeField(auto_now_add=True)
+    # {user_id: hours} of the members, kept uncompressed for the rankings
+    totals = models.JSONField(default=dict)
+    # zlib compressed json of the members, todos and tracking rows
+    payload = models.BinaryField()
+
+    class Meta:
+        ordering = ['-finished_at']
+
+    def __str__(self):
+        return f"{self.name} in {self.room} (archived)"
+
+    @property
+    def data(self):
+        from .archive import decompress
+        return decompress(self.payload)
+
+
+class RoomArchiveTotal(models.Model):
+    """hours a user collected in the archived sessions of a room"""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='archive_totals')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='archive_totals')
+    total_hours = models.FloatField(default=0.0)
+
+    class Meta:
+        unique_together = ('room', 'user')
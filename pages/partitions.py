@@ -0,0 +1,139 @@
+"""
+Monthly range partitioning of the tracking table (postgres only).
+
+The table is partitioned on `day`, one partition per month named
+pages_tracktodo_pYYYY_MM plus a default partition catching anything outside
+the created months. Queries going through TrackTodoQuerySet.between/for_session
+carry a range on `day` so postgres only scans the matching partitions.
+"""
+from django.db import connection, transaction
+
+from .models import TrackTodo
+
+
+TABLE = TrackTodo._meta.db_table
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+
+def is_supported(conn=connection):
+    return conn.vendor == 'postgresql'
+
+
+def add_months(day, months):
+    month_index = day.year * 12 + day.month - 1 + months
+    return day.replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s",
+            [TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(conn=connection):
+    """returns the names of the monthly partitions attached to the table"""
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s ORDER BY child.relname",
+            [TABLE]
+        )
+        return [row[0] for row in cursor.fetchall() if row[0] != DEFAULT_PARTITION]
+
+
+def create_partition(month, conn=connection):
+    month = month.replace(day=1)
+    name = partition_name(month)
+    quote = conn.ops.quote_name
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {quote(name)} PARTITION OF {quote(TABLE)} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        )
+    return name
+
+
+def ensure_partitions(start, end, conn=connection):
+    """creates the monthly partitions covering start..end, returns the created names"""
+    month = start.replace(day=1)
+    existing = set(list_partitions(conn))
+    created = []
+    while month <= end:
+        if partition_name(month) not in existing:
+            created.append(create_partition(month, conn))
+        month = add_months(month, 1)
+    return created
+
+
+def detach_partitions_before(month, drop=False, conn=connection):
+    """detaches (and optionally drops) the partitions holding days before `month`"""
+    quote = conn.ops.quote_name
+    boundary = partition_name(month.replace(day=1))
+    detached = []
+    with conn.cursor() as cursor:
+        for name in list_partitions(conn):
+            if name >= boundary:
+                continue
+            cursor.execute(f"ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(name)}")
+            if drop:
+                cursor.execute(f"DROP TABLE {quote(name)}")
+            detached.append(name)
+    return detached
+
+
+def convert_to_partitioned(months_ahead, today, conn=connection):
+    """
+    Rebuilds the tracking table as a partitioned table.
+    The rows are copied in one transaction, the primary key becomes (id, day)
+    because postgres requires the partition key in every unique constraint.
+    """
+    quote = conn.ops.quote_name
+    legacy = f"{TABLE}_unpartitioned"
+    columns = ', '.join(quote(field.column) for field in TrackTodo._meta.local_concrete_fields)
+
+    with transaction.atomic(using=conn.alias):
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT min(day), max(day) FROM {quote(TABLE)}")
+            first_day, last_day = cursor.fetchone()
+
+            cursor.execute(f"ALTER TABLE {quote(TABLE)} RENAME TO {quote(legacy)}")
+            cursor.execute(
+                f"CREATE TABLE {quote(TABLE)} (LIKE {quote(legacy)} INCLUDING DEFAULTS INCLUDING IDENTITY) "
+                f"PARTITION BY RANGE (day)"
+            )
+            cursor.execute(f"CREATE TABLE {quote(DEFAULT_PARTITION)} PARTITION OF {quote(TABLE)} DEFAULT")
+
+        ensure_partitions(first_day or today, max(last_day or today, add_months(today, months_ahead)), conn)
+
+        with conn.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {quote(TABLE)} ({columns}) SELECT {columns} FROM {quote(legacy)}")
+            cursor.execute(f"DROP TABLE {quote(legacy)}")
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), coalesce(max(id), 0) + 1, false) FROM {quote(TABLE)}",
+                [TABLE]
+            )
+            cursor.execute(f"ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(TABLE + '_pkey')} PRIMARY KEY (id, day)")
+
+        # foreign keys and indexes are recreated on the parent and inherited by the partitions
+        with conn.cursor() as cursor:
+            for field in TrackTodo._meta.local_concrete_fields:
+                if field.remote_field and field.db_constraint:
+                    cursor.execute(
+                        f"ALTER TABLE {quote(TABLE)} ADD CONSTRAINT {quote(f'{TABLE}_{field.column}_fk')} "
+                        f"FOREIGN KEY ({quote(field.column)}) "
+                        f"REFERENCES {quote(field.related_model._meta.db_table)} ({quote(field.target_field.column)}) "
+                        f"DEFERRABLE INITIALLY DEFERRED"
+                    )
+        with conn.schema_editor(atomic=False) as editor:
+            for index in TrackTodo._meta.indexes:
+                editor.add_index(TrackTodo, index)
@@ -0,0 +1,208 @@
+"""
+Read side query services for the pages.
+
+Each service returns plain values (or model instances carrying annotations)
+built with a fixed number of queries, so the templates never go back to the
+database per row.
+"""
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Q, Count, Sum, Subquery, OuterRef, FloatField, IntegerField, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Session, Todo, TrackTodo, SessionRanking
+
+
+def active_q(now=None):
+    """same condition as Session.is_active"""
+    return Q(finished_at__isnull=True) | Q(finished_at__gt=now or timezone.now())
+
+
+def _count_subquery(queryset, column):
+    return Coalesce(
+        Subquery(queryset.values(column).annotate(count=Count('*')).values('count')[:1]),
+        Value(0), output_field=IntegerField()
+    )
+
+
+def _hours_subquery(queryset, column):
+    return Coalesce(
+        Subquery(queryset.values(column).annotate(total=Sum('hours')).values('total')[:1]),
+        Value(0.0), output_field=FloatField()
+    )
+
+
+# dashboard
+
+def _dashboard_version_key(user_id):
+    return f"dashboard:version:{user_id}"
+
+
+def invalidate_dashboard(user_ids):
+    """
+    drops the cached dashboards of the users, called whenever their sessions change.
+    The users are read right away, the versions are bumped once the change commits so
+    a dashboard read in between cannot cache the old state under the new version.
+    """
+    user_ids = set(user_ids)
+    if user_ids:
+        transaction.on_commit(
+            lambda: cache.set_many({_dashboard_version_key(user_id): uuid4().hex for user_id in user_ids}, None)
+        )
+
+
+def dashboard_sessions(user):
+    """sessions of the user with member count, the user's hours and open todos annotated"""
+    return Session.objects.filter(members=user).select_related('room').annotate(
+        member_count=_count_subquery(
+            Session.members.through.objects.filter(session_id=OuterRef('pk')), 'session_id'
+        ),
+        my_hours=_hours_subquery(
+            TrackTodo.objects.filter(session_id=OuterRef('pk'), user=user), 'session_id'
+        ),
+        open_todos=_count_subquery(
+            Todo.objects.filter(session_id=OuterRef('pk'), user=user, completed=False), 'session_id'
+        ),
+    )
+
+
+def dashboard_summary(user, page=1):
+    """
+    Cached dashboard data of the user, the active sessions plus one page of past sessions.
+    The cache key carries a per user version bumped by invalidate_dashboard.
+    """
+    try:
+        page = max(int(page), 1)
+    except (TypeError, ValueError):
+        page = 1
+
+    version = cache.get(_dashboard_version_key(user.id))
+    if version is None:
+        version = uuid4().hex
+        cache.set(_dashboard_version_key(user.id), version, None)
+    # date_joined tells apart users reusing an id
+    key = f"dashboard:{user.id}:{user.date_joined.timestamp()}:{version}:{page}"
+
+    summary = cache.get(key)
+    if summary is not None:
+        return summary
+
+    now = timezone.now()
+    sessions = dashboard_sessions(user)
+    active_sessions = list(sessions.filter(active_q(now)).order_by('-started_at'))
+
+    paginator = Paginator(
+        sessions.filter(finished_at__lte=now).order_by('-finished_at'),
+        settings.DASHBOARD_PAST_SESSIONS_PER_PAGE
+    )
+    past_page = paginator.get_page(page)
+
+    summary = {
+        'active_sessions': active_sessions,
+        'past_sessions': list(past_page),
+        'past_count': paginator.count,
+        'total_sessions': paginator.count + len(active_sessions),
+        'page': past_page.number,
+        'num_pages': paginator.num_pages,
+    }
+
+    # a session ending on its own moves from active to past, expire before that
+    timeout = settings.DASHBOARD_CACHE_TIMEOUT
+    endings = [session.finished_at for session in active_sessions if session.finished_at]
+    if endings:
+        timeout = max(1, min(timeout, int((min(endings) - now).total_seconds())))
+    cache.set(key, summary, timeout)
+    return summary
+
+
+# rooms
+
+def session_summaries(queryset):
+    """annotates the member count, total hours and the top ranked user of each session"""
+    top = SessionRanking.objects.filter(session_id=OuterRef('pk')).order_by('rank')
+    return queryset.annotate(
+        member_count=_count_subquery(
+            Session.members.through.objects.filter(session_id=OuterRef('pk')), 'session_id'
+        ),
+        hours_total=_hours_subquery(TrackTodo.objects.filter(session_id=OuterRef('pk')), 'session_id'),
+        top_user=Subquery(top.values('user__username')[:1]),
+        top_hours=Subquery(top.values('total_hours')[:1]),
+    )
+
+
+def active_room_sessions(room, now=None):
+    return list(session_summaries(Session.objects.filter(room=room).filter(active_q(now))).order_by('-started_at'))
+
+
+def make_cursor(moment, pk):
+    """keyset cursor of a (datetime, id) ordered row"""
+    return f"{moment.isoformat()}|{pk}"
+
+
+def parse_cursor(cursor):
+    """(datetime, id) of a cursor made by make_cursor, raises ValueError on anything else"""
+    moment, _, pk = cursor.partition('|')
+    moment = parse_datetime(moment)
+    if moment is None or not pk:
+        raise ValueError('invalid cursor')
+    return moment, pk
+
+
+def room_history(room, cursor=None, limit=None):
+    """
+    One page of finished sessions of the room, newest first.
+    Keyset paginated on (finished_at, id) so every page costs the same no matter
+    how old the room is. Returns (sessions, next_cursor), next_cursor is None on the last page.
+    """
+    limit = limit or settings.ROOM_HISTORY_PER_PAGE
+    queryset = Session.objects.filter(room=room, finished_at__lte=timezone.now())
+
+    if cursor:
+        finished_at, session_id = parse_cursor(cursor)
+        queryset = queryset.filter(
+            Q(finished_at__lt=finished_at) | Q(finished_at=finished_at, id__lt=session_id)
+        )
+
+    sessions = list(session_summaries(queryset).order_by('-finished_at', '-id')[:limit + 1])
+    next_cursor = make_cursor(sessions[limit - 1].finished_at, sessions[limit - 1].id) if len(sessions) > limit else None
+    return sessions[:limit], next_cursor
+
+
+# sessions
+
+def session_todos(session, today=None):
+    """todos of the session with the total hours and today's hours annotated, in one query"""
+    today = today or timezone.localdate()
+    return Todo.objects.filter(session=session).annotate(
+        hours_total=Coalesce(Sum('tracking__hours'), Value(0.0), output_field=FloatField()),
+        hours_today=Coalesce(
+            Sum('tracking__hours', filter=Q(tracking__day=today)), Value(0.0), output_field=FloatField()
+        ),
+    ).order_by('created_on', 'id')
+
+
+def session_members(session, todos, today=None):
+    """
+    members of the session with their session hours (today and overall) annotated,
+    each carrying its own todos from the already fetched `todos` as `session_todos`
+    """
+    today = today or timezone.localdate()
+    tracks = TrackTodo.objects.filter(session=session, user_id=OuterRef('pk'))
+    members = list(session.members.annotate(
+        total_hours_all=_hours_subquery(tracks, 'user_id'),
+        total_hours_today=_hours_subquery(tracks.filter(day=today), 'user_id'),
+    ).order_by('username'))
+
+    by_user = {}
+    for todo in todos:
+        by_user.setdefault(todo.user_id, []).append(todo)
+    for member in members:
+        member.session_todos = by_user.get(member.id, [])
+        member.is_active_today = member.total_hours_today > 0
+    return members
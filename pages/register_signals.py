@@ -6,6 +6,7 @@ kicked_from_session = Signal()
 left_session = Signal()
 left_room = Signal()
 owner_transferred = Signal()
+members_updated = Signal()
 session_created = Signal()
 task_completed = Signal()
 task_created = Signal()
@@ -0,0 +1,125 @@
+from io import StringIO
+from django.test import TestCase
+from django.core.management import call_command
+from django.urls import reverse
+from pages.models import CustomUser, Room, Session, Todo, TrackTodo, ArchivedSession, RoomArchiveTotal, RoomRanking
+from pages import archive
+from stats.models import Notice, NoticeArchive
+from django.utils import timezone
+from datetime import timedelta
+from unittest.mock import patch
+
+
+class TestArchive(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username = 'ame',
+            password = 'itsmeprash'
+        )
+        cls.user1 = CustomUser.objects.create_user(
+            username = 'testuser1',
+            password = 'itsmypassword1'
+        )
+        cls.room = Room.objects.create(name='testroom', admin=cls.user)
+        cls.room.members.add(cls.user, cls.user1)
+
+        started = timezone.now() - timedelta(days=400)
+        cls.old_session = Session.objects.create(
+            name='oldsession', room=cls.room, started_at=started, finished_at=started + timedelta(days=10)
+        )
+        cls.old_session.members.add(cls.user, cls.user1)
+        todo = Todo.objects.create(user=cls.user, session=cls.old_session, task='old task')
+        TrackTodo.objects.create(todo=todo, hours=3, day=started.date())
+        TrackTodo.objects.create(todo=todo, hours=2, day=started.date() + timedelta(days=1))
+
+        cls.session = Session.objects.create(name='testsession', room=cls.room, started_at=timezone.now())
+        cls.session.members.add(cls.user1)
+        cls.room.updateRoomRankings()
+
+    def test_compress_roundtrip(self):
+        data = {'day': timezone.localdate(), 'hours': [1, 2.5]}
+        self.assertEqual(
+            archive.decompress(archive.compress(data)),
+            {'day': timezone.localdate().isoformat(), 'hours': [1, 2.5]}
+        )
+
+    def test_archive_sessions(self):
+        hours_before = {user.id: hours for user, hours in self.room.total_hours.items()}
+
+        count = archive.archive_sessions(timezone.now() - timedelta(days=365))
+
+        self.assertEqual(count, 1)
+        self.assertFalse(Session.objects.filter(id=self.old_session.id).exists())
+        self.assertTrue(Session.objects.filter(id=self.session.id).exists())
+        self.assertFalse(TrackTodo.objects.filter(todo__task='old task').exists())
+
+        archived = ArchivedSession.objects.get(id=self.old_session.id)
+        self.assertEqual(archived.totals, {str(self.user.id): 5, str(self.user1.id): 0})
+        self.assertEqual(len(archived.data['tracking']), 2)
+        self.assertEqual(archived.data['todos'][0]['task'], 'old task')
+
+        # the room totals and rankings do not change
+        self.assertEqual(RoomArchiveTotal.objects.get(room=self.room, user=self.user).total_hours, 5)
+        self.assertEqual({user.id: hours for user, hours in self.room.total_hours.items()}, hours_before)
+        self.assertEqual(RoomRanking.objects.get(room=self.room, rank=1).user, self.user)
+
+    def test_user_hours_keep_archived_sessions(self):
+        self.assertEqual(self.user.total_hours, 5)
+        archive.archive_sessions(timezone.now() - timedelta(days=365))
+
+        self.assertEqual(self.user.total_hours, 5)
+        self.client.login(username='ame', password='itsmeprash')
+        response = self.client.get(reverse('my-stats'))
+        self.assertEqual(response.context['total_hours'], 5)
+        rooms = self.client.get(reverse('my-stats-data'), {'type': 'room_performance'}).json()['rooms']
+        self.assertEqual([room['hours'] for room in rooms], [5])
+
+    def test_archive_notices(self):
+        old = Notice.objects.create(room=self.room, title='old', content='old notice')
+        Notice.objects.filter(id=old.id).update(created_on=timezone.now() - timedelta(days=400))
+        older = Notice.objects.create(room=self.room, title='older', content='older notice')
+        Notice.objects.filter(id=older.id).update(created_on=timezone.now() - timedelta(days=401))
+        pinned = Notice.objects.create(room=self.room, title='pinned', content='pinned', is_pinned=True)
+        Notice.objects.filter(id=pinned.id).update(created_on=timezone.now() - timedelta(days=400))
+        by_user = Notice.objects.create(room=self.room, title='user', content='by user', author=self.user)
+        Notice.objects.filter(id=by_user.id).update(created_on=timezone.now() - timedelta(days=400))
+        Notice.objects.create(room=self.room, title='new', content='new notice')
+
+        with patch('pages.archive.recent.forget') as forget:
+            count = archive.archive_notices(timezone.now() - timedelta(days=365))
+        # one pass per room, not per notice
+        forget.assert_called_once_with(self.room.id)
+
+        self.assertEqual(count, 2)
+        self.assertFalse(Notice.objects.filter(id=old.id).exists())
+        self.assertTrue(Notice.objects.filter(id=pinned.id).exists())
+        self.assertTrue(Notice.objects.filter(id=by_user.id).exists())
+        notice_archive = NoticeArchive.objects.get(room=self.room)
+        self.assertEqual(notice_archive.count, 2)
+        self.assertEqual([notice['title'] for notice in notice_archive.notices], ['older', 'old'])
+
+    def test_command(self):
+        call_command('archive_old_data', '--days', '365', '--sessions-only', stdout=StringIO())
+        self.assertTrue(ArchivedSession.objects.filter(id=self.old_session.id).exists())
+
+    def test_stats_read_through(self):
+        archive.archive_sessions(timezone.now() - timedelta(days=365))
+        self.client.login(username='testuser1', password='itsmypassword1')
+
+        response = self.client.get(reverse('session-stats', kwargs={'session_id': self.old_session.id}))
+        self.assertRedirects(response, reverse('archived-session-stats', kwargs={'session_id': self.old_session.id}))
+
+        response = self.client.get(reverse('archived-session-stats', kwargs={'session_id': self.old_session.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['rankings'][0]['username'], 'ame')
+        self.assertContains(response, 'old task')
+
+    def test_stats_read_through_requires_membership(self):
+        archive.archive_sessions(timezone.now() - timedelta(days=365))
+        CustomUser.objects.create_user(username='outsider', password='itsmypassword2')
+        self.client.login(username='outsider', password='itsmypassword2')
+
+        response = self.client.get(reverse('archived-session-stats', kwargs={'session_id': self.old_session.id}))
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,136 @@
+from django.test import TestCase
+from django.core.management import call_command
+from django.urls import reverse_lazy
+from pages.models import CustomUser, Room, Session, Todo, TrackTodo, SessionRanking, RoomRanking
+from pages.bulk_import import import_time_logs
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.utils import timezone
+from datetime import timedelta
+import io
+import tempfile
+import os
+
+
+class TestBulkImport(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username = 'ame',
+            password = 'itsmeprash'
+        )
+        cls.user1 = CustomUser.objects.create_user(
+            username = 'testuser1',
+            password = 'itsmypassword1'
+        )
+        cls.user2 = CustomUser.objects.create_user(
+            username = 'testuser2',
+            password = 'itsmypassword2'
+        )
+        cls.room = Room.objects.create(name='testroom', admin=cls.user)
+        cls.room.members.add(cls.user1)
+        cls.session = Session.objects.create(name='testsession', room=cls.room)
+        cls.session.members.add(cls.user1)
+
+        cls.yesterday = str(timezone.localdate() - timedelta(days=1))
+
+    def row(self, **kwargs):
+        data = {
+            'user': 'testuser1',
+            'room': 'testroom',
+            'session': 'testsession',
+            'task': 'read a book',
+            'day': self.yesterday,
+            'hours': '2.5',
+        }
+        data.update(kwargs)
+        return data
+
+    def test_import_creates_todos_and_tracking(self):
+        rows = [
+            self.row(),
+            self.row(hours='1.5'),
+            self.row(task='write notes', hours='3'),
+            self.row(user='ame', hours='1'),
+        ]
+        report = import_time_logs(rows, chunk_size=2)
+
+        self.assertEqual(report['imported'], 4)
+        self.assertEqual(report['todos_created'], 3)
+        self.assertEqual(report['rejected'], [])
+
+        todo = Todo.objects.get(user=self.user1, task='read a book')
+        self.assertEqual(todo.total_hours, 4.0)
+        # historical day is kept
+        self.assertEqual(str(todo.tracking.first().day), self.yesterday)
+
+        ranking = SessionRanking.objects.get(session=self.session, user=self.user1)
+        self.assertEqual(ranking.rank, 1)
+        self.assertEqual(ranking.total_hours, 7.0)
+
+    def test_import_rejects_invalid_rows(self):
+        rows = [
+            self.row(user='nobody'),
+            self.row(user='testuser2'),
+            self.row(room='no room'),
+            self.row(session='no session'),
+            self.row(hours='abc'),
+            self.row(day='yesterday'),
+            {'user': 'testuser1'},
+        ]
+        report = import_time_logs(rows)
+
+        self.assertEqual(report['imported'], 0)
+        self.assertEqual(report['rejected_count'], 7)
+        self.assertEqual(sorted(item['row'] for item in report['rejected']), [1, 2, 3, 4, 5, 6, 7])
+        self.assertFalse(TrackTodo.objects.exists())
+
+    def test_import_skips_completed_todos(self):
+        Todo.objects.create(user=self.user1, session=self.session, task='read a book', completed=True)
+        report = import_time_logs([self.row()])
+        self.assertEqual(report['imported'], 0)
+        self.assertEqual(report['rejected_count'], 1)
+
+    def test_import_command(self):
+        csv_data = "user,room,session,task,day,hours\n" \
+            f"testuser1,testroom,testsession,read a book,{self.yesterday},2\n"
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(csv_data)
+        try:
+            out = io.StringIO()
+            call_command('import_timelogs', f.name, stdout=out)
+        finally:
+            os.remove(f.name)
+
+        self.assertIn('Imported 1 rows', out.getvalue())
+        self.assertEqual(TrackTodo.objects.count(), 1)
+
+    def test_import_api_only_admin_rooms(self):
+        url = reverse_lazy('timelogs-import')
+        client = APIClient()
+
+        client.credentials(HTTP_AUTHORIZATION = f"Bearer {RefreshToken.for_user(self.user1).access_token}")
+        response = client.post(url, data={'rows': [self.row()]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['imported'], 0)
+
+        client.credentials(HTTP_AUTHORIZATION = f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        response = client.post(url, data={'rows': [self.row()]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['imported'], 1)
+
+    def test_import_api_bad_input(self):
+        url = reverse_lazy('timelogs-import')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION = f"Bearer {RefreshToken.for_user(self.user).access_token}")
+
+        response = client.post(url, data=[self.row()], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['imported'], 1)
+
+        upload = io.BytesIO(b'user,room\n\xff\xfe,\n')
+        upload.name = 'logs.csv'
+        response = client.post(url, data={'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('could not read the file', response.json()['error'])
@@ -1,7 +1,10 @@
+from django.core.management import call_command
 from django.test import TestCase
 from pages.models import Room, Session, Todo, TrackTodo, RoomRanking, SessionRanking, CustomUser
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 class TestRoomModel(TestCase):
 
@@ -86,6 +89,37 @@ class TestRoomModel(TestCase):
         self.assertEqual(room.admin,self.user)
 
     
+    def test_remove_members_across_sessions(self):
+        room = self.create_room(self.user)
+        room.members.add(self.user1, self.user2, self.user3)
+
+        sessions = []
+        for i, hours in enumerate([(1, 2, 3), (4, 5, 6)]):
+            session = Session.objects.create(room=room, name=f'session{i}', started_at=timezone.now())
+            session.members.add(self.user1, self.user2, self.user3)
+            for user, user_hours in zip([self.user1, self.user2, self.user3], hours):
+                todo = Todo.objects.create(user=user, session=session, task='task')
+                TrackTodo.objects.create(todo=todo, hours=user_hours)
+            session.finished_at = timezone.now()
+            session.save()
+            sessions.append(session)
+
+        # user3 ranks first everywhere
+        self.assertEqual(RoomRanking.objects.get(room=room, rank=1).user, self.user3)
+
+        room.remove_members([self.user3.id, str(self.user1.id)])
+
+        self.assertNotIn(self.user3, room.members.all())
+        self.assertNotIn(self.user1, room.members.all())
+        for session in sessions:
+            self.assertNotIn(self.user3, session.members.all())
+            self.assertFalse(session.todos.filter(user__in=[self.user1, self.user3]).exists())
+            self.assertEqual(session.rankings.get(user=self.user2).rank, 1)
+            self.assertFalse(session.rankings.filter(user=self.user3).exists())
+        self.assertEqual(RoomRanking.objects.get(room=room, user=self.user2).rank, 1)
+        self.assertFalse(TrackTodo.objects.filter(user=self.user3).exists())
+
+
 class TestSessionModel(TestCase):
 
     @classmethod
@@ -183,6 +217,36 @@ class TestSessionModel(TestCase):
         self.assertTrue(exists)
 
 
+    def test_session_clean_queries(self):
+        session = Session.objects.create(room=self.room1, name='testsession', started_at=timezone.now())
+        self.room1.members.add(self.user1)
+        session.members.add(self.user1)
+
+        # a member that left the room
+        session.members.add(self.user2)
+        with self.assertRaises(ValidationError) as context:
+            session.clean()
+        self.assertIn("Member not in room", str(context.exception))
+        session.members.remove(self.user2)
+
+        # the cost does not depend on the history of the room
+        with CaptureQueriesContext(connection) as few:
+            session.clean()
+        Session.objects.bulk_create([
+            Session(room=self.room1, name=f'old{i}', finished_at=timezone.now() - timezone.timedelta(days=1))
+            for i in range(20)
+        ])
+        with CaptureQueriesContext(connection) as many:
+            session.clean()
+        self.assertEqual(len(few), len(many))
+
+        # a session ending in the future is still active
+        session.finished_at = timezone.now() + timezone.timedelta(hours=1)
+        session.save()
+        with self.assertRaises(ValidationError):
+            Session.objects.create(room=self.room1, name='another session')
+
+
 class TodoTest(TestCase):
 
     def test_filled_today(self):
@@ -248,6 +312,34 @@ class TodoTest(TestCase):
 
 
 
+    def test_tracking_denormalized_columns(self):
+        user = CustomUser.objects.create_user(
+            username = 'ame',
+            password = 'itsmeprash'
+        )
+        room = Room.objects.create(name='testroom1', admin=user)
+        session = Session.objects.create(room=room, name='testsession', started_at=timezone.now())
+        todo = Todo.objects.create(user=user, session=session, task='a test name')
+
+        track = TrackTodo.objects.create(todo=todo, hours=2)
+        self.assertEqual(track.user, user)
+        self.assertEqual(track.session, session)
+        self.assertEqual(track.room, room)
+
+        # rows written before the columns existed are filled by the backfill
+        TrackTodo.objects.update(user=None, session=None, room=None)
+        self.assertEqual(TrackTodo.backfill_denormalized(), 1)
+        track.refresh_from_db()
+        self.assertEqual((track.user, track.session, track.room), (user, session, room))
+
+        # and by migrate, the stats count them again
+        TrackTodo.objects.update(user=None, session=None, room=None)
+        self.assertEqual(user.total_hours, 0)
+        call_command('migrate', verbosity=0)
+        self.assertEqual(user.total_hours, 2)
+        self.assertEqual(session.total_hours, {user: 2})
+
+
 class IntegratedTestFlow(TestCase):
 
     @classmethod
@@ -0,0 +1,46 @@
+from django.test import TestCase
+from django.core.management import call_command, CommandError
+from django.db import connection
+from pages.models import CustomUser, Room, Session, Todo, TrackTodo
+from pages import partitions
+from django.utils import timezone
+from datetime import date, timedelta
+
+
+class TestTrackingPartitions(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username = 'ame',
+            password = 'itsmeprash'
+        )
+        cls.room = Room.objects.create(name='testroom', admin=cls.user)
+        cls.session = Session.objects.create(name='testsession', room=cls.room, started_at=timezone.now())
+        cls.todo = Todo.objects.create(user=cls.user, session=cls.session, task='a task')
+
+    def test_partition_names(self):
+        self.assertEqual(partitions.add_months(date(2025, 11, 15), 2), date(2026, 1, 1))
+        self.assertEqual(partitions.add_months(date(2025, 1, 31), -1), date(2024, 12, 1))
+        self.assertEqual(partitions.partition_name(date(2025, 3, 1)), 'pages_tracktodo_p2025_03')
+
+    def test_between(self):
+        today = timezone.localdate()
+        TrackTodo.objects.create(todo=self.todo, hours=1, day=today - timedelta(days=10))
+        TrackTodo.objects.create(todo=self.todo, hours=2, day=today)
+
+        self.assertEqual(TrackTodo.objects.between(today - timedelta(days=1), today).count(), 1)
+        self.assertEqual(TrackTodo.objects.between(today - timedelta(days=10), today).count(), 2)
+
+    def test_for_session_is_bounded_by_the_end(self):
+        TrackTodo.objects.create(todo=self.todo, hours=1)
+        self.assertEqual(TrackTodo.objects.for_session(self.session).count(), 1)
+
+        query = str(TrackTodo.objects.for_session(Session(finished_at=timezone.now())).query)
+        self.assertIn('"day" <=', query)
+
+    def test_command_requires_postgres(self):
+        if partitions.is_supported(connection):
+            self.skipTest('runs on postgres')
+        with self.assertRaises(CommandError):
+            call_command('tracking_partitions')
@@ -2,6 +2,15 @@ from django.urls import reverse_lazy
 from django.test import TestCase
 from pages.models import CustomUser, Room, Session, SessionRanking, RoomRanking, Todo, TrackTodo
 import json
+from unittest.mock import patch
+from django.test import RequestFactory, override_settings
+from pages import join_guard
+from pages.join_guard import verify_join, JoinThrottled
+import threading
+import time
+from django.utils import timezone
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 
 class TestRoomViews(TestCase):
@@ -166,6 +175,121 @@ class TestRoomViews(TestCase):
         self.assertEqual(response.status_code, 403)
 
 
+    @override_settings(ROOM_JOIN_MAX_ATTEMPTS=2)
+    def test_join_room_rate_limit(self):
+        url = self.join_room_url
+        room = self.create_room(admin=self.user1)
+        self.login()
+
+        for _ in range(2):
+            response = self.client.post(url, {'name': room.name, 'password': 'wrong'})
+            self.assertContains(response, 'Wrong Password')
+
+        # the right password is not even checked once the attempts are used up
+        with patch('pages.join_guard.check_password') as check:
+            response = self.client.post(url, {'name': room.name, 'password': 'itsatestpass'})
+            check.assert_not_called()
+        self.assertContains(response, 'Too many join attempts')
+        self.assertNotIn(self.user, room.members.all())
+
+    def test_join_room_verified_cache(self):
+        room = self.create_room(admin=self.user1)
+        request = RequestFactory().post(self.join_room_url)
+        request.user = self.user
+
+        self.assertTrue(verify_join(request, room, 'itsatestpass'))
+        with patch('pages.join_guard.check_password') as check:
+            self.assertTrue(verify_join(request, room, 'itsatestpass'))
+            check.assert_not_called()
+
+        # a new password drops the cached verification
+        room.password = 'anotherpass'
+        room.save()
+        self.assertFalse(verify_join(request, room, 'itsatestpass'))
+
+    def test_join_room_verified_cache_checks_password(self):
+        room = self.create_room(admin=self.user1)
+        request = RequestFactory().post(self.join_room_url)
+        request.user = self.user
+
+        self.assertTrue(verify_join(request, room, 'itsatestpass'))
+        # a remembered success does not open the room with another password
+        self.assertFalse(verify_join(request, room, 'WRONG'))
+
+        # nor is it kept once the user is removed
+        room.members.add(self.user)
+        room.remove_member(self.user.id)
+        with patch('pages.join_guard.check_password', return_value=False) as check:
+            self.assertFalse(verify_join(request, room, 'itsatestpass'))
+            check.assert_called_once()
+
+    @override_settings(ROOM_JOIN_HASH_TIMEOUT=0.01)
+    def test_join_room_hash_timeout_keeps_slot(self):
+        room = self.create_room(admin=self.user1)
+        request = RequestFactory().post(self.join_room_url)
+        request.user = self.user
+        free = join_guard._slots._value
+        hashing = threading.Event()
+
+        with patch('pages.join_guard.check_password', side_effect=lambda *args: hashing.wait(5)):
+            with self.assertRaises(JoinThrottled):
+                verify_join(request, room, 'itsatestpass')
+            # the timed out check is still hashing and holds its slot
+            self.assertEqual(join_guard._slots._value, free - 1)
+            hashing.set()
+            for _ in range(100):
+                if join_guard._slots._value == free:
+                    break
+                time.sleep(0.01)
+        self.assertEqual(join_guard._slots._value, free)
+
+    @override_settings(ROOM_HISTORY_PER_PAGE=3)
+    def test_room_history(self):
+        room = self.create_room(admin=self.user)
+        now = timezone.now()
+        sessions = Session.objects.bulk_create([
+            Session(room=room, name=f'old{i}', started_at=now - timezone.timedelta(days=30),
+                    finished_at=now - timezone.timedelta(days=i + 1))
+            for i in range(7)
+        ])
+        sessions[0].members.add(self.user)
+        self.login()
+
+        response = self.client.get(self.room_url(room.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([session.name for session in response.context['old_sessions']], ['old0', 'old1', 'old2'])
+        self.assertEqual(response.context['old_sessions'][0].member_count, 1)
+
+        names = []
+        cursor = response.context['history_cursor']
+        while cursor:
+            data = self.client.get(reverse_lazy('room-history', kwargs={'room_id': room.id}), {'cursor': cursor}).json()
+            names += [session['name'] for session in data['sessions']]
+            cursor = data['next']
+        self.assertEqual(names, ['old3', 'old4', 'old5', 'old6'])
+
+        response = self.client.get(reverse_lazy('room-history', kwargs={'room_id': room.id}), {'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_room_view_queries(self):
+        room = self.create_room(admin=self.user)
+        self.login()
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(self.room_url(room.id))
+            return len(queries)
+
+        count_queries()
+        few = count_queries()
+        Session.objects.bulk_create([
+            Session(room=room, name=f'old{i}', finished_at=timezone.now() - timezone.timedelta(days=1))
+            for i in range(30)
+        ])
+        room.members.add(self.user1, self.user2)
+        room.updateRoomRankings()
+        self.assertEqual(count_queries(), few)
+
     def test_room_update(self):
         room = self.create_room()
         room.members.add(self.user2)
@@ -1,9 +1,14 @@
 from django.urls import reverse_lazy
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from pages.models import CustomUser, Room, Session, SessionRanking, RoomRanking, Todo, TrackTodo
 import json
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from django.db import connection
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
+from pages.logics import end_session_logic
+from types import SimpleNamespace
 
 
 class TestSessionView(TestCase):
@@ -372,6 +377,36 @@ class TestSessionView(TestCase):
         self.assertIsNotNone(session.started_at)
         self.assertIsNone(session.finished_at)
 
+
+    def test_end_session_closes_todos_and_ranks(self):
+        session = self.create_usuable_session_with_members()
+        session.started_at = timezone.now()
+        session.save()
+
+        todo1 = Todo.objects.create(user=self.user1, session=session, task='task1')
+        todo2 = Todo.objects.create(user=self.user2, session=session, task='task2')
+        Todo.objects.create(user=self.user2, session=session, task='task3', completed=True)
+        TrackTodo.objects.create(todo=todo1, hours=2)
+        TrackTodo.objects.create(todo=todo2, hours=5)
+
+        def end_with_new_todos(count):
+            Todo.objects.bulk_create([Todo(user=self.user1, session=session, task='bulk') for _ in range(count)])
+            Session.objects.filter(id=session.id).update(finished_at=None)
+            with CaptureQueriesContext(connection) as queries:
+                end_session_logic(SimpleNamespace(user=self.user), session.id)
+            return len(queries)
+
+        # the number of queries does not grow with the number of todos
+        self.assertEqual(end_with_new_todos(1), end_with_new_todos(30))
+
+        session.refresh_from_db()
+        self.assertFalse(session.is_active)
+        self.assertFalse(session.todos.filter(completed=False).exists())
+        self.assertEqual(Todo.objects.get(id=todo1.id).completed_on, timezone.localdate())
+
+        rankings = list(session.rankings.values_list('user', 'rank', 'total_hours'))
+        self.assertEqual(rankings[:2], [(self.user2.id, 1, 5), (self.user1.id, 2, 2)])
+        self.assertEqual(RoomRanking.objects.get(room=session.room, user=self.user2).rank, 1)
     
     def test_session_update(self):
         session = self.create_usuable_session_with_members()
@@ -411,6 +446,47 @@ class TestSessionView(TestCase):
         self.assertNotEqual(session.description, data['description'])
 
 
+    def test_session_view_queries(self):
+        session = self.create_usuable_session_with_members()
+        session.started_at = timezone.now()
+        session.save()
+        todo = Todo.objects.create(session=session, user=self.user, task='mine')
+        TrackTodo.objects.create(todo=todo, hours=2)
+        self.login()
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.session_url(session.id))
+            self.assertEqual(response.status_code, 200)
+            return len(queries), response
+
+        count_queries()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.session_url(session.id))
+        # the session is fetched once, by the membership check
+        session_fetches = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('SELECT "pages_session"."id"') and 'INNER JOIN "pages_room"' in query['sql']
+        ]
+        self.assertEqual(len(session_fetches), 1)
+        few, response = count_queries()
+        self.assertEqual(response.context['my_tasks'][0].hours_today, 2)
+        self.assertEqual(response.context['my_tasks'][0].hours_total, 2)
+
+        for user in (self.user, self.user1, self.user2):
+            for i in range(5):
+                todo = Todo.objects.create(session=session, user=user, task=f'task{i}')
+                TrackTodo.objects.create(todo=todo, day=timezone.localdate() - timezone.timedelta(days=1), hours=1)
+
+        many, response = count_queries()
+        self.assertEqual(many, few)
+        self.assertEqual(len(response.context['my_tasks']), 6)
+        user1 = next(member for member in response.context['other_members'] if member == self.user1)
+        self.assertEqual(len(user1.session_todos), 5)
+        self.assertEqual(user1.total_hours_all, 5)
+        self.assertEqual(user1.total_hours_today, 0)
+        self.assertFalse(user1.is_active_today)
+
     def test_dashboard_status(self):
         session = self.create_usuable_session_with_members()
         url = self.dashboard_url
@@ -420,6 +496,54 @@ class TestSessionView(TestCase):
 
         self.assertEqual(response.status_code, 200)
 
+    @override_settings(DASHBOARD_PAST_SESSIONS_PER_PAGE=2)
+    def test_dashboard_summary(self):
+        # the versions are bumped on commit, which the test transaction never does
+        cache.clear()
+        session = self.create_usuable_session_with_members()
+        session.started_at = timezone.now()
+        session.save()
+        todo = Todo.objects.create(user=self.user, session=session, task='task')
+        TrackTodo.objects.create(todo=todo, hours=3)
+
+        past_sessions = Session.objects.bulk_create([
+            Session(
+                room=session.room, name=f'past{i}',
+                started_at=timezone.now() - timezone.timedelta(days=10),
+                finished_at=timezone.now() - timezone.timedelta(days=i + 1),
+            )
+            for i in range(3)
+        ])
+        self.user.sessions.add(*past_sessions)
+
+        self.login()
+        response = self.client.get(self.dashboard_url)
+        self.assertEqual(response.context['total_sessions'], 4)
+        self.assertEqual(response.context['past_count'], 3)
+        self.assertEqual(len(response.context['past_sessions']), 2)
+        self.assertEqual(response.context['num_pages'], 2)
+
+        active = response.context['active_sessions'][0]
+        self.assertEqual(active.member_count, 3)
+        self.assertEqual(active.my_hours, 3)
+        self.assertEqual(active.open_todos, 1)
+
+        # served from the cache
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.dashboard_url)
+        self.assertFalse([query for query in queries if '"pages_session"' in query['sql']])
+
+        # invalidated when the user's sessions change, once the change commits
+        with self.captureOnCommitCallbacks(execute=True):
+            TrackTodo.objects.create(todo=todo, hours=2)
+            response = self.client.get(self.dashboard_url)
+            self.assertEqual(response.context['active_sessions'][0].my_hours, 3)
+        response = self.client.get(self.dashboard_url)
+        self.assertEqual(response.context['active_sessions'][0].my_hours, 5)
+
+        response = self.client.get(self.dashboard_url, {'page': 2})
+        self.assertEqual([s.name for s in response.context['past_sessions']], ['past2'])
+
     
     
 
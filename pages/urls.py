@@ -8,6 +8,7 @@ urlpatterns = [
     path("createroom/", RoomCreateView.as_view(), name="createroom"),
     path("joinroom/", RoomJoinView.as_view(), name="joinroom"),
     path("room/<str:room_id>/", RoomView.as_view(), name="room"),
+    path("room/<str:room_id>/history/", RoomHistoryView.as_view(), name="room-history"),
     path("room/<str:room_id>/settings", RoomSettingsView.as_view(), name="room-settings"),
     path("room/<str:room_id>/edit", RoomUpdateView.as_view(), name="update-room-info"),
     path("room/<str:room_id>/changepass", ChangeRoomPasswordView.as_view(), name="change-room-pass"),
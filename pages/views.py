@@ -1,11 +1,13 @@
 from django.shortcuts import render 
 from django.views.generic import TemplateView , CreateView, FormView, DetailView, ListView, UpdateView
 from . models import Room, Session, CustomUser
-from django.urls import reverse_lazy
+from django.urls import reverse_lazy, reverse
+from django.http import JsonResponse
+from django.core.exceptions import ValidationError
 from .forms import RoomJoinForm, ChangeRoomPasswordForm
 from django.contrib.auth.mixins import LoginRequiredMixin
-from datetime import date
 from .mixins import MemberRequiredMixin, AdminPermRequired, NotDemoUserMixin
+from .queries import dashboard_summary, active_room_sessions, room_history
 from stats.models import Notice
 from django.views import View
 from django.contrib import messages
@@ -34,6 +36,11 @@ class RoomJoinView(LoginRequiredMixin, NotDemoUserMixin,FormView):
     template_name = 'room/joinroom.html'
     form_class = RoomJoinForm
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['request'] = self.request
+        return kwargs
+
     def form_valid(self, form):
         room = form.cleaned_data['room']
         self.room = room
@@ -52,14 +59,45 @@ class RoomView(LoginRequiredMixin,MemberRequiredMixin,DetailView):
     context_object_name = 'room'
     model = Room
     pk_url_kwarg = 'room_id'
+    queryset = Room.objects.select_related('admin')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        room_id = self.kwargs.get('room_id')
-        context['active_sessions'] = Session.objects.filter(room_id=room_id, finished_at__isnull= True)
-        context['old_sessions'] = Session.objects.filter(room_id=room_id, finished_at__lte=date.today())
-
+        room = self.object
+        context['active_sessions'] = active_room_sessions(room)
+        # the rest of the history is loaded from RoomHistoryView
+        context['old_sessions'], context['history_cursor'] = room_history(room)
+        context['rankings'] = room.rankings.select_related('user')
+        context['members'] = list(room.members.all())
         return context
+
+
+class RoomHistoryView(LoginRequiredMixin, MemberRequiredMixin, View):
+    """json pages of the finished sessions of a room, ?cursor= comes from the previous page"""
+
+    def get(self, request, room_id):
+        room = get_object_or_404(Room, id=room_id)
+        try:
+            sessions, cursor = room_history(room, request.GET.get('cursor'))
+        except (ValueError, ValidationError):
+            return JsonResponse({'error': 'invalid cursor'}, status=400)
+
+        return JsonResponse({
+            'sessions': [
+                {
+                    'id': session.id,
+                    'name': session.name,
+                    'url': reverse('session', kwargs={'session_id': session.id}),
+                    'finished_at': session.finished_at,
+                    'member_count': session.member_count,
+                    'total_hours': session.hours_total,
+                    'top_user': session.top_user,
+                    'top_hours': session.top_hours,
+                }
+                for session in sessions
+            ],
+            'next': cursor,
+        })
     
 class RoomSettingsView(LoginRequiredMixin,MemberRequiredMixin,DetailView):
     template_name = 'room/room_settings.html'
@@ -137,17 +175,5 @@ class DashboardView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        sessions = Session.objects.filter(members = self.request.user).all()
-        active_sessions = []
-        past_sessions = []
-
-        for i in sessions:
-            if i.is_active:
-                active_sessions.append(i)
-            else:
-                past_sessions.append(i)
-        
-        context['sessions'] = sessions
-        context['active_sessions'] = active_sessions
-        context['past_sessions'] = past_sessions
+        context.update(dashboard_summary(self.request.user, self.request.GET.get('page', 1)))
         return context
@@ -5,7 +5,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin as LRM
 from django.shortcuts import get_object_or_404 , redirect, HttpResponse, render
 from django.utils import timezone
 from datetime import datetime
-from django.http import HttpResponseRedirect , HttpResponseNotAllowed, JsonResponse
+from django.http import HttpResponseRedirect , HttpResponseNotAllowed, JsonResponse, Http404
 from .mixins import MemberRequiredMixin, AdminPermRequired, NotDemoUserMixin
 from django.core.exceptions import PermissionDenied
 from stats.models import Notice
@@ -13,6 +13,7 @@ from django.shortcuts import get_object_or_404
 import json
 from .decorators import not_demo_user
 from .logics import *
+from .queries import session_todos, session_members
 from django.core.exceptions import ValidationError
         
 
@@ -115,26 +116,46 @@ class SessionCreate(LRM,NotDemoUserMixin,AdminPermRequired,CreateView):
 class SessionView(LRM,MemberRequiredMixin,DetailView):
     model = Session
     pk_url_kwarg = 'session_id'
-    today = timezone.localdate()
+    queryset = Session.objects.select_related('room__admin')
 
-    def dispatch(self, request, *args, **kwargs):
+    def get_object(self, queryset=None):
+        # loaded with its room by MemberRequiredMixin.dispatch
+        if self.session is None:
+            raise Http404("No session found matching the query")
+        return self.session
+
+    def finished_redirect(self):
         if not self.get_object().is_active:
             return redirect('session-stats', self.kwargs.get('session_id'))
-        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        return self.finished_redirect() or super().get(request, *args, **kwargs)
 
     def get_template_names(self):
         return ['session/session_detail.html']
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['my_tasks'] = Todo.objects.filter(session = self.object, user = self.request.user)
-        context['other_members'] = self.object.members.exclude(id= self.request.user.id)
-        context['today'] = self.today
+        today = timezone.localdate()
+        todos = list(session_todos(self.object, today))
+        members = session_members(self.object, todos, today)
+        user_id = self.request.user.id
+
+        context['members'] = members
+        context['is_member'] = any(member.id == user_id for member in members)
+        context['my_tasks'] = [todo for todo in todos if todo.user_id == user_id]
+        context['other_members'] = [member for member in members if member.id != user_id]
+        context['rankings'] = self.object.rankings.select_related('user')
+        context['today'] = today
         return context
 
 
 
     def post(self, *args, **kwargs):
+        finished = self.finished_redirect()
+        if finished:
+            return finished
+
         def time_to_hours(time_str):
             time_str = time_str.strip().lower()
             hours = 0
@@ -159,7 +180,7 @@ class SessionView(LRM,MemberRequiredMixin,DetailView):
             if (todo_inst.user != self.request.user):
                 raise PermissionDenied("You are not the owner of the todo")
             if  not todo_inst.completed:
-                TrackTodo.objects.create(todo = todo_inst, day= self.today, hours = hours )  
+                TrackTodo.objects.create(todo = todo_inst, day= timezone.localdate(), hours = hours )  
             
         return HttpResponseRedirect(self.request.path) 
             
@@ -1,12 +1,37 @@
 from django.contrib import admin
-from .models import Notice, NoticeReadStatus
+from django.db.models import Q
+from .models import Notice, NoticeReadStatus, NoticeReadWatermark, NoticeArchive
+from . import search
 
 # Register your models here.
 
-class NoticeAdmin(admin.ModelAdmin):
+class FullTextSearchMixin:
+    """
+    searches the indexed text with search.search instead of icontains scans, the
+    other `search_fields` (names of related rows) are searched as usual and both
+    matches are listed. `text_search_fields` are used when full-text is not available.
+    """
+    text_search_fields = []
+
+    def get_search_fields(self, request):
+        search_fields = list(super().get_search_fields(request))
+        if search.is_supported():
+            return search_fields
+        return search_fields + self.text_search_fields
+
+    def get_search_results(self, request, queryset, search_term):
+        by_fields, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if not search_term or not search.is_supported():
+            return by_fields, may_have_duplicates
+        matches = search.search(queryset, search_term)
+        return queryset.filter(Q(pk__in=by_fields.values('pk')) | Q(pk__in=matches.values('pk'))), False
+
+
+class NoticeAdmin(FullTextSearchMixin, admin.ModelAdmin):
     model = Notice
-    list_display = ['room', 'author', 'title', 'is_pinned', 'created_on', 'is_posted_today']
-    search_fields = ['room', 'author', 'title', 'content', 'created_on']
+    list_display = ['room', 'author', 'title', 'event', 'is_pinned', 'created_on', 'is_posted_today']
+    search_fields = ['room__name', 'author__username', 'created_on']
+    text_search_fields = ['title', 'content']
 
 class NoticeReadAdmin(admin.ModelAdmin):
     model = NoticeReadStatus
@@ -16,3 +41,13 @@ class NoticeReadAdmin(admin.ModelAdmin):
 admin.site.register(Notice, NoticeAdmin)
 admin.site.register(NoticeReadStatus)
 
+class NoticeReadWatermarkAdmin(admin.ModelAdmin):
+    list_display = ['user', 'room', 'read_until', 'updated_on']
+
+admin.site.register(NoticeReadWatermark, NoticeReadWatermarkAdmin)
+
+class NoticeArchiveAdmin(admin.ModelAdmin):
+    list_display = ['room', 'period_start', 'period_end', 'count', 'archived_on']
+    exclude = ['payload']
+
+admin.site.register(NoticeArchive, NoticeArchiveAdmin)
@@ -0,0 +1,283 @@
+"""
+Read side services for the stats pages.
+
+Each service loads what a page needs in a few grouped queries and derives
+the figures in memory, so the number of queries does not grow with the
+number of members, todos or tracked days.
+"""
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from django.db.models import Q, F, Avg, Sum, Count, FloatField, Value, OuterRef, Subquery, FilteredRelation
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from pages.models import Room, Session, TrackTodo, RoomRanking, SessionRanking, RoomArchiveTotal
+
+
+def _local_date(value):
+    return timezone.localtime(value).date() if isinstance(value, datetime) else value
+
+
+def longest_streak(hours):
+    """the longest run of days with hours"""
+    longest = current = 0
+    for value in hours:
+        current = current + 1 if value > 0 else 0
+        longest = max(longest, current)
+    return longest
+
+
+class SessionMemberStats:
+    """
+    Stats of one member of a session, from four queries whatever the size of the
+    session: the member ids, the hours of every member, the daily hours of the
+    member and the todos of the member with their hours.
+    """
+    TOP_TASKS = 15
+
+    def __init__(self, session, user, today=None):
+        self.session = session
+        self.user = user
+        self.today = today or timezone.localdate()
+
+        tracks = TrackTodo.objects.for_session(session)
+        self.member_ids = list(session.members.values_list('id', flat=True))
+        totals = dict(tracks.values_list('user').annotate(total=Sum('hours')).order_by())
+        # in member order, like Session.current_rankings
+        self.member_totals = [(member_id, totals.get(member_id, 0)) for member_id in self.member_ids]
+        self.daily = dict(
+            tracks.filter(user=user).values_list('day').annotate(hours=Sum('hours')).order_by('day')
+        )
+        self.todos = list(
+            session.todos.filter(user=user)
+            .annotate(hours=Coalesce(Sum('tracking__hours'), Value(0.0), output_field=FloatField()))
+            .order_by('created_on')
+        )
+
+        self.days = self._days()
+        self.hours = [self.daily.get(day, 0) for day in self.days]
+
+    @property
+    def is_member(self):
+        return self.user.id in self.member_ids
+
+    def _days(self):
+        """every day from the first to the last tracked day, stretched to the session bounds"""
+        start = _local_date(self.session.started_at)
+        end = _local_date(self.session.finished_at)
+        if self.daily:
+            first, last = min(self.daily), max(self.daily)
+            start = min(start, first) if start else first
+            end = max(end, last) if end else last
+        else:
+            start = start or self.today
+            end = end or self.today
+        return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+    # derived figures
+
+    @property
+    def total_hours(self):
+        return sum(todo.hours for todo in self.todos)
+
+    @property
+    def completed_tasks(self):
+        return sum(1 for todo in self.todos if todo.completed)
+
+    @property
+    def rank(self):
+        ranking = sorted(self.member_totals, key=lambda item: item[1], reverse=True)
+        for rank, (member_id, _) in enumerate(ranking, 1):
+            if member_id == self.user.id:
+                return rank
+        return None
+
+    @property
+    def percentile(self):
+        """share of the other members with fewer hours"""
+        others = [total for member_id, total in self.member_totals if member_id != self.user.id]
+        if not others:
+            return 100
+        own = dict(self.member_totals).get(self.user.id, 0)
+        return round(100 * sum(1 for total in others if total < own) / len(others))
+
+    @property
+    def session_average(self):
+        if not self.member_totals:
+            return 0
+        return sum(total for _, total in self.member_totals) / len(self.member_totals)
+
+    @property
+    def top_hours(self):
+        return max((total for _, total in self.member_totals), default=0)
+
+    @property
+    def current_streak(self):
+        """days with hours up to the last day, today does not break it before anything is tracked"""
+        hours = self.hours
+        if self.days and self.days[-1] == self.today and not hours[-1]:
+            hours = hours[:-1]
+        streak = 0
+        for value in reversed(hours):
+            if value <= 0:
+                break
+            streak += 1
+        return streak
+
+    # page data
+
+    def basic_stats(self):
+        completed = self.completed_tasks
+        return {
+            'session_name': self.session.name,
+            'user_name': self.user.username,
+            'user_total_hours': round(self.total_hours, 1),
+            'user_active_tasks': len(self.todos) - completed,
+            'user_completed_tasks': completed,
+            'user_total_tasks': len(self.todos),
+            'user_rank': self.rank,
+            'total_members': len(self.member_ids),
+            'session_status': 'Active' if self.session.is_active else 'Completed',
+            'started_at': self.session.started_at,
+            'finished_at': self.session.finished_at,
+        }
+
+    def daily_hours(self):
+        return {'labels': self.days, 'data': self.hours}
+
+    def daily_cumulative_hours(self):
+        return {'labels': self.days, 'data': list(accumulate(self.hours))}
+
+    def tasks(self):
+        tasks = sorted((todo for todo in self.todos if todo.hours > 0), key=lambda todo: todo.hours, reverse=True)
+        tasks = [
+            {
+                'task': todo.task[:30] + "..." if len(todo.task) > 30 else todo.task,
+                'hours': todo.hours,
+                'completed': todo.completed,
+            }
+            for todo in tasks[:self.TOP_TASKS]
+        ] or [{'task': 'No tasks yet', 'hours': 0, 'completed': False}]
+        return {
+            'labels': [task['task'] for task in tasks],
+            'data': [task['hours'] for task in tasks],
+            'completed': [task['completed'] for task in tasks],
+        }
+
+    def comparison(self):
+        return {
+            'labels': ['You', 'Session Average', 'Top Performer'],
+            'data': [round(self.total_hours, 1), round(self.session_average, 1), round(self.top_hours, 1)],
+            'colors': ['#36A2EB', '#FFCE56', '#FF6384'],
+        }
+
+    def summary(self):
+        active_days = sum(1 for value in self.hours if value > 0) or 1
+        best_hours = max(self.hours, default=0)
+        best_day = self.days[self.hours.index(best_hours)].strftime('%A') if best_hours > 0 else 'N/A'
+        session_average = self.session_average
+        return {
+            'user_daily_avg': round(self.total_hours / active_days, 1),
+            'best_day': best_day,
+            'best_day_hours': round(best_hours, 1),
+            'user_completion_rate': round(self.completed_tasks / len(self.todos) * 100) if self.todos else 0,
+            'user_longest_streak': longest_streak(self.hours),
+            'user_current_streak': self.current_streak,
+            'active_days': active_days,
+            'above_average': self.total_hours > session_average,
+            'session_average': round(session_average, 1),
+            'user_rank': self.rank,
+            'user_percentile': self.percentile,
+            'total_members': len(self.member_ids),
+        }
+
+
+# rooms and sessions of a user
+
+def _user_hours(user, field):
+    """hours of the user in the room or session of the outer query, along the (field, user, hours) index"""
+    return Subquery(
+        TrackTodo.objects.filter(user=user, **{field: OuterRef('pk')})
+        .values(field).annotate(total=Sum('hours')).values('total')[:1],
+        output_field=FloatField(),
+    )
+
+
+def room_performance(user):
+    """
+    rooms of the user with their `hours` (archived sessions included), `todos_count`,
+    `completed_todos` and `current_rank` for the user, in one grouped query whatever
+    the number of rooms
+    """
+    own_todos = Q(sessions__todos__user=user)
+    archived = Subquery(
+        RoomArchiveTotal.objects.filter(user=user, room=OuterRef('pk')).values('total_hours')[:1],
+        output_field=FloatField(),
+    )
+    return Room.objects.filter(members=user).annotate(
+        ranking=FilteredRelation('rankings', condition=Q(rankings__user=user)),
+    ).annotate(
+        hours=Coalesce(_user_hours(user, 'room'), Value(0.0)) + Coalesce(archived, Value(0.0)),
+        todos_count=Count('sessions__todos', filter=own_todos),
+        completed_todos=Count('sessions__todos', filter=own_todos & Q(sessions__todos__completed=True)),
+        current_rank=F('ranking__rank'),
+    ).order_by('name')
+
+
+def top_sessions(user, limit=10):
+    """
+    the `limit` sessions the user spent the most hours in, with `hours`,
+    `todos_count` and `completed_todos`, selected in one grouped query
+    """
+    own_todos = Q(todos__user=user)
+    return Session.objects.filter(members=user).select_related('room').annotate(
+        hours=_user_hours(user, 'session'),
+        todos_count=Count('todos', filter=own_todos),
+        completed_todos=Count('todos', filter=own_todos & Q(todos__completed=True)),
+    ).filter(hours__gt=0).order_by('-hours')[:limit]
+
+
+# rankings of a user
+
+RANK_BUCKETS = {
+    'rank_1': Q(rank=1),
+    'rank_2_3': Q(rank__in=[2, 3]),
+    'rank_4_10': Q(rank__range=[4, 10]),
+    'rank_10_plus': Q(rank__gt=10),
+}
+
+
+def rank_distribution(rankings):
+    """average rank, number of rankings and their distribution over RANK_BUCKETS in one conditional aggregate"""
+    figures = rankings.aggregate(
+        average=Avg('rank'),
+        total=Count('id'),
+        **{name: Count('id', filter=condition) for name, condition in RANK_BUCKETS.items()},
+    )
+    return {
+        'average': round(figures.pop('average') or 0, 1),
+        'total': figures.pop('total'),
+        'distribution': figures,
+    }
+
+
+def _top(rankings, field, top_rank):
+    return [
+        {'id': str(object_id), 'name': name, 'rank': rank, 'total_hours': total_hours}
+        for object_id, name, rank, total_hours in rankings.filter(rank__lte=top_rank).order_by('rank')
+            .values_list(field, f'{field}__name', 'rank', 'total_hours')
+    ]
+
+
+def ranking_analytics(user, top_rank=3):
+    """
+    room and session rank figures of the user, ready to be serialized: one aggregate
+    query per ranking table plus one for its top performances (rank up to `top_rank`)
+    """
+    rooms = RoomRanking.objects.filter(user=user)
+    sessions = SessionRanking.objects.filter(user=user)
+    return {
+        'rooms': {**rank_distribution(rooms), 'top': _top(rooms, 'room', top_rank)},
+        'sessions': {**rank_distribution(sessions), 'top': _top(sessions, 'session', top_rank)},
+    }
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class StatsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'stats'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from .search import install_after_migrate
+        # the search columns and tables are not part of the models
+        post_migrate.connect(install_after_migrate, sender=self)
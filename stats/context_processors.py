@@ -0,0 +1,19 @@
+from django.utils.functional import SimpleLazyObject
+
+from .read_state import unread_counts
+
+
+def unread_notices(request):
+    """
+    `unread_notices` with the unread notice count of every room of the user and their total,
+    only queried when a template uses it
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+
+    def summary():
+        rooms = unread_counts(user)
+        return {'rooms': rooms, 'total': sum(rooms.values())}
+
+    return {'unread_notices': SimpleLazyObject(summary)}
@@ -1,13 +1,42 @@
 from django.db import models
+from django.db.models import Q, F, Case, When, Value, Exists, OuterRef, Subquery
 from pages.models import Room, CustomUser, RoomMembership
 import uuid
 from django.utils import timezone
+from django.utils.html import strip_tags
 from django.core.exceptions import PermissionDenied
 
 # Create your models here.
+class NoticeQuerySet(models.QuerySet):
+    def with_read_state(self, user):
+        """
+        annotates `user_has_read`, the same answer as Notice.is_read(user) but
+        resolved in the list query itself, for notices of any number of rooms
+        """
+        membership = RoomMembership.objects.filter(room=OuterRef('room'), user=user)
+        watermark = NoticeReadWatermark.objects.filter(room=OuterRef('room'), user=user)
+        read_status = NoticeReadStatus.objects.filter(notice=OuterRef('pk'), user=user)
+        return self.annotate(
+            _joined_on=Subquery(membership.values('joined_on')[:1]),
+            _read_until=Subquery(watermark.values('read_until')[:1]),
+            user_has_read=Case(
+                When(
+                    Q(author_id=user.id)
+                    # not a member, or posted before the user joined
+                    | Q(_joined_on__isnull=True) | Q(created_on__lte=F('_joined_on'))
+                    | Q(created_on__lte=F('_read_until'))
+                    | Q(Exists(read_status)),
+                    then=Value(True)
+                ),
+                default=Value(False),
+                output_field=models.BooleanField(),
+            ),
+        )
+
+
 class Notice(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='notices')
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='notices', db_index=False)
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, blank=True, related_name='notices')
     title = models.CharField(max_length=255)
     content = models.TextField()
@@ -15,10 +44,18 @@ class Notice(models.Model):
     is_admin = models.BooleanField(default=False)
     created_on = models.DateTimeField(auto_now_add=True)
     is_html = models.BooleanField(default=False)
+    objects = NoticeQuerySet.as_manager()
+    # system notices store an event type and its payload, rendered by stats/notice_render.py
+    event = models.CharField(max_length=32, blank=True, default='')
+    payload = models.JSONField(null=True, blank=True)
 
 
     class Meta:
         ordering = ['-is_pinned', '-created_on']
+        indexes = [
+            models.Index(fields=['room', 'created_on'], name='notice_room_created_idx'),
+            models.Index(fields=['room', '-is_pinned', '-created_on'], name='notice_room_order_idx'),
+        ]
 
     def clean(self):
         room = getattr(self, 'room', None)
@@ -35,7 +72,32 @@ class Notice(models.Model):
 
     def save(self, *args, **kwargs):
         self.clean()
-        return super().save( *args, **kwargs)
+        adding = self._state.adding
+        result = super().save( *args, **kwargs)
+        from .recent import notice_saved
+        notice_saved(self, adding)
+        return result
+
+    def delete(self, *args, **kwargs):
+        room_id, notice_id = self.room_id, self.pk
+        result = super().delete(*args, **kwargs)
+        from .recent import notice_deleted
+        notice_deleted(room_id, notice_id)
+        return result
+
+    @property
+    def rendered_title(self):
+        if self.event:
+            from .notice_render import render_notice
+            return render_notice(self)[0]
+        return self.title
+
+    @property
+    def rendered_content(self):
+        if self.event:
+            from .notice_render import render_notice
+            return render_notice(self)[1]
+        return self.content
 
     @property
     def is_posted_today(self):
@@ -43,34 +105,59 @@ class Notice(models.Model):
         return today == self.created_on.date()
     
     def is_read(self, user):
-        if self.author == user:
-            return True
-        read_flag = NoticeReadStatus.objects.filter(notice=self, user=user).exists()
-        if read_flag:
-            return True
-
-        # check if user joined the room before the notice was created
-        joined_before_notification = RoomMembership.objects.filter(
-            room=self.room,
-            user=user,
-            joined_on__lt=self.created_on
-        ).exists()
-
-        # if user joined before the notice, but hasn't read it => unread (False)
-        # if user joined after notice was created => consider it read (True)
-        return not joined_before_notification
+        # lists should use Notice.objects.with_read_state(user) or read_state.resolve_read_state
+        from .read_state import resolve_read_state
+        return resolve_read_state([self], user)[self.pk]
 
     def mark_as_read(self, user):
-        NoticeReadStatus.objects.get_or_create(notice=self, user=user)
+        from .read_state import mark_read
+        mark_read(self, user)
 
     def __str__(self):
-        return f"📌 {self.title} - {self.room.name}"
+        # event notices keep their title in the payload
+        return f"📌 {strip_tags(self.rendered_title)} - {self.room.name}"
     
 
 class NoticeReadStatus(models.Model):
     notice = models.ForeignKey(Notice, on_delete=models.CASCADE, related_name='read_statuses')
-    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notice_reads')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notice_reads', db_index=False)
     read_on = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('notice', 'user')
+        indexes = [
+            models.Index(fields=['user', 'notice'], name='noticeread_user_idx'),
+        ]
+
+
+class NoticeReadWatermark(models.Model):
+    """
+    Every notice of the room created up to `read_until` is read by the user.
+    NoticeReadStatus rows only hold the notices read one by one past it.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notice_watermarks', db_index=False)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='notice_watermarks')
+    read_until = models.DateTimeField()
+    updated_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'room')
+
+
+class NoticeArchive(models.Model):
+    """old system notices of a room, compressed into one row per archival run"""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='notice_archives')
+    period_start = models.DateTimeField()
+    period_end = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    archived_on = models.DateTimeField(auto_now_add=True)
+    # zlib compressed json list of the notices
+    payload = models.BinaryField()
+
+    class Meta:
+        ordering = ['-period_end']
+
+    @property
+    def notices(self):
+        from pages.archive import decompress
+        return decompress(self.payload)
@@ -0,0 +1,290 @@
+"""
+Activity notices.
+
+System notices are stored as an event type plus a small json payload of ids and
+labels instead of prebuilt HTML. They are rendered on read from templates
+compiled once per process, with url reversal cached per route, and the rendered
+HTML is kept per notice in a bounded in-process LRU cache.
+
+Frequent events (joins, leaves, tasks) are coalesced: an event following the
+last notice of the same event in the room within NOTICE_COALESCE_WINDOW is
+folded into that notice, which becomes a digest.
+"""
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import transaction
+from django.template import Context, Engine
+from django.urls import get_script_prefix, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from django.utils.http import RFC3986_SUBDELIMS
+
+from . import recent
+from .models import Notice, NoticeReadStatus
+
+
+# event type -> (title, content) templates
+EVENTS = {
+    'room_joined': (
+        "{{ user }} has joined the room",
+        "<strong>{{ user }}</strong> just joined <em>{{ room }}</em>. Welcome aboard!",
+    ),
+    'members_updated': (
+        "{{ user }} {% if added %}added {{ added|length }} member{{ added|length|pluralize }}{% endif %}"
+        "{% if added and removed %} and {% endif %}"
+        "{% if removed %}removed {{ removed|length }} member{{ removed|length|pluralize }}{% endif %}",
+        "<strong>{{ user }}</strong>, the room admin, has updated the members of the room."
+        "{% if added %}<br>Welcome aboard: <em>{{ added|slice:':10'|join:', ' }}"
+        "{% if added|length > 10 %} and {{ added|length|add:'-10' }} more{% endif %}</em>{% endif %}"
+        "{% if removed %}<br>Removed: <em>{{ removed|slice:':10'|join:', ' }}"
+        "{% if removed|length > 10 %} and {{ removed|length|add:'-10' }} more{% endif %}</em>{% endif %}",
+    ),
+    'session_joined': (
+        "{{ user }} joined the session",
+        "<strong>{{ user }}</strong> has just joined the session <em>{{ session }}</em>. Welcome!",
+    ),
+    'session_started': (
+        "{{ user }} started the session",
+        "<strong>{{ user }}</strong> has started the session <em>{{ session }}</em>. Let’s get going! 🚀",
+    ),
+    'session_ended': (
+        "{{ user }} ended the session",
+        "<strong>{{ user }}</strong> has ended the session <em>{{ session }}</em>. Congratulations to everyone!"
+        "<h4>📊 Session Rankings</h4><ul>{% for rank, username, hours in session_rankings %}"
+        "<li>{{ rank }}. <strong>{{ username }}</strong> — {{ hours }} hours</li>{% endfor %}</ul>"
+        "<h4>🌐 Room Rankings</h4><ul>{% for rank, username, hours in room_rankings %}"
+        "<li>{{ rank }}. <strong>{{ username }}</strong> — {{ hours }} hours</li>{% endfor %}</ul>",
+    ),
+    'session_created': (
+        "{{ user }} created a new session",
+        "<strong>{{ user }}</strong> has created a new session: <em>{{ session }}</em> 🎉",
+    ),
+    'kicked_from_room': (
+        "{{ other }} was removed from the room",
+        "<strong>{{ user }}</strong>, the room admin, has removed <em>{{ other }}</em> from the room.",
+    ),
+    'kicked_from_session': (
+        "{{ other }} was removed from the {{ session }} session",
+        "<strong>{{ user }}</strong>, the room admin, has removed <em>{{ other }}</em> from the <strong>{{ session }}</strong> session.",
+    ),
+    'left_session': (
+        "{{ user }} has left the {{ session }} session",
+        "<strong>{{ user }}</strong> has left the <em>{{ session }}</em> session.",
+    ),
+    'left_room': (
+        "{{ user }} has left the room",
+        "<strong>{{ user }}</strong> has left the room.",
+    ),
+    'owner_transferred': (
+        "Owner Changed",
+        "<strong>{{ user }}</strong>, the former room admin, has transferred ownership to <strong>{{ other }}</strong>.",
+    ),
+    'task_completed': (
+        "{{ user }} completed a task",
+        "<strong>{{ user }}</strong> completed the task <em>{{ task }}</em> in the <strong>{{ session }}</strong> session.",
+    ),
+    'task_created': (
+        "{{ user }} created a new task",
+        "<strong>{{ user }}</strong> added the task <em>{{ task }}</em> to the <strong>{{ session }}</strong> session.",
+    ),
+}
+
+# events folded into one digest notice when they follow each other within
+# NOTICE_COALESCE_WINDOW, with the templates of the digest
+DIGESTS = {
+    'room_joined': (
+        "{{ users|length }} member{{ users|length|pluralize }} joined the room",
+        "{{ users|join:', ' }} joined <em>{{ events.0.room }}</em>. Welcome aboard!",
+    ),
+    'session_joined': (
+        "{{ users|length }} member{{ users|length|pluralize }} joined sessions {{ count }} times",
+        "<ul>{% for event in events %}<li><strong>{{ event.user }}</strong> joined <em>{{ event.session }}</em></li>{% endfor %}</ul>"
+        "{% if more %}and {{ more }} more{% endif %}",
+    ),
+    'left_session': (
+        "{{ users|length }} member{{ users|length|pluralize }} left sessions {{ count }} times",
+        "<ul>{% for event in events %}<li><strong>{{ event.user }}</strong> left <em>{{ event.session }}</em></li>{% endfor %}</ul>"
+        "{% if more %}and {{ more }} more{% endif %}",
+    ),
+    'left_room': (
+        "{{ users|length }} member{{ users|length|pluralize }} left the room",
+        "{{ users|join:', ' }} left the room.",
+    ),
+    'task_created': (
+        "{{ users|length }} member{{ users|length|pluralize }} created {{ count }} tasks",
+        "<ul>{% for event in events %}<li><strong>{{ event.user }}</strong> added <em>{{ event.task }}</em> to <strong>{{ event.session }}</strong></li>{% endfor %}</ul>"
+        "{% if more %}and {{ more }} more{% endif %}",
+    ),
+    'task_completed': (
+        "{{ users|length }} member{{ users|length|pluralize }} completed {{ count }} tasks",
+        "<ul>{% for event in events %}<li><strong>{{ event.user }}</strong> completed <em>{{ event.task }}</em> in <strong>{{ event.session }}</strong></li>{% endfor %}</ul>"
+        "{% if more %}and {{ more }} more{% endif %}",
+    ),
+}
+# events kept in a digest payload, the count goes on
+DIGEST_EVENTS = 10
+
+# url keyword of the routes notices link to
+ROUTES = {
+    'profile': 'username',
+    'room': 'room_id',
+    'session': 'session_id',
+}
+_PLACEHOLDER = '00000000-0000-0000-0000-000000000000'
+
+
+@lru_cache(maxsize=None)
+def _templates(event, digest=False):
+    engine = Engine.get_default()
+    title, content = (DIGESTS if digest else EVENTS)[event]
+    return engine.from_string(title), engine.from_string(content)
+
+
+@lru_cache(maxsize=None)
+def _route(name, script_prefix):
+    """the url of the route split around its argument, reversed once per route"""
+    head, _, tail = reverse(name, kwargs={ROUTES[name]: _PLACEHOLDER}).partition(_PLACEHOLDER)
+    return head, tail
+
+
+def url_for(name, value):
+    head, tail = _route(name, get_script_prefix())
+    # quoted the same way reverse() quotes arguments
+    return f"{head}{quote(str(value), safe=RFC3986_SUBDELIMS + '/~:@')}{tail}"
+
+
+def _link(name, value, label):
+    return format_html('<a href="{}">{}</a>', url_for(name, value), label)
+
+
+def _links(payload):
+    context = dict(payload)
+    if 'user' in payload:
+        context['user'] = _link('profile', payload['user'], payload['user'])
+    if 'room' in payload:
+        room_id, name = payload['room']
+        context['room'] = _link('room', room_id, name)
+    if 'session' in payload:
+        session_id, name = payload['session']
+        context['session'] = _link('session', session_id, name)
+        if 'task' in payload:
+            context['task'] = _link('session', session_id, payload['task'])
+    return context
+
+
+def _context(payload):
+    if 'count' not in payload:
+        return Context(_links(payload))
+    return Context({
+        'count': payload['count'],
+        'users': [_link('profile', username, username) for username in payload['users']],
+        'events': [_links(event) for event in payload['events']],
+        'more': payload['count'] - len(payload['events']),
+    })
+
+
+class _LRU:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.get(key)
+            if value is not None:
+                self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+_rendered = _LRU(settings.NOTICE_RENDER_CACHE_SIZE)
+
+
+def render_notice(notice):
+    """
+    (title, content) HTML of an event notice. Event notices only change when
+    more events are folded into them, so the id and the event count are the cache key
+    """
+    payload = notice.payload or {}
+    key = (notice.pk, payload.get('count'), get_script_prefix())
+    rendered = _rendered.get(key)
+    if rendered is None:
+        title, content = _templates(notice.event, 'count' in payload)
+        context = _context(payload)
+        rendered = (title.render(context), content.render(context))
+        _rendered.set(key, rendered)
+    return rendered
+
+
+# payloads
+
+def user_ref(user):
+    return user.username
+
+def room_ref(room):
+    return [str(room.id), room.name]
+
+def session_ref(session):
+    return [str(session.id), session.name]
+
+def rankings_ref(rankings):
+    return [[item.rank, item.user.username, item.total_hours] for item in rankings]
+
+
+def _fold(digest, payload):
+    """adds the event `payload` to the payload of an existing notice"""
+    if 'count' not in digest:
+        digest = {'count': 1, 'users': [digest['user']], 'events': [digest]}
+    users = digest['users'] + [payload['user']] if payload['user'] not in digest['users'] else digest['users']
+    return {
+        'count': digest['count'] + 1,
+        'users': users,
+        'events': (digest['events'] + [payload])[-DIGEST_EVENTS:],
+    }
+
+
+def post_notice(room, event, /, **payload):
+    """
+    creates a system notice of `event`, the payload holds the ids and labels its templates need.
+    Frequent events following the last notice of the same event within
+    NOTICE_COALESCE_WINDOW seconds are folded into it instead, the notice then
+    moves up and is unread again.
+    """
+    if event not in EVENTS:
+        raise ValueError(f"unknown notice event {event!r}")
+
+    window = settings.NOTICE_COALESCE_WINDOW
+    if event in DIGESTS and window > 0:
+        now = timezone.now()
+        with transaction.atomic():
+            # only system notices, admin and member posts are never touched
+            last = Notice.objects.select_for_update().filter(
+                room=room, event=event, author__isnull=True, is_pinned=False,
+                created_on__gte=now - timedelta(seconds=window),
+            ).order_by('-created_on').first()
+            if last is not None:
+                last.payload = _fold(last.payload, payload)
+                last.created_on = now
+                # queryset update, created_on is auto_now_add and save() runs clean()
+                Notice.objects.filter(pk=last.pk).update(payload=last.payload, created_on=now)
+                NoticeReadStatus.objects.filter(notice=last).delete()
+                recent.notice_moved(last)
+                return last
+
+    return Notice.objects.create(room=room, event=event, payload=payload, is_html=True)
@@ -1,22 +1,30 @@
-from pages.logics import notice_mark_all_as_seen, get_unread_notices
+from pages.logics import notice_mark_all_as_seen
 from django.views.generic import View
 from pages.mixins import AdminPermRequired, MemberRequiredMixin,NotDemoUserMixin
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
 from django.shortcuts import get_object_or_404
 from pages.models import Room
+from . import recent
 from .models import Notice
+from .read_state import read_floor, unread_notices
 
 
 class NoticesStatusView(LoginRequiredMixin, MemberRequiredMixin, View):
     def get(self, request, room_id):
         user = request.user
-        room = get_object_or_404(Room, id=room_id)
-        notices = get_unread_notices(room, user)
+        # fetched by MemberRequiredMixin
+        room = self.room
+        if room is None:
+            raise Http404("Room not found")
+        floor = read_floor(room, user)
+        notices = recent.unread(room, user, floor)
+        if notices is None:
+            notices = unread_notices(room, user, floor).select_related('author')
         notices_data = [
-            {'id': str(n.id), 'title': n.title, 'content': n.content, 'author': 'system', 'is_html' : n.is_html} if not n.author else
-            {'id': str(n.id), 'title': n.title, 'content': n.content, 'author': n.author.username, 'is_html' : n.is_html}
-            for n in notices 
+            {'id': str(n.id), 'title': n.rendered_title, 'content': n.rendered_content, 'author': 'system', 'is_html' : n.is_html} if not n.author else
+            {'id': str(n.id), 'title': n.rendered_title, 'content': n.rendered_content, 'author': n.author.username, 'is_html' : n.is_html}
+            for n in notices
         ]
         # No use of API serializers 
         return JsonResponse({'notices': notices_data})
@@ -26,8 +34,8 @@ class NoticesStatusView(LoginRequiredMixin, MemberRequiredMixin, View):
         user = request.user
         if room_id:
             room = get_object_or_404(Room, id=room_id)
-            notice_mark_all_as_seen(room, user)
-            return JsonResponse({'success': True})
+            marked = notice_mark_all_as_seen(room, user)
+            return JsonResponse({'success': True, 'marked': marked})
         else:
             return JsonResponse({'success': False, 'error': 'room_id not set'})
         
@@ -0,0 +1,76 @@
+"""
+Read side query services for the notice board.
+"""
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db.models import Q, Count, Exists, OuterRef
+from django.utils import timezone
+
+from pages.queries import make_cursor, parse_cursor
+from . import recent
+from .models import Notice
+from .read_state import resolve_read_state
+
+
+def notice_counts(room):
+    """pinned, total and today's notice counts of the room, from the recent buffer or in one aggregate query"""
+    counts = recent.counts(room)
+    if counts is not None:
+        return counts
+    start_of_today = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+    return Notice.objects.filter(room=room).aggregate(
+        total_notices=Count('id'),
+        pinned_count=Count('id', filter=Q(is_pinned=True)),
+        today_notices=Count('id', filter=Q(created_on__gte=start_of_today)),
+    )
+
+
+def notice_page(room, cursor=None, limit=None, pinned_count=0, user=None):
+    """
+    One page of the notice board, returns (pinned, regular, next_cursor).
+    The first page carries the pinned notices too, fetched in the same query
+    along the (room, -is_pinned, -created_on) index. Regular notices are keyset
+    paginated on (created_on, id), next_cursor is None on the last page.
+    With a user, the notices carry `user_has_read`.
+    The first page comes from the recent buffer of the room when it is long enough.
+    """
+    limit = limit or settings.NOTICES_PER_PAGE
+
+    page = None if cursor else recent.first_page(room, limit)
+    if page is not None:
+        if user is not None:
+            state = resolve_read_state(page[0] + page[1], user)
+            for notice in page[0] + page[1]:
+                notice.user_has_read = state[notice.pk]
+        return page
+
+    regular = Q(is_pinned=False)
+    if cursor:
+        created_on, notice_id = parse_cursor(cursor)
+        regular &= Q(created_on__lt=created_on) | Q(created_on=created_on, id__lt=notice_id)
+        pinned_count = 0
+    condition = Q(is_pinned=True) | regular if pinned_count else regular
+
+    queryset = Notice.objects.filter(room=room).filter(condition).select_related('author')
+    if user is not None:
+        queryset = queryset.with_read_state(user)
+    notices = list(queryset.order_by('-is_pinned', '-created_on', '-id')[:pinned_count + limit + 1])
+    for notice in notices:
+        # the room is already known, no need to join it
+        notice.room = room
+
+    pinned = [notice for notice in notices if notice.is_pinned]
+    regular = [notice for notice in notices if not notice.is_pinned]
+    next_cursor = None
+    if len(regular) > limit:
+        regular = regular[:limit]
+        next_cursor = make_cursor(regular[-1].created_on, regular[-1].id)
+    return pinned, regular, next_cursor
+
+
+def notice_authors(room):
+    """members of the room who posted on its board, checked per member rather than per notice"""
+    return room.members.filter(
+        Exists(Notice.objects.filter(room=room, author_id=OuterRef('pk')))
+    ).order_by('username')
@@ -0,0 +1,166 @@
+"""
+Notice read state.
+
+What a user has read in a room is a watermark: every notice created up to
+`NoticeReadWatermark.read_until` counts as read, and NoticeReadStatus rows only
+hold the notices read one by one past it. Notices created before the user
+joined the room and the user's own notices count as read too.
+"""
+from datetime import timedelta
+
+from django.db.models import Max, Count, Exists, OuterRef, Subquery, Value, IntegerField
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from pages.models import RoomMembership
+from .models import Notice, NoticeReadStatus, NoticeReadWatermark
+
+
+def read_floor(room, user):
+    """
+    the time up to which every notice of the room counts as read for the user,
+    raises RoomMembership.DoesNotExist when the user is not a member
+    """
+    watermark = NoticeReadWatermark.objects.filter(room=OuterRef('room'), user=OuterRef('user'))
+    joined_on, read_until = RoomMembership.objects.filter(room=room, user=user).annotate(
+        read_until=Subquery(watermark.values('read_until')[:1])
+    ).values_list('joined_on', 'read_until').get()
+    return max(joined_on, read_until) if read_until else joined_on
+
+
+def resolve_read_state(notices, user):
+    """
+    {notice id: read} for already fetched notices, with one membership lookup
+    (watermark included) and one read row query whatever the number of notices
+    """
+    notices = list(notices)
+    room_ids = {notice.room_id for notice in notices}
+    watermark = NoticeReadWatermark.objects.filter(room=OuterRef('room'), user=user)
+    floors = {
+        room_id: max(joined_on, read_until) if read_until else joined_on
+        for room_id, joined_on, read_until in RoomMembership.objects.filter(room_id__in=room_ids, user=user)
+            .annotate(read_until=Subquery(watermark.values('read_until')[:1]))
+            .values_list('room_id', 'joined_on', 'read_until')
+    }
+
+    state = {}
+    pending = []
+    for notice in notices:
+        floor = floors.get(notice.room_id)
+        # own notices, notices of rooms the user is not in, and notices up to the floor are read
+        if notice.author_id == user.id or floor is None or notice.created_on <= floor:
+            state[notice.pk] = True
+        else:
+            pending.append(notice.pk)
+
+    if pending:
+        read = set(NoticeReadStatus.objects.filter(user=user, notice_id__in=pending).values_list('notice_id', flat=True))
+        state.update({pk: pk in read for pk in pending})
+    return state
+
+
+def unread_notices(room, user, floor=None):
+    """notices of the room the user has not read, a range scan past the watermark"""
+    if floor is None:
+        floor = read_floor(room, user)
+    return Notice.objects.filter(room=room, created_on__gt=floor) \
+        .exclude(author=user).exclude(read_statuses__user=user)
+
+
+def unread_counts(user):
+    """
+    {room id: unread notice count} for every room of the user, in one query
+    going over the memberships with a count per room past its read floor
+    """
+    watermark = NoticeReadWatermark.objects.filter(room=OuterRef('room'), user=user).values('read_until')[:1]
+    unread = Notice.objects.filter(room=OuterRef('room'), created_on__gt=OuterRef('floor')) \
+        .exclude(author=user) \
+        .filter(~Exists(NoticeReadStatus.objects.filter(notice=OuterRef('pk'), user=user)))
+
+    memberships = RoomMembership.objects.filter(user=user).annotate(
+        floor=Greatest('joined_on', Coalesce(Subquery(watermark), 'joined_on')),
+        unread=Coalesce(
+            Subquery(unread.values('room').annotate(count=Count('*')).values('count')[:1]),
+            Value(0), output_field=IntegerField()
+        ),
+    )
+    return dict(memberships.values_list('room_id', 'unread'))
+
+
+# read rows removed per statement when a watermark moves over them
+DELETE_CHUNK_SIZE = 5000
+
+
+def _delete_in_chunks(queryset):
+    """deletes the rows in short statements instead of one long one, returns the number removed"""
+    removed = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:DELETE_CHUNK_SIZE])
+        if not ids:
+            return removed
+        removed += NoticeReadStatus.objects.filter(id__in=ids).delete()[0]
+
+
+def advance_watermark(room, user, read_until):
+    """
+    marks every notice of the room up to `read_until` as read with a single row upsert,
+    the one by one reads it now covers are dropped afterwards.
+    Returns the number of read rows removed.
+    """
+    NoticeReadWatermark.objects.bulk_create(
+        [NoticeReadWatermark(room_id=getattr(room, 'pk', room), user_id=getattr(user, 'pk', user), read_until=read_until)],
+        update_conflicts=True,
+        unique_fields=['user', 'room'],
+        update_fields=['read_until', 'updated_on'],
+    )
+    # the watermark already answers for these rows, removing them is only cleanup
+    return _delete_in_chunks(
+        NoticeReadStatus.objects.filter(user=user, notice__room=room, notice__created_on__lte=read_until)
+    )
+
+
+def mark_all_read(room, user):
+    """
+    marks every notice of the room as read for the user, returns the number of notices that were unread.
+    Nothing is written per notice, so a long backlog costs the same as a short one.
+    """
+    now = timezone.now()
+    floor = read_floor(room, user)
+    count = unread_notices(room, user, floor).filter(created_on__lte=now).count()
+    advance_watermark(room, user, now)
+    return count
+
+
+def mark_read(notice, user):
+    """marks one notice as read, safe against concurrent clicks"""
+    NoticeReadStatus.objects.bulk_create([NoticeReadStatus(notice=notice, user=user)], ignore_conflicts=True)
+
+
+def compact_read_statuses():
+    """
+    folds the NoticeReadStatus rows of every (user, room) into its watermark,
+    up to the first notice the user has not read.
+    Returns (watermarks moved, rows removed).
+    """
+    moved = removed = 0
+    pairs = NoticeReadStatus.objects.values_list('user_id', 'notice__room_id').distinct().order_by()
+    for user_id, room_id in list(pairs):
+        try:
+            floor = read_floor(room_id, user_id)
+        except RoomMembership.DoesNotExist:
+            # left the room, notices from before a rejoin count as read anyway
+            removed += _delete_in_chunks(NoticeReadStatus.objects.filter(user_id=user_id, notice__room_id=room_id))
+            continue
+
+        first_unread = unread_notices(room_id, user_id, floor).order_by('created_on') \
+            .values_list('created_on', flat=True).first()
+        if first_unread is None:
+            read_until = Notice.objects.filter(room_id=room_id).aggregate(last=Max('created_on'))['last']
+        else:
+            read_until = first_unread - timedelta(microseconds=1)
+
+        if read_until is None or read_until <= floor:
+            continue
+        removed += advance_watermark(room_id, user_id, read_until)
+        moved += 1
+    return moved, removed
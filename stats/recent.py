@@ -0,0 +1,253 @@
+"""
+Recent notices of a room, kept in the cache.
+
+Almost every notice read is for the newest notices of a room, so each room
+keeps a bounded buffer in the cache with its pinned notices, its newest
+RECENT_NOTICES_SIZE other notices and its notice count. New notices are
+pushed in when their transaction commits and deleted ones are dropped.
+Edits and pin changes throw the buffer away and the next read builds it
+again. Queryset writes skip all of this and have to call forget() themselves.
+Writes and builds take a per room lock, a write finding it taken throws the
+buffer away and marks it invalid for a few seconds, during which reads are
+served from the database and nothing is cached.
+Buffers expire after RECENT_NOTICES_TIMEOUT seconds in any case.
+
+The buffer serves the first page of the notice board and the unread notices
+of a user when it covers them, older pages fall back to the database. The
+buffer is only kept in a cache shared by every process: with a per process
+backend (the in-memory default) a write would only reach the buffer of the
+process serving it, so everything is read from the database instead.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils import timezone
+
+from pages.models import CustomUser
+from pages.queries import make_cursor
+from .models import Notice, NoticeReadStatus
+
+LOCK_TIMEOUT = 5
+
+FIELDS = ['id', 'author_id', 'title', 'content', 'event', 'payload', 'is_pinned', 'is_admin', 'is_html', 'created_on']
+
+
+def enabled():
+    """whether the cache is shared by the processes, see the module docstring"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def _key(room_id):
+    return f"notices:recent:{room_id}"
+
+
+def _entry(notice):
+    entry = {field: getattr(notice, field) for field in FIELDS}
+    entry['author'] = notice.author.username if notice.author_id else None
+    return entry
+
+
+def _notice(entry, room):
+    """unsaved looking Notice built from a buffer entry, enough for the templates and serializers"""
+    entry = dict(entry)
+    username = entry.pop('author')
+    notice = Notice(room=room, **entry)
+    notice._state.adding = False
+    notice._state.db = 'default'
+    if username is not None:
+        notice.author = CustomUser(id=entry['author_id'], username=username)
+    return notice
+
+
+def _ordered(entries):
+    return sorted(entries, key=lambda entry: (entry['created_on'], str(entry['id'])), reverse=True)
+
+
+def _lock_key(room_id):
+    return f"{_key(room_id)}:lock"
+
+
+def _invalid_key(room_id):
+    return f"{_key(room_id)}:invalid"
+
+
+def build(room):
+    """reads the buffer of the room from the database"""
+    notices = Notice.objects.filter(room=room).select_related('author')
+    size = settings.RECENT_NOTICES_SIZE
+    pinned = notices.filter(is_pinned=True).order_by('-created_on', '-id')
+    recent = list(notices.filter(is_pinned=False).order_by('-created_on', '-id')[:size + 1])
+    return {
+        'pinned': [_entry(notice) for notice in pinned],
+        'recent': [_entry(notice) for notice in recent[:size]],
+        # every notice of the room is in the buffer
+        'complete': len(recent) <= size,
+        'total': notices.count(),
+    }
+
+
+def _store(room_id, buffer):
+    """caches a buffer written under the lock, unless a write was turned away meanwhile"""
+    cache.set(_key(room_id), buffer, settings.RECENT_NOTICES_TIMEOUT)
+    # checked after the set: a write turned away before it is seen here, one turned away after it deletes the buffer
+    if cache.get(_invalid_key(room_id)) is not None:
+        cache.delete(_key(room_id))
+
+
+def get(room):
+    """
+    the cached buffer of the room, built again when missing. A buffer read while a
+    write is in flight (the lock is held or a write was turned away) is not cached.
+    """
+    invalid = cache.get(_invalid_key(room.pk)) is not None
+    if not invalid:
+        buffer = cache.get(_key(room.pk))
+        if buffer is not None:
+            return buffer
+    if invalid or not cache.add(_lock_key(room.pk), 1, LOCK_TIMEOUT):
+        return build(room)
+    try:
+        # pushes committing while this reads wait for the lock, see _update
+        buffer = build(room)
+        _store(room.pk, buffer)
+    finally:
+        cache.delete(_lock_key(room.pk))
+    return buffer
+
+
+def forget(room_id):
+    """drops the buffer and keeps a copy being written under the lock from being cached"""
+    cache.set(_invalid_key(room_id), 1, LOCK_TIMEOUT)
+    cache.delete(_key(room_id))
+
+
+def _update(room_id, change):
+    """applies change(buffer) to a cached buffer, throws the buffer away when another write or a build holds it"""
+    lock = _lock_key(room_id)
+    if not cache.add(lock, 1, LOCK_TIMEOUT):
+        forget(room_id)
+        return
+    try:
+        buffer = cache.get(_key(room_id))
+        if buffer is not None:
+            change(buffer)
+            _store(room_id, buffer)
+    finally:
+        cache.delete(lock)
+
+
+def _drop(buffer, notice_id):
+    for name in ('pinned', 'recent'):
+        kept = [entry for entry in buffer[name] if entry['id'] != notice_id]
+        if len(kept) != len(buffer[name]):
+            buffer[name] = kept
+            return True
+    return False
+
+
+def _push(notice, created):
+    entry = _entry(notice)
+
+    def change(buffer):
+        _drop(buffer, entry['id'])
+        name = 'pinned' if entry['is_pinned'] else 'recent'
+        buffer[name] = _ordered(buffer[name] + [entry])
+        if name == 'recent' and len(buffer['recent']) > settings.RECENT_NOTICES_SIZE:
+            buffer['recent'] = buffer['recent'][:settings.RECENT_NOTICES_SIZE]
+            buffer['complete'] = False
+        if created:
+            buffer['total'] += 1
+
+    _update(notice.room_id, change)
+
+
+def notice_saved(notice, created):
+    if not enabled():
+        return
+    if created:
+        transaction.on_commit(lambda: _push(notice, True))
+    else:
+        transaction.on_commit(lambda: forget(notice.room_id))
+
+
+def notice_moved(notice):
+    """a notice updated in place as the newest of its room, a folded digest"""
+    if enabled():
+        transaction.on_commit(lambda: _push(notice, False))
+
+
+def notice_deleted(room_id, notice_id):
+    if not enabled():
+        return
+
+    def change(buffer):
+        # notices older than the buffer only change the count
+        _drop(buffer, notice_id)
+        buffer['total'] -= 1
+
+    transaction.on_commit(lambda: _update(room_id, change))
+
+
+# reads
+
+def _reaches(buffer, moment):
+    """whether every notice created after `moment` is in the buffer"""
+    return buffer['complete'] or bool(buffer['recent']) and buffer['recent'][-1]['created_on'] <= moment
+
+
+def counts(room):
+    """the notice board counts from the buffer, None when today's notices reach past it"""
+    if not enabled():
+        return None
+    buffer = get(room)
+    start_of_today = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+    if not _reaches(buffer, start_of_today - timedelta(microseconds=1)):
+        return None
+    return {
+        'total_notices': buffer['total'],
+        'pinned_count': len(buffer['pinned']),
+        'today_notices': sum(
+            entry['created_on'] >= start_of_today for entry in buffer['pinned'] + buffer['recent']
+        ),
+    }
+
+
+def first_page(room, limit):
+    """(pinned, regular, next_cursor) of the first notice board page, None when the buffer is too short"""
+    if not enabled():
+        return None
+    buffer = get(room)
+    if not buffer['complete'] and len(buffer['recent']) <= limit:
+        return None
+    pinned = [_notice(entry, room) for entry in buffer['pinned']]
+    regular = [_notice(entry, room) for entry in buffer['recent'][:limit + 1]]
+    next_cursor = None
+    if len(regular) > limit:
+        regular = regular[:limit]
+        next_cursor = make_cursor(regular[-1].created_on, regular[-1].id)
+    return pinned, regular, next_cursor
+
+
+def unread(room, user, floor):
+    """
+    unread notices of the user newest first from the buffer, with one read row query,
+    None when notices past `floor` reach beyond the buffer
+    """
+    if not enabled():
+        return None
+    buffer = get(room)
+    if not _reaches(buffer, floor):
+        return None
+    # pinned first, the order of Notice.Meta
+    candidates = [
+        entry for entry in buffer['pinned'] + buffer['recent']
+        if entry['created_on'] > floor and entry['author_id'] != user.id
+    ]
+    read = set(NoticeReadStatus.objects.filter(
+        user=user, notice_id__in=[entry['id'] for entry in candidates]
+    ).values_list('notice_id', flat=True)) if candidates else set()
+    return [_notice(entry, room) for entry in candidates if entry['id'] not in read]
@@ -0,0 +1,164 @@
+"""
+Full-text search over notices and todos.
+
+On postgres notices and todos carry a generated `search_vector` tsvector
+column with a GIN index: the notice title weighted above its content (HTML
+tags stripped) and the text values of its payload, so event notices are
+found by the user, room, session and task names they mention, and the todo
+task. Postgres keeps the column up to date on every write, queryset writes
+included.
+
+On sqlite (local runs and the tests) the same text goes into FTS5 tables
+kept up to date by triggers, each search row carrying the primary key of its
+row in an unindexed column (rowids of tables without an integer primary key
+can change on VACUUM). Tags are not stripped there and the tables are built
+again on every migrate.
+
+Both are created by install(), which runs after migrate. On postgres a
+migration changing an indexed column needs the search column dropped first,
+`manage.py search_index --rebuild` puts it back. search() takes a queryset so
+callers keep their own permission filters, and returns it filtered to the
+matches with a `search_rank`, best first.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from pages.models import Todo
+from .models import Notice
+
+
+# model -> (search table on sqlite with its columns and their bm25 weights, document on postgres)
+INDEXES = {
+    Notice: (
+        {
+            'title': ('NEW.title', 10.0),
+            'body': (
+                "NEW.content || ' ' || (SELECT coalesce(group_concat(value, ' '), '') "
+                "FROM json_tree(coalesce(NEW.payload, '{{}}')) WHERE type = 'text')",
+                1.0,
+            ),
+        },
+        "setweight(to_tsvector({config}, coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector({config}, regexp_replace(coalesce(content, ''), '<[^>]*>', ' ', 'g')), 'B') || "
+        "setweight(jsonb_to_tsvector({config}, coalesce(payload, '{{}}'::jsonb), '[\"string\"]'), 'B')",
+    ),
+    Todo: (
+        {'task': ('NEW.task', 1.0)},
+        "to_tsvector({config}, coalesce(task, ''))",
+    ),
+}
+
+# terms of a query after the first ones are ignored
+MAX_TERMS = 8
+
+
+def is_supported(conn=connection):
+    return conn.vendor in ('postgresql', 'sqlite')
+
+
+def _table(model):
+    return model._meta.db_table
+
+
+def _search_table(model):
+    return f"{_table(model)}_search"
+
+
+def _config():
+    config = settings.SEARCH_CONFIG
+    if not re.fullmatch(r'\w+', config):
+        raise ValueError(f"invalid text search configuration {config!r}")
+    return f"'{config}'::regconfig"
+
+
+def _install_postgres(cursor, quote, rebuild):
+    for model, (_, document) in INDEXES.items():
+        table = quote(_table(model))
+        if rebuild:
+            cursor.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
+        cursor.execute(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS ({document.format(config=_config())}) STORED"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote(_table(model) + '_search_idx')} ON {table} USING gin (search_vector)"
+        )
+
+
+def _install_sqlite(cursor, quote):
+    for model, (columns, _) in INDEXES.items():
+        table, search = quote(_table(model)), quote(_search_table(model))
+        pk = quote(model._meta.pk.column)
+        names = ', '.join(columns)
+        values = ', '.join(value.format() for value, _ in columns.values())
+        insert = f"INSERT INTO {search}({pk}, {names}) VALUES (NEW.{pk}, {values});"
+        delete = f"DELETE FROM {search} WHERE {pk} = OLD.{pk};"
+
+        # built again from the table, rows written before the triggers existed included
+        triggers = [
+            (quote(f"{_search_table(model)}_{name}"), event, body)
+            for name, event, body in (('ai', 'INSERT', insert), ('au', 'UPDATE', delete + insert), ('ad', 'DELETE', delete))
+        ]
+        for trigger, _, _ in triggers:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute(f"DROP TABLE IF EXISTS {search}")
+
+        cursor.execute(f"CREATE VIRTUAL TABLE {search} USING fts5({pk} UNINDEXED, {names})")
+        for trigger, event, body in triggers:
+            cursor.execute(f"CREATE TRIGGER {trigger} AFTER {event} ON {table} BEGIN {body} END")
+
+        select = values.replace('NEW.', f'{table}.')
+        cursor.execute(f"INSERT INTO {search}({pk}, {names}) SELECT {table}.{pk}, {select} FROM {table}")
+
+
+def install(conn=connection, rebuild=False):
+    """creates the search columns and indexes (postgres) or tables and triggers (sqlite), safe to run again"""
+    if not is_supported(conn):
+        return False
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            _install_postgres(cursor, conn.ops.quote_name, rebuild)
+        else:
+            _install_sqlite(cursor, conn.ops.quote_name)
+    return True
+
+
+def install_after_migrate(sender, using, **kwargs):
+    install(connections[using])
+
+
+def terms(query):
+    """the words of a user query, anything else in it is dropped so it never reaches the query syntax"""
+    return re.findall(r'\w+', query or '')[:MAX_TERMS]
+
+
+def search(queryset, query):
+    """the rows of `queryset` matching every term of `query` (as prefixes) with their rank, best first"""
+    words = terms(query)
+    if not words:
+        return queryset.none()
+
+    model = queryset.model
+    table = connection.ops.quote_name(_table(model))
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f"{word}:*" for word in words)
+        params = [settings.SEARCH_CONFIG, tsquery]
+        condition = f"{table}.search_vector @@ to_tsquery(%s::regconfig, %s)"
+        rank = f"ts_rank({table}.search_vector, to_tsquery(%s::regconfig, %s))"
+    else:
+        fts = connection.ops.quote_name(_search_table(model))
+        pk = connection.ops.quote_name(model._meta.pk.column)
+        # the primary key column is not weighted
+        weights = ', '.join(['0.0'] + [str(weight) for _, weight in INDEXES[model][0].values()])
+        params = [' '.join(f'"{word}"*' for word in words)]
+        condition = f"{table}.{pk} IN (SELECT {pk} FROM {fts} WHERE {fts} MATCH %s)"
+        # bm25 is lower for better matches
+        rank = f"(SELECT -bm25({fts}, {weights}) FROM {fts} WHERE {fts} MATCH %s AND {fts}.{pk} = {table}.{pk})"
+
+    return queryset.filter(RawSQL(condition, params, output_field=BooleanField())) \
+        .annotate(search_rank=RawSQL(rank, params, output_field=FloatField())) \
+        .order_by('-search_rank', '-created_on')
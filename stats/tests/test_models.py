@@ -1,5 +1,12 @@
 from django.test import TestCase
-from stats.models import Notice, CustomUser, Room
+from stats.models import Notice, CustomUser, Room, NoticeReadStatus, NoticeReadWatermark
+from stats import read_state
+from stats.read_state import unread_notices, mark_all_read, resolve_read_state
+from unittest.mock import patch
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from io import StringIO
 from django.urls import reverse_lazy
 from django.core.exceptions import PermissionDenied
 
@@ -150,3 +157,97 @@ class NoticeViewsTest(TestCase):
         notice.refresh_from_db()
         self.assertTrue(notice.is_read(self.user2))
 
+    def test_notice_read_watermark(self):
+        room = self.create_room()
+        notices = [
+            Notice.objects.create(room=room, title=f'notice {i}', content='content')
+            for i in range(4)
+        ]
+        self.assertEqual(unread_notices(room, self.user2).count(), 4)
+
+        mark_all_read(room, self.user2)
+        self.assertEqual(NoticeReadWatermark.objects.filter(room=room, user=self.user2).count(), 1)
+        self.assertFalse(unread_notices(room, self.user2).exists())
+        self.assertFalse(NoticeReadStatus.objects.filter(user=self.user2).exists())
+        self.assertTrue(notices[0].is_read(self.user2))
+
+        newer = Notice.objects.create(room=room, title='newer', content='content')
+        self.assertFalse(newer.is_read(self.user2))
+        self.assertEqual(list(unread_notices(room, self.user2)), [newer])
+
+        # marking all again moves the same row
+        mark_all_read(room, self.user2)
+        self.assertEqual(NoticeReadWatermark.objects.filter(room=room, user=self.user2).count(), 1)
+        self.assertTrue(newer.is_read(self.user2))
+
+    def test_compact_read_statuses(self):
+        room = self.create_room()
+        notices = [
+            Notice.objects.create(room=room, title=f'notice {i}', content='content')
+            for i in range(4)
+        ]
+        for notice in notices[:2] + notices[3:]:
+            notice.mark_as_read(self.user1)
+        for notice in notices:
+            notice.mark_as_read(self.user2)
+
+        output = StringIO()
+        call_command('compact_notice_reads', stdout=output)
+        self.assertIn('Moved 2 read watermarks, removed 6 read rows', output.getvalue())
+
+        # user1 skipped notices[2], the read row past it stays as an exception
+        self.assertEqual(list(NoticeReadStatus.objects.filter(user=self.user1).values_list('notice', flat=True)), [notices[3].id])
+        self.assertFalse(NoticeReadStatus.objects.filter(user=self.user2).exists())
+        self.assertEqual(list(unread_notices(room, self.user1)), [notices[2]])
+        self.assertFalse(unread_notices(room, self.user2).exists())
+        for notice in notices:
+            self.assertEqual(notice.is_read(self.user1), notice != notices[2])
+            self.assertTrue(notice.is_read(self.user2))
+
+    def test_batch_read_state(self):
+        room = self.create_room()
+        other_room = Room.objects.create(name='otherroom', admin=self.user1)
+        other_room.members.add(self.user2)
+        old = Notice.objects.create(room=room, title='old', content='content')
+        mark_all_read(room, self.user2)
+        notices = [old] + [
+            Notice.objects.create(room=room, title=f'notice {i}', content='content')
+            for i in range(3)
+        ] + [
+            Notice.objects.create(room=room, title='mine', content='content', author=self.user2),
+            Notice.objects.create(room=other_room, title='elsewhere', content='content'),
+        ]
+        notices[1].mark_as_read(self.user2)
+        other_room.members.remove(self.user2)
+
+        expected = {notice.id: notice.is_read(self.user2) for notice in notices}
+        self.assertEqual(list(expected.values()), [True, True, False, False, True, True])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(resolve_read_state(notices, self.user2), expected)
+        self.assertEqual(len(queries), 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            annotated = {
+                notice.id: notice.user_has_read
+                for notice in Notice.objects.filter(id__in=expected).with_read_state(self.user2)
+            }
+        self.assertEqual(annotated, expected)
+        self.assertEqual(len(queries), 1)
+
+    def test_mark_all_read_count(self):
+        room = self.create_room()
+        notices = [
+            Notice.objects.create(room=room, title=f'notice {i}', content='content')
+            for i in range(5)
+        ]
+        notices[0].mark_as_read(self.user2)
+        # a second click does not fail on the unique constraint
+        notices[0].mark_as_read(self.user2)
+        notices[1].mark_as_read(self.user2)
+        notices[2].mark_as_read(self.user2)
+
+        with patch.object(read_state, 'DELETE_CHUNK_SIZE', 2):
+            self.assertEqual(mark_all_read(room, self.user2), 2)
+        self.assertFalse(NoticeReadStatus.objects.filter(user=self.user2).exists())
+        self.assertEqual(mark_all_read(room, self.user2), 0)
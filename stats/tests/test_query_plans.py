@@ -0,0 +1,151 @@
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import TestCase
+from django.utils import timezone
+
+from pages.models import Room, Session, Todo, TrackTodo, RoomRanking, SessionRanking, RoomMembership, CustomUser
+from stats.models import Notice, NoticeReadStatus
+
+
+class QueryPlanMixin:
+    """
+    EXPLAIN based assertions.
+    On postgres sequential scans are disabled for the explain so that the
+    planner picks an index whenever one is usable on the small test dataset.
+    """
+
+    def get_plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                return queryset.explain()
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = self.get_plan(queryset)
+        tables = queryset.query.alias_map.keys()
+
+        if connection.vendor == 'postgresql':
+            for table in tables:
+                self.assertNotRegex(plan, rf'Seq Scan on {table}\b', plan)
+            self.assertRegex(plan, r'Index (Only )?Scan|Bitmap Index Scan', plan)
+        else:
+            for table in tables:
+                self.assertNotRegex(plan, rf'SCAN {table}\b', plan)
+            self.assertRegex(plan, r'USING (COVERING )?INDEX|USING INTEGER PRIMARY KEY', plan)
+
+        if index_name:
+            self.assertIn(index_name, plan)
+        return plan
+
+
+class TestQueryPlans(QueryPlanMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'user{i}', password='!') for i in range(20)
+        ])
+        cls.user = cls.users[0]
+
+        rooms = Room.objects.bulk_create([
+            Room(name=f'room{i}', admin=cls.users[i]) for i in range(5)
+        ])
+        cls.room = rooms[0]
+        RoomMembership.objects.bulk_create([
+            RoomMembership(room=room, user=user) for room in rooms for user in cls.users
+        ])
+
+        now = timezone.now()
+        sessions = Session.objects.bulk_create([
+            Session(name=f'session{i}', room=room, started_at=now - timedelta(days=30),
+                    finished_at=None if i == 0 else now - timedelta(days=i))
+            for room in rooms for i in range(6)
+        ])
+        cls.session = sessions[0]
+        todos = Todo.objects.bulk_create([
+            Todo(session=session, user=user, task='task')
+            for session in sessions for user in cls.users[:5]
+        ])
+        today = timezone.localdate()
+        TrackTodo.objects.bulk_create([
+            TrackTodo(todo=todo, day=today - timedelta(days=d), hours=1,
+                      user_id=todo.user_id, session_id=todo.session_id, room_id=todo.session.room_id)
+            for todo in todos for d in range(5)
+        ])
+        RoomRanking.objects.bulk_create([
+            RoomRanking(room=room, user=user, rank=rank, total_hours=1)
+            for room in rooms for rank, user in enumerate(cls.users, 1)
+        ])
+        SessionRanking.objects.bulk_create([
+            SessionRanking(session=session, user=user, rank=rank, total_hours=1)
+            for session in sessions for rank, user in enumerate(cls.users[:5], 1)
+        ])
+        notices = Notice.objects.bulk_create([
+            Notice(room=room, title='title', content='content') for room in rooms for _ in range(10)
+        ])
+        NoticeReadStatus.objects.bulk_create([
+            NoticeReadStatus(notice=notice, user=cls.user) for notice in notices[::2]
+        ])
+
+    # stats
+    def test_user_daily_hours(self):
+        qs = TrackTodo.objects.filter(todo__user=self.user, day=timezone.localdate())
+        self.assertUsesIndex(qs, 'tracktodo_todo_day_idx')
+
+    def test_session_tracking(self):
+        qs = TrackTodo.objects.filter(todo__session=self.session)
+        self.assertUsesIndex(qs)
+
+    def test_user_hours_by_day(self):
+        qs = TrackTodo.objects.filter(user=self.user, day__gte=timezone.localdate() - timedelta(days=30)) \
+            .values('day').annotate(total=Sum('hours'))
+        self.assertUsesIndex(qs, 'tracktodo_user_day_idx')
+
+    def test_session_totals(self):
+        qs = TrackTodo.objects.filter(session=self.session).values('user').annotate(total=Sum('hours'))
+        self.assertUsesIndex(qs, 'tracktodo_session_user_idx')
+
+    def test_room_totals(self):
+        qs = TrackTodo.objects.filter(room=self.room).values('user').annotate(total=Sum('hours'))
+        self.assertUsesIndex(qs, 'tracktodo_room_user_idx')
+
+    def test_user_session_todos(self):
+        qs = Todo.objects.filter(session=self.session, user=self.user, completed=False)
+        self.assertUsesIndex(qs, 'todo_session_user_idx')
+
+    # sessions
+    def test_active_sessions_of_room(self):
+        qs = Session.objects.filter(room=self.room, finished_at__isnull=True)
+        self.assertUsesIndex(qs)
+
+    def test_auto_end_sessions(self):
+        qs = Session.objects.filter(auto_end=True, deadline__lt=timezone.localdate(), finished_at__isnull=True)
+        self.assertUsesIndex(qs, 'session_auto_end_idx')
+
+    # rankings
+    def test_room_rankings(self):
+        self.assertUsesIndex(self.room.rankings.all(), 'roomranking_rank_idx')
+
+    def test_session_rankings(self):
+        self.assertUsesIndex(self.session.rankings.all(), 'sessionranking_rank_idx')
+
+    # notices
+    def test_room_notices(self):
+        qs = Notice.objects.filter(room=self.room)
+        self.assertUsesIndex(qs)
+
+    def test_notices_after_join(self):
+        qs = Notice.objects.filter(room=self.room, created_on__gt=timezone.now() - timedelta(days=1))
+        self.assertUsesIndex(qs, 'notice_room_created_idx')
+
+    def test_membership_lookup(self):
+        qs = RoomMembership.objects.filter(room=self.room, user=self.user)
+        self.assertUsesIndex(qs)
+
+    def test_user_read_statuses(self):
+        qs = NoticeReadStatus.objects.filter(user=self.user)
+        self.assertUsesIndex(qs, 'noticeread_user_idx')
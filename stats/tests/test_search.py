@@ -0,0 +1,93 @@
+from io import StringIO
+from unittest import skipUnless
+from django.test import TestCase
+from django.db import connection
+from django.core.management import call_command
+from django.urls import reverse
+from pages.models import CustomUser, Room, Session, Todo
+from stats.models import Notice
+from stats import search
+from stats.notice_render import post_notice, user_ref, session_ref
+from django.utils import timezone
+
+
+class TestSearch(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            username = 'ame',
+            password = 'itsmeprash'
+        )
+        cls.room = Room.objects.create(name='testroom', admin=cls.user)
+        cls.session = Session.objects.create(name='algebra', room=cls.room, started_at=timezone.now())
+
+    def test_notices(self):
+        in_content = Notice.objects.create(room=self.room, title='Friday', content='<p>Bring the <b>physics</b> notes</p>')
+        in_title = Notice.objects.create(room=self.room, title='Physics exam', content='room 4')
+        Notice.objects.create(room=self.room, title='Lunch', content='pizza')
+
+        notices = Notice.objects.filter(room=self.room)
+        self.assertEqual(list(search.search(notices, 'physics')), [in_title, in_content])
+        self.assertEqual(list(search.search(notices, 'phys')), [in_title, in_content])
+        self.assertEqual(list(search.search(notices, 'physics exam')), [in_title])
+        self.assertEqual(list(search.search(notices, '" OR * ( -')), [])
+        self.assertEqual(list(search.search(notices.exclude(id=in_title.id), 'physics')), [in_content])
+
+        # kept up to date by the database, queryset writes included
+        Notice.objects.filter(id=in_content.id).update(content='nothing to bring')
+        self.assertEqual(list(search.search(notices, 'physics')), [in_title])
+        in_title.delete()
+        self.assertEqual(list(search.search(notices, 'physics')), [])
+
+    def test_event_notices(self):
+        notice = post_notice(self.room, 'session_created', user=user_ref(self.user), session=session_ref(self.session))
+        self.assertEqual(notice.title, '')
+
+        self.assertEqual(list(search.search(Notice.objects.all(), 'algebra')), [notice])
+        self.assertEqual(list(search.search(Notice.objects.all(), 'ame')), [notice])
+
+    def test_todos(self):
+        todo = Todo.objects.create(user=self.user, session=self.session, task='solve the quadratic equations')
+        Todo.objects.create(user=self.user, session=self.session, task='read chapter 2')
+
+        self.assertEqual(list(search.search(Todo.objects.all(), 'quadratic')), [todo])
+        todo.task = 'linear equations'
+        todo.save()
+        self.assertEqual(list(search.search(Todo.objects.all(), 'quadratic')), [])
+        self.assertEqual(list(search.search(Todo.objects.all(), 'equation')), [todo])
+
+    def test_install_again(self):
+        notice = Notice.objects.create(room=self.room, title='Physics exam', content='room 4')
+        call_command('search_index', stdout=StringIO())
+        self.assertEqual(list(search.search(Notice.objects.all(), 'physics')), [notice])
+
+    def test_admin_search(self):
+        admin = CustomUser.objects.create_superuser(username='boss', password='itsmeprash')
+        other_room = Room.objects.create(name='otherroom', admin=admin)
+        in_title = Notice.objects.create(room=self.room, title='Physics exam', content='room 4')
+        elsewhere = Notice.objects.create(room=other_room, title='Lunch', content='pizza')
+        todo = Todo.objects.create(user=self.user, session=self.session, task='solve the quadratic equations')
+        self.client.force_login(admin)
+
+        def found(url, term):
+            response = self.client.get(url, {'q': term})
+            self.assertEqual(response.status_code, 200)
+            return set(response.context['cl'].result_list)
+
+        notices = reverse('admin:stats_notice_changelist')
+        self.assertEqual(found(notices, 'physics'), {in_title})
+        # related names are still searched
+        self.assertEqual(found(notices, 'otherroom'), {elsewhere})
+        todos = reverse('admin:pages_todo_changelist')
+        self.assertEqual(found(todos, 'quadratic'), {todo})
+        self.assertEqual(found(todos, 'ame'), {todo})
+        self.assertEqual(found(todos, 'algebra'), {todo})
+
+    @skipUnless(connection.vendor == 'sqlite', 'sqlite search tables')
+    def test_rows_keyed_by_primary_key(self):
+        notice = Notice.objects.create(room=self.room, title='Physics exam', content='room 4')
+        # rowids change on VACUUM, the search row carries the uuid of the notice
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id FROM stats_notice_search WHERE stats_notice_search MATCH %s', ['physics'])
+            self.assertEqual(cursor.fetchall(), [(notice.id.hex,)])
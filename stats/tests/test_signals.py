@@ -3,6 +3,8 @@ from stats.models import Notice
 from pages.models import Room, CustomUser, Session, Todo
 from django.urls import reverse_lazy
 from django.utils import timezone
+from stats import notice_render
+from django.test import override_settings
 import json
 
 
@@ -281,3 +283,79 @@ class TestSignals(TestCase):
 
 
         
+
+    def test_event_notice_rendering(self):
+        session = Session.objects.create(name = '<b>session</b>', room = self.room)
+        notice = notice_render.post_notice(
+            self.room, 'session_joined',
+            user = notice_render.user_ref(self.user), session = notice_render.session_ref(session)
+        )
+        notice = Notice.objects.get(id=notice.id)
+        self.assertEqual(notice.title, '')
+        self.assertEqual(notice.payload['session'], [str(session.id), session.name])
+
+        session_link = reverse_lazy('session', kwargs = {'session_id': session.id})
+        profile_link = reverse_lazy('profile', kwargs = {'username': self.user.username})
+        self.assertEqual(notice.rendered_title, f'<a href="{profile_link}">ame</a> joined the session')
+        self.assertIn(f'<a href="{session_link}">&lt;b&gt;session&lt;/b&gt;</a>', notice.rendered_content)
+
+        # rendered once per notice
+        self.assertIs(notice.rendered_content, Notice.objects.get(id=notice.id).rendered_content)
+
+        with self.assertRaises(ValueError):
+            notice_render.post_notice(self.room, 'unknown')
+
+    def test_notice_render_cache_is_bounded(self):
+        cache = notice_render._LRU(2)
+        for key in range(3):
+            cache.set(key, str(key))
+        self.assertIsNone(cache.get(0))
+        self.assertEqual(cache.get(2), '2')
+
+    def test_notice_coalescing(self):
+        session = Session.objects.create(name = 'testsession', room = self.room)
+
+        def task_created(user, task):
+            return notice_render.post_notice(
+                self.room, 'task_created',
+                user = user.username, session = notice_render.session_ref(session), task = task
+            )
+
+        first = task_created(self.user, 'first')
+        first.mark_as_read(self.user1)
+        member_notice = Notice.objects.create(room=self.room, title='by a member', content='hi', author=self.user)
+        task_created(self.user, 'second')
+        digest = task_created(self.user1, 'third')
+
+        # folded into the first notice, which is unread again
+        self.assertEqual(digest.id, first.id)
+        self.assertEqual(Notice.objects.filter(room=self.room, event='task_created').count(), 1)
+        digest = Notice.objects.get(id=digest.id)
+        self.assertEqual(digest.payload['count'], 3)
+        self.assertEqual(digest.payload['users'], ['ame', 'testuser1'])
+        self.assertEqual(digest.rendered_title, '2 members created 3 tasks')
+        self.assertIn('<em><a href="', digest.rendered_content)
+        self.assertIn('third</a></em>', digest.rendered_content)
+        self.assertFalse(digest.is_read(self.user1))
+
+        member_notice.refresh_from_db()
+        self.assertEqual(member_notice.title, 'by a member')
+
+        # other events and old notices are not folded
+        notice_render.post_notice(self.room, 'left_room', user = 'ame')
+        Notice.objects.filter(id=digest.id).update(created_on=timezone.now() - timezone.timedelta(hours=1))
+        self.assertNotEqual(task_created(self.user, 'fourth').id, digest.id)
+
+        with override_settings(NOTICE_COALESCE_WINDOW=0):
+            task_created(self.user, 'fifth')
+        self.assertEqual(Notice.objects.filter(room=self.room, event='task_created').count(), 3)
+
+    def test_room_digest_counts_members(self):
+        # one member leaving and joining again is one member in the digests
+        for _ in range(2):
+            left = notice_render.post_notice(self.room, 'left_room', user = 'ame')
+        self.assertEqual(left.payload['count'], 2)
+        self.assertEqual(left.rendered_title, '1 member left the room')
+
+        notice_render.post_notice(self.room, 'left_room', user = 'testuser1')
+        self.assertEqual(Notice.objects.get(id=left.id).rendered_title, '2 members left the room')
@@ -1,9 +1,17 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from stats.models import Notice, CustomUser
-from pages.models import Room, Session
+from stats import recent
+from django.core.cache import cache
+from unittest.mock import patch
+from stats.notice_render import post_notice, user_ref, room_ref
+from pages.models import Room, Session, Todo, TrackTodo, RoomRanking
 from django.urls import reverse_lazy
 from django.utils import timezone
 import json
+import shutil
+import tempfile
 
 
 class NoticeViewsTest(TestCase):
@@ -157,6 +165,17 @@ class NoticeViewsTest(TestCase):
         exists = Notice.objects.filter(id=notice.id).exists()
         self.assertFalse(exists)
 
+    def test_delete_event_notice_confirmation(self):
+        room = self.create_room()
+        notice = post_notice(room, 'room_joined', user=user_ref(self.user1), room=room_ref(room))
+        self.assertEqual(notice.title, '')
+        self.assertEqual(str(notice), f"📌 {self.user1.username} has joined the room - {room.name}")
+
+        self.login()
+        response = self.client.get(self.delete_notice_url(notice.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'"{self.user1.username} has joined the room"', response.context['message'])
+
     def test_toggle_pin(self):
         notice = self.create_notice()
         url = self.toggle_pin_url(notice.id)
@@ -205,6 +224,156 @@ class NoticeViewsTest(TestCase):
         self.assertTrue(notice.is_pinned)
 
 
+    @override_settings(NOTICES_PER_PAGE=5)
+    def test_notice_board(self):
+        room = self.create_room()
+        pinned = self.create_notice(room=room, is_pinned=True)
+        notices = Notice.objects.bulk_create([
+            Notice(room=room, title=f'notice {i}', content='content') for i in range(1, 13)
+        ])
+        for i, notice in enumerate(notices, start=1):
+            notice.created_on = timezone.now() - timezone.timedelta(days=i)
+            Notice.objects.filter(id=notice.id).update(created_on=notice.created_on)
+        self.login()
+
+        def get(*args):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.notice_url(room.id), *args)
+            self.assertEqual(response.status_code, 200)
+            return response, len(queries)
+
+        get()
+        response, first = get()
+        self.assertEqual(response.context['pinned_notices'], [pinned])
+        self.assertEqual(response.context['regular_notices'], notices[:5])
+        self.assertEqual(response.context['total_notices'], 13)
+        self.assertEqual(response.context['pinned_count'], 1)
+        self.assertEqual(response.context['today_notices'], 1)
+        self.assertEqual(list(response.context['authors']), [self.user])
+
+        seen = []
+        while response.context['next_cursor']:
+            seen += response.context['regular_notices']
+            response, queries = get({'before': response.context['next_cursor']})
+            self.assertEqual(response.context['pinned_notices'], [])
+            self.assertLessEqual(queries, first)
+        seen += response.context['regular_notices']
+        self.assertEqual(seen, notices)
+
+        # more notices do not mean more queries
+        Notice.objects.bulk_create([Notice(room=room, title='more', content='more') for _ in range(20)])
+        self.assertEqual(get()[1], first)
+
+        self.assertEqual(self.client.get(self.notice_url(room.id), {'before': 'nope'}).status_code, 404)
+
+    @override_settings(NOTICES_PER_PAGE=3, RECENT_NOTICES_SIZE=5)
+    def test_recent_notices(self):
+        room = self.create_room()
+        self.login()
+        unread_url = reverse_lazy('notice-actions', kwargs={'room_id': room.id})
+
+        def notice_queries(url):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            # queries reading notice rows, the nav badge counts are not served from the buffer
+            return response, [query for query in queries if '"stats_notice"."title"' in query['sql']]
+
+        # a per process cache is not used for the buffer
+        self.create_notice(room=room, author=self.user1, title='before')
+        self.client.get(self.notice_url(room.id))
+        response, queries = notice_queries(self.notice_url(room.id))
+        self.assertNotEqual(queries, [])
+        Notice.objects.filter(room=room).delete()
+
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        shared_cache = override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        })
+        shared_cache.enable()
+        self.addCleanup(shared_cache.disable)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pinned = self.create_notice(room=room, author=self.user1, is_pinned=True)
+            notices = [self.create_notice(room=room, author=self.user1, title=f'notice {i}') for i in range(4)]
+        notices.reverse()
+
+        self.client.get(self.notice_url(room.id))
+        response, queries = notice_queries(self.notice_url(room.id))
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context['pinned_notices'], [pinned])
+        self.assertEqual(response.context['regular_notices'], notices[:3])
+        self.assertEqual(response.context['total_notices'], 5)
+        self.assertEqual([notice.author.username for notice in response.context['regular_notices']], ['testuser1'] * 3)
+
+        response, queries = notice_queries(unread_url)
+        self.assertEqual(queries, [])
+        self.assertEqual([notice['id'] for notice in response.json()['notices']], [str(pinned.id)] + [str(notice.id) for notice in notices])
+
+        # new notices are pushed in, deleted ones dropped
+        with self.captureOnCommitCallbacks(execute=True):
+            newest = self.create_notice(room=room, author=self.user2, title='newest')
+            notices[0].delete()
+        response, queries = notice_queries(self.notice_url(room.id))
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context['regular_notices'], [newest] + notices[1:3])
+        self.assertEqual(response.context['total_notices'], 5)
+
+        # reads are still per user
+        notices[1].mark_as_read(self.user)
+        response, _ = notice_queries(unread_url)
+        self.assertNotIn(str(notices[1].id), [notice['id'] for notice in response.json()['notices']])
+
+        # a pin change throws the buffer away
+        with self.captureOnCommitCallbacks(execute=True):
+            notices[1].is_pinned = True
+            notices[1].save()
+        response, queries = notice_queries(self.notice_url(room.id))
+        self.assertNotEqual(queries, [])
+        self.assertEqual(response.context['pinned_notices'], [notices[1], pinned])
+
+        # past the buffer the board falls back to the database
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(6):
+                self.create_notice(room=room, author=self.user1, title=f'more {i}')
+        response = self.client.get(self.notice_url(room.id))
+        self.assertEqual(response.context['total_notices'], 11)
+        older = self.client.get(self.notice_url(room.id), {'before': response.context['next_cursor']})
+        self.assertEqual(older.status_code, 200)
+        self.assertEqual(len(older.context['regular_notices']), 3)
+
+    def test_recent_notices_concurrent_writes(self):
+        room = self.create_room()
+        first = self.create_notice(room=room, author=self.user1, title='first')
+        buffered = recent.get(room)
+        self.assertEqual([entry['id'] for entry in buffered['recent']], [first.id])
+        second = self.create_notice(room=room, author=self.user1, title='second')
+        third = self.create_notice(room=room, author=self.user1, title='third')
+
+        def interleaved(buffer):
+            # another push arrives while this one holds the lock
+            recent._push(third, True)
+            buffer['recent'] = recent._ordered(buffer['recent'] + [recent._entry(second)])
+            buffer['total'] += 1
+
+        recent._update(room.id, interleaved)
+        # neither copy is kept, the next reads come from the database without caching it
+        self.assertIsNone(cache.get(recent._key(room.id)))
+        self.assertEqual([entry['id'] for entry in recent.get(room)['recent']], [third.id, second.id, first.id])
+        self.assertIsNone(cache.get(recent._key(room.id)))
+
+        # once the write settled the buffer is cached again
+        cache.delete(recent._invalid_key(room.id))
+        self.assertEqual(recent.get(room)['total'], 3)
+        self.assertEqual(cache.get(recent._key(room.id))['total'], 3)
+
+        # a build racing a push is not cached either
+        cache.delete(recent._key(room.id))
+        with patch('stats.recent.build', side_effect=lambda room: (recent._push(third, False), buffered)[1]):
+            self.assertEqual(recent.get(room), buffered)
+        self.assertIsNone(cache.get(recent._key(room.id)))
+
     def create_session(self,room=None, **kwargs):
 
         session_data = {
@@ -254,6 +423,102 @@ class NoticeViewsTest(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
 
+    def test_user_stats(self):
+        room = self.create_room(admin=self.user1)
+        today = timezone.localdate()
+        session = self.create_session(room=room)
+        Session.objects.filter(id=session.id).update(started_at=timezone.now() - timezone.timedelta(days=4))
+        done = Todo.objects.create(session=session, user=self.user, task='done')
+        open_todo = Todo.objects.create(session=session, user=self.user, task='open')
+        for days_ago, todo, hours in ((4, done, 2), (3, done, 1), (1, open_todo, 3), (0, open_todo, 1)):
+            TrackTodo.objects.create(todo=todo, day=today - timezone.timedelta(days=days_ago), hours=hours)
+        Todo.objects.filter(id=done.id).update(completed=True)
+        other = Todo.objects.create(session=session, user=self.user1, task='other')
+        TrackTodo.objects.create(todo=other, day=today, hours=10)
+        self.login()
+
+        def get():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.user_session_stats_url(session.id))
+            self.assertEqual(response.status_code, 200)
+            return response, len(queries)
+
+        get()
+        response, queries = get()
+        basic, summary = response.context['user_session_stats'], response.context['user_summary_stats']
+        self.assertEqual(basic['user_total_hours'], 7)
+        self.assertEqual((basic['user_completed_tasks'], basic['user_active_tasks']), (1, 1))
+        self.assertEqual((basic['user_rank'], basic['total_members']), (2, 3))
+        self.assertEqual(response.context['daily_hours_data']['data'], [2, 1, 0, 3, 1])
+        self.assertEqual(response.context['daily_cumulative_data']['data'], [2, 3, 3, 6, 7])
+        self.assertEqual(response.context['user_tasks_data']['labels'], ['open', 'done'])
+        self.assertEqual(response.context['comparison_data']['data'], [7, round(17 / 3, 1), 10])
+        self.assertEqual(summary['user_longest_streak'], 2)
+        self.assertEqual(summary['user_current_streak'], 2)
+        self.assertEqual(summary['user_percentile'], 50)
+        self.assertEqual(summary['best_day_hours'], 3)
+
+        # more members, todos and days do not mean more queries
+        session.members.add(self.user3)
+        for days_ago in range(5, 30):
+            todo = Todo.objects.create(session=session, user=self.user, task=f'task {days_ago}')
+            TrackTodo.objects.create(todo=todo, day=today - timezone.timedelta(days=days_ago), hours=1)
+        self.assertEqual(get()[1], queries)
+
+    def test_my_stats_rooms_and_sessions(self):
+        today = timezone.localdate()
+        room = self.create_room(admin=self.user1)
+        other_room = Room.objects.create(name='otherroom', admin=self.user)
+        other_room.members.add(self.user)
+
+        def tracked_session(room, name, hours):
+            session = Session.objects.create(name=name, room=room, started_at=timezone.now())
+            session.members.add(self.user)
+            todo = Todo.objects.create(session=session, user=self.user, task=f'{name} task')
+            TrackTodo.objects.create(todo=todo, day=today, hours=hours)
+            # one active session per room
+            Session.objects.filter(id=session.id).update(finished_at=timezone.now())
+            return session, todo
+
+        tracked_session(room, 'first', 2)
+        _, done = tracked_session(room, 'second', 5)
+        Todo.objects.filter(id=done.id).update(completed=True)
+        Session.objects.create(name='idle', room=other_room).members.add(self.user)
+        RoomRanking.objects.update_or_create(room=room, user=self.user, defaults={'rank': 2})
+        self.login()
+
+        def get(url, *args):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, *args)
+            self.assertEqual(response.status_code, 200)
+            return response, len(queries)
+
+        get(reverse_lazy('my-stats'))
+        response, queries = get(reverse_lazy('my-stats'))
+        self.assertEqual(response.context['room_labels'], ['otherroom', 'testroom'])
+        self.assertEqual(response.context['room_hours'], [0, 7])
+        self.assertEqual(response.context['top_sessions'], [
+            {'name': 'second', 'room': 'testroom', 'hours': 5, 'todos_count': 1, 'completed_todos': 1},
+            {'name': 'first', 'room': 'testroom', 'hours': 2, 'todos_count': 1, 'completed_todos': 0},
+        ])
+        self.assertContains(response, 'Room Ranking Distribution')
+        self.assertContains(response, 'Session Ranking Distribution')
+
+        data = self.client.get(reverse_lazy('my-stats-data'), {'type': 'room_performance'}).json()
+        self.assertEqual(data['rooms'], [
+            {'name': 'otherroom', 'hours': 0, 'todos_count': 0, 'completed_todos': 0,
+             'completion_rate': 0, 'current_rank': None, 'is_admin': True},
+            {'name': 'testroom', 'hours': 7, 'todos_count': 2, 'completed_todos': 1,
+             'completion_rate': 50.0, 'current_rank': 2, 'is_admin': False},
+        ])
+
+        # more rooms and sessions do not mean more queries
+        for i in range(5):
+            extra = Room.objects.create(name=f'room {i}', admin=self.user1)
+            extra.members.add(self.user)
+            tracked_session(extra, f'session {i}', 1)
+        self.assertEqual(get(reverse_lazy('my-stats'))[1], queries)
+
     def test_non_member_user_stats_availibility(self):
         room = self.create_room(admin=self.user1)
         session = self.create_session(room=room)
@@ -304,6 +569,7 @@ class NoticeViewsTest(TestCase):
         response = self.client.post(url)
         data = json.loads(response.content)
         self.assertTrue(data['success'])
+        self.assertEqual(data['marked'], 2)
 
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
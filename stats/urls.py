@@ -9,8 +9,10 @@ urlpatterns = [
     path('toggle-pin/<uuid:notice_id>/', toggle_pin, name='toggle-pin'),
     path('session/<uuid:session_id>/', SessionStats.as_view(), name='session-stats'),
     path('session/<uuid:session_id>/userstats', UserSessionStats.as_view(), name='user-session-stats'),
+    path('session/<uuid:session_id>/archive/', ArchivedSessionStats.as_view(), name='archived-session-stats'),
 
     path('notices/<uuid:room_id>', NoticesStatusView.as_view(), name='notice-actions'),
     path('notices/mark-as-read', MarkAsReadView.as_view(), name='notice-mark-as-read'),
-    path('user-stats/', UserStatsView.as_view(), name='my-stats')
+    path('user-stats/', UserStatsView.as_view(), name='my-stats'),
+    path('user-stats/data/', UserStatsAPIView.as_view(), name='my-stats-data'),
 ]
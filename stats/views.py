@@ -6,44 +6,53 @@ from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy, reverse
 from pages.mixins import MemberRequiredMixin, NotDemoUserMixin
 from django.http import HttpResponseForbidden, Http404
-from django.db.models import Sum, Count, Avg
+from django.db.models import Sum, Count
 from django.utils import timezone
+from django.utils.html import strip_tags
 from datetime import datetime, timedelta
 from collections import defaultdict, OrderedDict
 import json
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.mixins import LoginRequiredMixin
-from pages.models import Room, Session, Todo, TrackTodo, RoomRanking, SessionRanking
+from pages.models import Room, Session, Todo, TrackTodo, RoomRanking, SessionRanking, ArchivedSession
 import calendar
+from .queries import notice_counts, notice_page, notice_authors
+from .analytics import SessionMemberStats, room_performance, top_sessions, ranking_analytics
 
 
 # Create your views here.
 
-class NoticeView(LoginRequiredMixin,MemberRequiredMixin,ListView):
+class NoticeView(LoginRequiredMixin,MemberRequiredMixin,TemplateView):
     template_name = 'notices.html'
-    model = Notice
-    context_object_name = 'notices'
 
-    def get_queryset(self):
-        queryset= super().get_queryset()
-        self.room_id = self.kwargs.get("room_id")
-        queryset= queryset.filter(room__id=self.room_id)
-        return queryset
-    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        room = Room.objects.filter(id=self.room_id).first()
-        notices = context['notices']
-
+        # fetched by MemberRequiredMixin
+        room = self.room
+        if room is None:
+            raise Http404("Room not found")
+
+        counts = notice_counts(room)
+        cursor = self.request.GET.get('before')
+        try:
+            pinned, regular, next_cursor = notice_page(
+                room, cursor, pinned_count=counts['pinned_count'], user=self.request.user
+            )
+        except (ValueError, ValidationError):
+            raise Http404("Invalid page")
+
+        context.update(counts)
         context.update({
             'room': room,
-            'pinned_notices': notices.filter(is_pinned=True),
-            'regular_notices': notices.filter(is_pinned=False),
-            'pinned_count': notices.filter(is_pinned=True).count(),
-            'total_notices': notices.count(),
-            'today_notices': notices.filter(created_on__date=timezone.localdate()).count(),
-            'authors': CustomUser.objects.filter(notices__room=room).distinct()
+            # MemberRequiredMixin only lets members in
+            'is_member': True,
+            'notices': pinned + regular,
+            'pinned_notices': pinned,
+            'regular_notices': regular,
+            'cursor': cursor,
+            'next_cursor': next_cursor,
+            'authors': notice_authors(room),
         })
         return context
 
@@ -88,8 +97,9 @@ class DeleteNoticeView(LoginRequiredMixin,NotDemoUserMixin,DeleteView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['message'] = f"Do you really want to delete \"{self.get_object().title}\" notice from \"{self.get_object().room} \"?"
-        self.notice_url = reverse_lazy('room-notices', kwargs ={"room_id": self.get_object().room.id})
+        notice = self.object
+        context['message'] = f"Do you really want to delete \"{strip_tags(notice.rendered_title)}\" notice from \"{notice.room} \"?"
+        self.notice_url = reverse_lazy('room-notices', kwargs ={"room_id": notice.room.id})
         context['referer'] = self.notice_url
         return context
     
@@ -116,6 +126,15 @@ class SessionStats(LoginRequiredMixin,MemberRequiredMixin,DetailView):
     context_object_name = 'session'
     template_name = 'session/stats.html'
 
+    def get(self, request, *args, **kwargs):
+        try:
+            return super().get(request, *args, **kwargs)
+        except Http404:
+            # the session may have been moved to the archive
+            if ArchivedSession.objects.filter(id=kwargs['session_id']).exists():
+                return redirect('archived-session-stats', session_id=kwargs['session_id'])
+            raise
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         session = self.get_object()
@@ -154,7 +173,7 @@ class SessionStats(LoginRequiredMixin,MemberRequiredMixin,DetailView):
     def get_date_range(self, session):
         """Get complete date range for the session"""
         # Get the earliest and latest dates from TrackTodo entries
-        tracktodos = TrackTodo.objects.filter(todo__session=session)
+        tracktodos = TrackTodo.objects.for_session(session)
         
         if not tracktodos.exists():
             # If no data, use session start/end dates or current date
@@ -226,7 +245,7 @@ class SessionStats(LoginRequiredMixin,MemberRequiredMixin,DetailView):
 
     def get_daily_total_hours_data(self, session):
         """Get cumulative daily hours with all dates included"""
-        tracktodos = TrackTodo.objects.filter(todo__session=session).order_by('day')
+        tracktodos = TrackTodo.objects.for_session(session).order_by('day')
         
         # Get date range
         started_at, end_date = self.get_date_range(session)
@@ -254,7 +273,7 @@ class SessionStats(LoginRequiredMixin,MemberRequiredMixin,DetailView):
     
     def get_daily_hours_data(self, session):
         """Get daily hours with all dates included"""
-        tracktodos = TrackTodo.objects.filter(todo__session=session).order_by('day')
+        tracktodos = TrackTodo.objects.for_session(session).order_by('day')
         
         # Get date range
         started_at, end_date = self.get_date_range(session)
@@ -349,7 +368,7 @@ class SessionStats(LoginRequiredMixin,MemberRequiredMixin,DetailView):
 
     def get_timeline_data(self, session):
         """Get timeline data with all dates included"""
-        tracktodos = TrackTodo.objects.filter(todo__session=session).select_related('todo__user')
+        tracktodos = TrackTodo.objects.for_session(session).select_related('user')
         
         # Get date range
         started_at, end_date = self.get_date_range(session)
@@ -360,7 +379,7 @@ class SessionStats(LoginRequiredMixin,MemberRequiredMixin,DetailView):
         users = set()
 
         for item in tracktodos:
-            user = item.todo.user
+            user = item.user
             day = item.day
             users.add(user)
             user_day_hours[user][day] += item.hours
@@ -389,7 +408,7 @@ class SessionStats(LoginRequiredMixin,MemberRequiredMixin,DetailView):
     
     def get_individual_timeline_data(self, session):
         """Get individual timeline data with all dates included"""
-        tracktodos = TrackTodo.objects.filter(todo__session=session).select_related('todo__user')
+        tracktodos = TrackTodo.objects.for_session(session).select_related('user')
         
         # Get date range
         started_at, end_date = self.get_date_range(session)
@@ -400,7 +419,7 @@ class SessionStats(LoginRequiredMixin,MemberRequiredMixin,DetailView):
         users = set()
 
         for item in tracktodos:
-            user = item.todo.user
+            user = item.user
             day = item.day
             users.add(user)
             user_day_hours[user][day] += item.hours
@@ -485,9 +504,17 @@ class UserSessionStats(LoginRequiredMixin, MemberRequiredMixin, DetailView):
     context_object_name = 'session'
     template_name = 'session/user_stats.html'
 
+    def get(self, request, *args, **kwargs):
+        try:
+            return super().get(request, *args, **kwargs)
+        except Http404:
+            if ArchivedSession.objects.filter(id=kwargs['session_id']).exists():
+                return redirect('archived-session-stats', session_id=kwargs['session_id'])
+            raise
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        session = self.get_object()
+        session = self.object
         
         # Get user from URL parameter or current user
         user_id = self.kwargs.get('user_id')
@@ -498,21 +525,24 @@ class UserSessionStats(LoginRequiredMixin, MemberRequiredMixin, DetailView):
                 raise Http404("User not found")
         else:
             user = self.request.user
+
+        # everything below is derived from the few queries the engine runs
+        stats = SessionMemberStats(session, user)
         
         # Verify user is a member of this session
-        if not session.members.filter(id=user.id).exists():
+        if not stats.is_member:
             raise Http404("User is not a member of this session")
         
         context['target_user'] = user
         
         # Basic user session info
-        context['user_session_stats'] = self.get_user_session_basic_stats(session, user)
+        context['user_session_stats'] = stats.basic_stats()
         
         # Chart data for this user
-        daily_hours_data = self.get_user_daily_hours_data(session, user)
-        daily_cumulative_data = self.get_user_daily_cumulative_hours_data(session, user)
-        user_tasks_data = self.get_user_tasks_data(session, user)
-        comparison_data = self.get_user_comparison_data(session, user)
+        daily_hours_data = stats.daily_hours()
+        daily_cumulative_data = stats.daily_cumulative_hours()
+        user_tasks_data = stats.tasks()
+        comparison_data = stats.comparison()
         
         # Serialize data for JavaScript
         context['daily_hours_json'] = json.dumps(daily_hours_data, cls=DjangoJSONEncoder)
@@ -527,279 +557,60 @@ class UserSessionStats(LoginRequiredMixin, MemberRequiredMixin, DetailView):
         context['comparison_data'] = comparison_data
         
         # User summary statistics
-        context['user_summary_stats'] = self.get_user_summary_stats(session, user)
+        context['user_summary_stats'] = stats.summary()
         
         return context
 
-    def get_user_date_range(self, session, user):
-        """Get complete date range for the user in this session"""
-        # Get the earliest and latest dates from user's TrackTodo entries
-        user_tracktodos = TrackTodo.objects.filter(todo__session=session, todo__user=user)
-        
-        if not user_tracktodos.exists():
-            # If no data, use session start/end dates or current date
-            if hasattr(session.started_at, 'date'):
-                started_at = session.started_at.date() if session.started_at else timezone.now().date()
-            else:
-                started_at = session.started_at if session.started_at else timezone.now().date()
-            
-            if hasattr(session.finished_at, 'date'):
-                end_date = session.finished_at.date() if session.finished_at else timezone.now().date()
-            else:
-                end_date = session.finished_at if session.finished_at else timezone.now().date()
-            
-            return started_at, end_date
-        
-        dates = user_tracktodos.values_list('day', flat=True)
-        started_at = min(dates)
-        end_date = max(dates)
-        
-        # Extend to session boundaries if available
-        session_start = session.started_at
-        session_end = session.finished_at
-        
-        if session_start:
-            if hasattr(session_start, 'date'):
-                session_start = session_start.date()
-            if session_start < started_at:
-                started_at = session_start
-                
-        if session_end:
-            if hasattr(session_end, 'date'):
-                session_end = session_end.date()
-            if session_end > end_date:
-                end_date = session_end
-            
-        return started_at, end_date
-
-    def generate_date_range(self, started_at, end_date):
-        """Generate all dates between start and end date"""
-        dates = []
-        current_date = started_at
-        while current_date <= end_date:
-            dates.append(current_date)
-            current_date += timedelta(days=1)
-        return dates
-
-    def get_user_session_basic_stats(self, session, user):
-        """Get basic session information for a specific user"""
-        user_todos = session.todos.filter(user=user)
-        user_total_hours = sum([todo.total_hours for todo in user_todos])
-        user_active_tasks = user_todos.filter(completed=False).count()
-        user_completed_tasks = user_todos.filter(completed=True).count()
-        user_total_tasks = user_todos.count()
-        
-        # Get user's rank in session
-        rankings = session.current_rankings
-        user_rank = None
-        for i, (ranked_user, hours) in enumerate(rankings, 1):
-            if ranked_user.id == user.id:
-                user_rank = i
-                break
-        
-        return {
-            'session_name': session.name,
-            'user_name': user.username,
-            'user_total_hours': round(user_total_hours, 1),
-            'user_active_tasks': user_active_tasks,
-            'user_completed_tasks': user_completed_tasks,
-            'user_total_tasks': user_total_tasks,
-            'user_rank': user_rank,
-            'total_members': session.members.count(),
-            'session_status': 'Active' if session.is_active else 'Completed',
-            'started_at': session.started_at,
-            'finished_at': session.finished_at
-        }
-
-    def get_user_daily_hours_data(self, session, user):
-        """Get daily hours data for a specific user with all dates included"""
-        user_tracktodos = TrackTodo.objects.filter(
-            todo__session=session, 
-            todo__user=user
-        ).order_by('day')
-
-        # Get date range
-        started_at, end_date = self.get_user_date_range(session, user)
-        all_dates = self.generate_date_range(started_at, end_date)
-
-        # Build hours data
-        hours_data = defaultdict(float)
-        for item in user_tracktodos:
-            hours_data[item.day] += item.hours
-
-        # Build complete data with all dates
-        labels = []
-        data = []
-
-        for day in all_dates:
-            labels.append(day)
-            data.append(hours_data.get(day, 0))  # Use 0 if no data for this day
-
-        return {
-            'labels': labels,
-            'data': data
-        }
-
-    def get_user_daily_cumulative_hours_data(self, session, user):
-        """Get cumulative daily hours data for a specific user with all dates included"""
-        user_tracktodos = TrackTodo.objects.filter(
-            todo__session=session, 
-            todo__user=user
-        ).order_by('day')
-
-        # Get date range
-        started_at, end_date = self.get_user_date_range(session, user)
-        all_dates = self.generate_date_range(started_at, end_date)
-
-        # Build hours data
-        hours_data = defaultdict(float)
-        for item in user_tracktodos:
-            hours_data[item.day] += item.hours
-
-        # Build complete data with all dates
-        labels = []
-        data = []
-        cumulative = 0
 
-        for day in all_dates:
-            cumulative += hours_data.get(day, 0)  # Use 0 if no data for this day
-            labels.append(day)
-            data.append(cumulative)
 
-        return {
-            'labels': labels,
-            'data': data
-        }
 
-    def get_user_tasks_data(self, session, user):
-        """Get user's tasks data for bar chart"""
-        user_todos = session.todos.filter(user=user)
-        
-        tasks_with_hours = []
-        for todo in user_todos:
-            total_hours = todo.total_hours
-            if total_hours > 0:
-                # Truncate task name if too long
-                task_name = todo.task[:30] + "..." if len(todo.task) > 30 else todo.task
-                tasks_with_hours.append({
-                    'task': task_name,
-                    'hours': total_hours,
-                    'completed': todo.completed
-                })
-
-        # Sort by hours and get all tasks (or limit to top 15)
-        tasks_with_hours.sort(key=lambda x: x['hours'], reverse=True)
-        user_tasks = tasks_with_hours[:15]  # Limit to top 15 tasks
+class ArchivedSessionStats(LoginRequiredMixin, DetailView):
+    """read only stats of an archived session, built from its compressed payload"""
+    model = ArchivedSession
+    pk_url_kwarg = 'session_id'
+    context_object_name = 'session'
+    template_name = 'session/archived_stats.html'
 
-        if not user_tasks:
-            user_tasks = [
-                {'task': 'No tasks yet', 'hours': 0, 'completed': False}
-            ]
+    def get_object(self, queryset=None):
+        session = super().get_object(queryset)
+        if not session.room.members.filter(id=self.request.user.id).exists():
+            raise PermissionDenied
+        return session
 
-        return {
-            'labels': [task['task'] for task in user_tasks],
-            'data': [task['hours'] for task in user_tasks],
-            'completed': [task['completed'] for task in user_tasks]
-        }
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        session = self.object
+        data = session.data
+
+        usernames = {member['id']: member['username'] for member in data['members']}
+        context['rankings'] = [
+            {'rank': rank, 'username': usernames.get(int(user_id), 'deleted user'), 'total_hours': hours}
+            for rank, (user_id, hours) in enumerate(
+                sorted(session.totals.items(), key=lambda item: item[1], reverse=True), 1
+            )
+        ]
 
-    def get_user_comparison_data(self, session, user):
-        """Get comparison data between user and session average/top performers"""
-        # Get user's total hours
-        user_total_hours = sum([todo.total_hours for todo in session.todos.filter(user=user)])
-        
-        # Get session statistics
-        session_total_hours = sum(session.total_hours.values()) if session.total_hours else 0
-        total_members = session.members.count()
-        session_average = (session_total_hours / total_members) if total_members > 0 else 0
-        
-        # Get top performer hours
-        rankings = session.current_rankings
-        top_performer_hours = rankings[0][1] if rankings else 0
-        
-        return {
-            'labels': ['You', 'Session Average', 'Top Performer'],
-            'data': [
-                round(user_total_hours, 1),
-                round(session_average, 1),
-                round(top_performer_hours, 1)
+        daily_hours = defaultdict(float)
+        task_hours = defaultdict(float)
+        for todo_id, _, day, hours in data['tracking']:
+            daily_hours[day] += hours
+            task_hours[todo_id] += hours
+        context['daily_hours'] = sorted(daily_hours.items())
+
+        context['todos'] = sorted(
+            [
+                {
+                    'task': todo['task'],
+                    'username': usernames.get(todo['user_id'], 'deleted user'),
+                    'completed': todo['completed'],
+                    'total_hours': task_hours.get(str(todo['id']), 0),
+                }
+                for todo in data['todos']
             ],
-            'colors': ['#36A2EB', '#FFCE56', '#FF6384']
-        }
-
-    def get_user_summary_stats(self, session, user):
-        """Get additional summary statistics for the user"""
-        user_todos = session.todos.filter(user=user)
-        user_total_hours = sum([todo.total_hours for todo in user_todos])
-        
-        # User's daily average
-        daily_data = self.get_user_daily_hours_data(session, user)
-        active_days = len([d for d in daily_data['data'] if d > 0]) or 1
-        user_daily_avg = user_total_hours / active_days if active_days > 0 else 0
-        
-        # User's most productive day
-        daily_hours = daily_data['data']
-        if daily_hours and max(daily_hours) > 0:
-            max_day_index = daily_hours.index(max(daily_hours))
-            best_day_date = daily_data['labels'][max_day_index]
-            best_day = best_day_date.strftime('%A')
-            best_day_hours = max(daily_hours)
-        else:
-            best_day = 'N/A'
-            best_day_hours = 0
-        
-        # User's completion rate
-        total_user_tasks = user_todos.count()
-        completed_user_tasks = user_todos.filter(completed=True).count()
-        user_completion_rate = (completed_user_tasks / total_user_tasks * 100) if total_user_tasks > 0 else 0
-        
-        # User's longest streak
-        user_longest_streak = self.calculate_longest_streak(daily_data['data'])
-        
-        # Comparison with session average
-        session_total_hours = sum(session.total_hours.values()) if session.total_hours else 0
-        total_members = session.members.count()
-        session_average = (session_total_hours / total_members) if total_members > 0 else 0
-        above_average = user_total_hours > session_average
-        
-        # Get user's rank
-        rankings = session.current_rankings
-        user_rank = None
-        for i, (ranked_user, hours) in enumerate(rankings, 1):
-            if ranked_user.id == user.id:
-                user_rank = i
-                break
-        
-        return {
-            'user_daily_avg': round(user_daily_avg, 1),
-            'best_day': best_day,
-            'best_day_hours': round(best_day_hours, 1),
-            'user_completion_rate': round(user_completion_rate),
-            'user_longest_streak': user_longest_streak,
-            'active_days': active_days,
-            'above_average': above_average,
-            'session_average': round(session_average, 1),
-            'user_rank': user_rank,
-            'total_members': total_members
-        }
-
-    def calculate_longest_streak(self, daily_hours):
-        """Calculate the longest consecutive streak of days with activity"""
-        if not daily_hours:
-            return 0
-        
-        max_streak = 0
-        current_streak = 0
-        
-        for hours in daily_hours:
-            if hours > 0:
-                current_streak += 1
-                max_streak = max(max_streak, current_streak)
-            else:
-                current_streak = 0
-        
-        return max_streak
-    
-
+            key=lambda todo: todo['total_hours'], reverse=True
+        )
+        context['total_hours'] = sum(session.totals.values())
+        return context
 
 
 class UserStatsView(LoginRequiredMixin, TemplateView):
@@ -835,8 +646,8 @@ class UserStatsView(LoginRequiredMixin, TemplateView):
         completed_todos = Todo.objects.filter(user=user, completed=True).count()
         active_todos = total_todos - completed_todos
         
-        total_hours = TrackTodo.objects.filter(todo__user=user).aggregate(
-            total=Sum('hours'))['total'] or 0
+        # archived sessions included
+        total_hours = user.total_hours
         
         rooms_count = user.members_rooms.count()
         sessions_count = user.sessions.count()
@@ -858,137 +669,85 @@ class UserStatsView(LoginRequiredMixin, TemplateView):
     def get_time_analytics(self, user):
         """Get time-based analytics for charts"""
         now = timezone.now()
-        
-        # Last 30 days daily hours
-        daily_hours = []
-        daily_labels = []
-        for i in range(29, -1, -1):
-            day = now.date() - timedelta(days=i)
-            hours = TrackTodo.objects.filter(
-                todo__user=user,
-                day=day
-            ).aggregate(total=Sum('hours'))['total'] or 0
-            
-            daily_hours.append(round(hours, 2))
-            daily_labels.append(day.strftime('%m/%d'))
-        
-        # Last 12 months monthly hours
-        monthly_hours = []
-        monthly_labels = []
+        today = now.date()
+
+        # Last 30 days
+        days = [today - timedelta(days=i) for i in range(29, -1, -1)]
+
+        # Last 12 months, (start, end) of each month
+        months = []
         for i in range(11, -1, -1):
-            month_date = now.date().replace(day=1) - timedelta(days=i*30)
+            month_date = today.replace(day=1) - timedelta(days=i*30)
             # Get actual month start and end
             month_start = month_date.replace(day=1)
             if month_start.month == 12:
                 month_end = month_start.replace(year=month_start.year + 1, month=1, day=1) - timedelta(days=1)
             else:
                 month_end = month_start.replace(month=month_start.month + 1, day=1) - timedelta(days=1)
-            
-            hours = TrackTodo.objects.filter(
-                todo__user=user,
-                day__range=[month_start, month_end]
-            ).aggregate(total=Sum('hours'))['total'] or 0
-            
-            monthly_hours.append(round(hours, 2))
-            monthly_labels.append(month_start.strftime('%b %Y'))
-        
-        # Weekly hours (last 8 weeks)
-        weekly_hours = []
-        weekly_labels = []
+            months.append((month_start, month_end))
+
+        # Last 8 weeks, (start, end) of each week
+        weeks = []
         for i in range(7, -1, -1):
-            week_start = now.date() - timedelta(days=now.weekday() + i*7)
-            week_end = week_start + timedelta(days=6)
-            
-            hours = TrackTodo.objects.filter(
-                todo__user=user,
-                day__range=[week_start, week_end]
-            ).aggregate(total=Sum('hours'))['total'] or 0
-            
-            weekly_hours.append(round(hours, 2))
-            weekly_labels.append(f"Week of {week_start.strftime('%m/%d')}")
-        
+            week_start = today - timedelta(days=now.weekday() + i*7)
+            weeks.append((week_start, week_start + timedelta(days=6)))
+
+        # one date bounded query for the whole window, the buckets are summed in python
+        window_start = min(days[0], months[0][0], weeks[0][0])
+        window_end = max(days[-1], months[-1][1], weeks[-1][1])
+        hours_by_day = dict(
+            TrackTodo.objects.filter(user=user).between(window_start, window_end)
+            .values_list('day').annotate(total=Sum('hours'))
+        )
+
+        def hours_between(start, end):
+            return sum(hours for day, hours in hours_by_day.items() if start <= day <= end)
+
         return {
-            'daily_hours': daily_hours,
-            'daily_labels': daily_labels,
-            'monthly_hours': monthly_hours,
-            'monthly_labels': monthly_labels,
-            'weekly_hours': weekly_hours,
-            'weekly_labels': weekly_labels,
+            'daily_hours': [round(hours_by_day.get(day, 0), 2) for day in days],
+            'daily_labels': [day.strftime('%m/%d') for day in days],
+            'monthly_hours': [round(hours_between(start, end), 2) for start, end in months],
+            'monthly_labels': [start.strftime('%b %Y') for start, _ in months],
+            'weekly_hours': [round(hours_between(start, end), 2) for start, end in weeks],
+            'weekly_labels': [f"Week of {start.strftime('%m/%d')}" for start, _ in weeks],
         }
     
     def get_room_session_analytics(self, user):
         """Get room and session performance analytics"""
-        # Hours per room
-        rooms = user.members_rooms.all()
-        room_hours = []
-        room_labels = []
-        
-        for room in rooms:
-            hours = TrackTodo.objects.filter(
-                todo__user=user,
-                todo__session__room=room
-            ).aggregate(total=Sum('hours'))['total'] or 0
-            
-            room_hours.append(round(hours, 2))
-            room_labels.append(room.name)
-        
-        # Hours per session (top 10)
-        sessions = user.sessions.all()
-        session_data = []
-        
-        for session in sessions:
-            hours = TrackTodo.objects.filter(
-                todo__user=user,
-                todo__session=session
-            ).aggregate(total=Sum('hours'))['total'] or 0
-            
-            if hours > 0:
-                session_data.append({
-                    'name': session.name,
-                    'room': session.room.name,
-                    'hours': round(hours, 2),
-                    'todos_count': Todo.objects.filter(user=user, session=session).count(),
-                    'completed_todos': Todo.objects.filter(user=user, session=session, completed=True).count()
-                })
-        
-        # Sort by hours and take top 10
-        session_data = sorted(session_data, key=lambda x: x['hours'], reverse=True)[:10]
+        # one grouped query per rooms and per sessions, the top 10 is selected in the database
+        rooms = room_performance(user)
+        session_data = [
+            {
+                'name': session.name,
+                'room': session.room.name,
+                'hours': round(session.hours, 2),
+                'todos_count': session.todos_count,
+                'completed_todos': session.completed_todos,
+            }
+            for session in top_sessions(user, 10)
+        ]
         
         return {
-            'room_hours': room_hours,
-            'room_labels': room_labels,
+            'room_hours': [round(room.hours, 2) for room in rooms],
+            'room_labels': [room.name for room in rooms],
             'top_sessions': session_data,
         }
     
     def get_ranking_analytics(self, user):
         """Get ranking performance across rooms and sessions"""
-        room_rankings = RoomRanking.objects.filter(user=user).select_related('room')
-        session_rankings = SessionRanking.objects.filter(user=user).select_related('session')
-        
-        # Average ranks
-        avg_room_rank = room_rankings.aggregate(avg=Avg('rank'))['avg'] or 0
-        avg_session_rank = session_rankings.aggregate(avg=Avg('rank'))['avg'] or 0
-        
-        # Top performances (rank 1-3)
-        top_room_performances = room_rankings.filter(rank__lte=3).order_by('rank')
-        top_session_performances = session_rankings.filter(rank__lte=3).order_by('rank')
-        
-        # Ranking distribution
-        room_rank_distribution = {
-            'rank_1': room_rankings.filter(rank=1).count(),
-            'rank_2_3': room_rankings.filter(rank__in=[2, 3]).count(),
-            'rank_4_10': room_rankings.filter(rank__range=[4, 10]).count(),
-            'rank_10_plus': room_rankings.filter(rank__gt=10).count(),
-        }
+        # one conditional aggregate per ranking table
+        rankings = ranking_analytics(user)
+        rooms, sessions = rankings['rooms'], rankings['sessions']
         
         return {
-            'avg_room_rank': round(avg_room_rank, 1),
-            'avg_session_rank': round(avg_session_rank, 1),
-            'top_room_performances': top_room_performances,
-            'top_session_performances': top_session_performances,
-            'room_rank_distribution': room_rank_distribution,
-            'total_room_rankings': room_rankings.count(),
-            'total_session_rankings': session_rankings.count(),
+            'avg_room_rank': rooms['average'],
+            'avg_session_rank': sessions['average'],
+            'top_room_performances': rooms['top'],
+            'top_session_performances': sessions['top'],
+            'room_rank_distribution': rooms['distribution'],
+            'session_rank_distribution': sessions['distribution'],
+            'total_room_rankings': rooms['total'],
+            'total_session_rankings': sessions['total'],
         }
     
     def get_productivity_patterns(self, user):
@@ -997,9 +756,9 @@ class UserStatsView(LoginRequiredMixin, TemplateView):
         hourly_hours = defaultdict(float)
         
         tracks = TrackTodo.objects.filter(
-            todo__user=user,
+            user=user,
             added_on_time__isnull=False
-        ).select_related('todo')
+        )
         
         for track in tracks:
             # Estimate work end time based on added_on_time
@@ -1021,7 +780,7 @@ class UserStatsView(LoginRequiredMixin, TemplateView):
         
         # Day of week analysis
         weekday_hours = defaultdict(float)
-        tracks = TrackTodo.objects.filter(todo__user=user)
+        tracks = TrackTodo.objects.filter(user=user)
         
         for track in tracks:
             weekday = track.day.weekday()  # 0=Monday, 6=Sunday
@@ -1054,8 +813,8 @@ class UserStatsView(LoginRequiredMixin, TemplateView):
         
         # Recent time tracks
         recent_tracks = TrackTodo.objects.filter(
-            todo__user=user
-        ).select_related('todo', 'todo__session').order_by('-day', '-added_on_time')[:10]
+            user=user
+        ).select_related('todo', 'session').order_by('-day', '-added_on_time')[:10]
         
         # Calculate current streak
         current_date = timezone.now().date()
@@ -1063,7 +822,7 @@ class UserStatsView(LoginRequiredMixin, TemplateView):
         
         while True:
             day_has_activity = TrackTodo.objects.filter(
-                todo__user=user,
+                user=user,
                 day=current_date,
                 hours__gt=0
             ).exists()
@@ -1077,7 +836,7 @@ class UserStatsView(LoginRequiredMixin, TemplateView):
         # Calculate longest streak
         all_active_days = set(
             TrackTodo.objects.filter(
-                todo__user=user,
+                user=user,
                 hours__gt=0
             ).values_list('day', flat=True)
         )
@@ -1129,65 +888,46 @@ class UserStatsAPIView(LoginRequiredMixin, TemplateView):
             # Return room performance data
             room_data = self.get_room_performance(user)
             return JsonResponse(room_data)
+
+        elif data_type == 'rankings':
+            # Return rank distributions and top performances
+            return JsonResponse(ranking_analytics(user))
         
         # Add more data types as needed
         return JsonResponse({'error': 'Invalid data type'})
     
     def get_daily_hours(self, user, days=30):
         """Get daily hours for specified number of days"""
-        now = timezone.now()
+        today = timezone.now().date()
+        start = today - timedelta(days=days-1)
+        hours_by_day = dict(
+            TrackTodo.objects.filter(user=user).between(start, today)
+            .values_list('day').annotate(total=Sum('hours'))
+        )
+
         daily_hours = []
-        
         for i in range(days-1, -1, -1):
-            day = now.date() - timedelta(days=i)
-            hours = TrackTodo.objects.filter(
-                todo__user=user,
-                day=day
-            ).aggregate(total=Sum('hours'))['total'] or 0
-            
+            day = today - timedelta(days=i)
             daily_hours.append({
                 'date': day.strftime('%Y-%m-%d'),
-                'hours': round(hours, 2)
+                'hours': round(hours_by_day.get(day, 0), 2)
             })
         
         return {'daily_hours': daily_hours}
     
     def get_room_performance(self, user):
         """Get performance data per room"""
-        rooms = user.members_rooms.all()
         room_data = []
         
-        for room in rooms:
-            hours = TrackTodo.objects.filter(
-                todo__user=user,
-                todo__session__room=room
-            ).aggregate(total=Sum('hours'))['total'] or 0
-            
-            todos_count = Todo.objects.filter(
-                user=user,
-                session__room=room
-            ).count()
-            
-            completed_todos = Todo.objects.filter(
-                user=user,
-                session__room=room,
-                completed=True
-            ).count()
-            
-            # Get current ranking in room
-            ranking = RoomRanking.objects.filter(
-                room=room,
-                user=user
-            ).first()
-            
+        for room in room_performance(user):
             room_data.append({
                 'name': room.name,
-                'hours': round(hours, 2),
-                'todos_count': todos_count,
-                'completed_todos': completed_todos,
-                'completion_rate': round((completed_todos/todos_count*100) if todos_count > 0 else 0, 1),
-                'current_rank': ranking.rank if ranking else None,
-                'is_admin': room.admin == user
+                'hours': round(room.hours, 2),
+                'todos_count': room.todos_count,
+                'completed_todos': room.completed_todos,
+                'completion_rate': round((room.completed_todos/room.todos_count*100) if room.todos_count > 0 else 0, 1),
+                'current_rank': room.current_rank,
+                'is_admin': room.admin_id == user.id
             })
         
-        return {'rooms': room_data}
\ No newline at end of file
+        return {'rooms': room_data}